@@ -1,54 +1,136 @@
 import sys
 import re
 import os
-import fitz  # PyMuPDF per i PDF
-import docx  # python-docx per i file Word
+import argparse
 import multiprocessing
 import csv
-import datetime
 import time
-from transformers import BertTokenizer, BertModel
-import torch
+import datetime
+import hashlib
+import json
+import contextlib
+import importlib
+import queue
+import threading
+from multiprocessing import shared_memory
+import numpy as np
+from analysis_service import DEFAULT_SERVICE_PORT, run_in_service
+from embedding_store import EmbeddingStore
+from readers import DEFAULT_TEXT_CACHE_DIR, DEFAULT_TEXT_CACHE_SIZE_MB, configure_text_cache, iter_book, read_book, read_ranges
 
 PAGE_SIZE = 3300  # Deve essere lo stesso della GUI
 DEFAULT_CHAPTER_LENGTH = 12  # Se nessun capitolo viene trovato
+MAX_LENGTH = 512  # Lunghezza massima di una sequenza per BERT (token speciali inclusi)
+WINDOW_STRIDE = 128  # Token in comune tra due finestre consecutive
+DEFAULT_BATCH_SIZE = 8  # Finestre elaborate insieme in un singolo forward pass
+EMBEDDING_MODES = ("chunked", "truncate")  # chunked: tutto il capitolo, truncate: solo i primi 512 token
+# shared: modello caricato una volta e condiviso con i processi del Pool
+# single: un solo processo che elabora i capitoli in sequenza
+# per-worker: ogni processo del Pool carica la propria copia (vecchio comportamento)
+EXECUTION_MODES = ("shared", "single", "per-worker")
+SEGMENTATION_MODES = ("lines", "legacy")  # lines: intestazioni a inizio riga; legacy: regole originali
+BACKENDS = ("fp32", "int8", "bf16")  # int8: quantizzazione dinamica dei Linear; bf16: autocast su CPU
+THREAD_EFFICIENCY = 0.75  # Accelerazione di un forward pass con t thread, stimata come t ** 0.75
+STREAM_EXTRACTION_SHARE = 4  # Con --stream su un PDF, un core fisico ogni 4 resta all'estrazione del testo
+DEFAULT_CACHE_DIR = os.path.join("cache", "embeddings")  # Relativa alla cartella di lavoro, come "analyses"
+DEFAULT_CACHE_SIZE_MB = 512
+SUPPORTED_EXTENSIONS = (".txt", ".pdf", ".docx")
+PROGRESS_PREFIX = "PROGRESS "  # Righe di avanzamento in JSON lette dalla GUI (opzione --progress)
+TOKENIZE_BLOCK_CHARS = 16384  # Caratteri tokenizzati per volta dal thread di tokenizzazione
+TOKEN_QUEUE_BLOCKS = 4  # Blocchi di token pronti in anticipo sull'inferenza (coda limitata)
+WRITE_QUEUE_RESULTS = 16  # Capitoli analizzati in attesa dello stadio di scrittura
+BATCH_GROUP_CHARS = 64 * 2**20  # Caratteri di testo letti da --batch prima di analizzare il gruppo di libri
+PROFILERS = ("cprofile", "torch")  # cprofile: funzioni Python; torch: operatori di torch.profiler
+PROFILE_ROWS = 15  # Righe dei rapporti dei profiler stampati a fine esecuzione
 
-# Caricare il modello pre-addestrato
+# Modello pre-addestrato, caricato solo quando serve (vedi load_model)
 MODEL_NAME = "dbmdz/bert-base-italian-xxl-cased"
-tokenizer = BertTokenizer.from_pretrained(MODEL_NAME)
-model = BertModel.from_pretrained(MODEL_NAME)
-
-# -------------------- FUNZIONI DI LETTURA --------------------
-
-def read_txt(file_path):
-    # Legge un file di testo e lo divide in pagine.
-    with open(file_path, 'r', encoding='utf-8') as f:
-        text = f.read()
-    return text
-
-def read_pdf(file_path):
-    # Legge un file PDF ed estrae il testo.
-    doc = fitz.open(file_path)
-    text = "\n".join([page.get_text() for page in doc])
-    return text
-
-def read_docx(file_path):
-    # Legge un file Word (.docx) ed estrae il testo.
-    doc = docx.Document(file_path)
-    text = "\n".join([para.text for para in doc.paragraphs])
-    return text
-
-def read_book(file_path):
-    ext = os.path.splitext(file_path)[1].lower()
-    if ext == ".txt":
-        return read_txt(file_path)
-    elif ext == ".pdf":
-        return read_pdf(file_path)
-    elif ext == ".docx":
-        return read_docx(file_path)
-    else:
-        print("Errore: formato file non supportato.")
-        sys.exit(4)
+# torch e transformers vengono importati da load_libraries: la validazione degli argomenti
+# e la ricerca dei capitoli non li richiedono
+torch = None
+BertTokenizer = BertTokenizerFast = BertModel = None
+tokenizer = None
+model = None
+model_backend = None  # Backend con cui è stato caricato model
+backend = "fp32"  # Backend effettivo di questo processo (vedi select_backend)
+
+# -------------------- CARICAMENTO DEL MODELLO --------------------
+
+def load_libraries():
+    # Importa torch e le classi BERT alla prima necessità (modello, Pool o impostazione dei thread).
+    # Chiamata prima di creare il Pool, evita che ogni processo ripeta l'importazione.
+    global torch, BertTokenizer, BertTokenizerFast, BertModel
+    if torch is None:
+        # Il parallelismo interno del tokenizer veloce è disattivato: la tokenizzazione ha già il suo
+        # thread (vedi pipelined_embedding) e i processi del Pool si dividono i core
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+        torch = importlib.import_module("torch")
+        importlib.import_module("torch.multiprocessing")  # Registra la condivisione dei tensori tra processi
+        from transformers import BertTokenizer, BertTokenizerFast, BertModel
+    return torch
+
+def bf16_supported():
+    # L'autocast bfloat16 conviene solo se la CPU ha istruzioni bf16 native (AVX512-BF16 o AMX).
+    load_libraries()
+    try:
+        return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except (AttributeError, RuntimeError):
+        return False
+
+def select_backend(requested):
+    # Imposta il backend di inferenza; bf16 ripiega su fp32 se la CPU non lo supporta.
+    global backend
+    backend = requested
+    if requested == "bf16" and not bf16_supported():
+        print("Avviso: la CPU non supporta bfloat16, uso fp32")
+        backend = "fp32"
+    return backend
+
+def load_model():
+    # Carica tokenizer e modello una sola volta per processo (di nuovo solo se cambia il backend).
+    global tokenizer, model, model_backend
+    if model is None or model_backend != backend:
+        start_time = time.perf_counter()
+        load_libraries()
+        # Tokenizer in Rust: rilascia il GIL, così la tokenizzazione procede insieme all'inferenza
+        tokenizer = BertTokenizerFast.from_pretrained(MODEL_NAME)
+        model = BertModel.from_pretrained(MODEL_NAME)
+        model.eval()
+        if backend == "int8":
+            # Pesi dei Linear in int8, attivazioni quantizzate al volo: embedding e LayerNorm restano fp32
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        model_backend = backend
+        print(f"Modello caricato in {time.perf_counter() - start_time:.2f} s (backend {backend}, processo {os.getpid()})", flush=True)
+    return tokenizer, model
+
+def inference_context():
+    # Contesto del forward pass: con bf16 le operazioni che lo consentono girano in bfloat16.
+    if backend == "bf16":
+        return torch.autocast("cpu", dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+def place_worker(threads, core_groups, next_slot):
+    # Limita i thread di torch del processo e, se richiesto, lo vincola al proprio gruppo di core.
+    # next_slot è un contatore condiviso: ogni processo del Pool prende il gruppo successivo.
+    load_libraries().set_num_threads(threads)
+    if core_groups:
+        with next_slot.get_lock():
+            slot = next_slot.value
+            next_slot.value += 1
+        os.sched_setaffinity(0, core_groups[slot % len(core_groups)])
+
+def init_shared_worker(shared_tokenizer, shared_model, selected_backend, placement):
+    # Il processo del Pool usa i pesi già caricati dal processo principale (memoria condivisa).
+    global tokenizer, model, backend
+    tokenizer, model, backend = shared_tokenizer, shared_model, selected_backend
+    place_worker(*placement)
+
+def init_private_worker(selected_backend, placement):
+    # Il processo del Pool carica una propria copia del modello.
+    global backend
+    backend = selected_backend
+    place_worker(*placement)
+    load_model()
 
 # -------------------- FUNZIONI PER TROVARE I CAPITOLI --------------------
 
@@ -60,11 +142,13 @@ def find_index_section(text):
         return {int(num): int(matches[0][1]) for _, num in matches}
     return None
 
+CHAPTER_PATTERN = re.compile(r'\b(?:Capitolo|Chapter)\s+(\d+)\b', re.IGNORECASE)
+
 def find_chapters(text):
     # Cerca i capitoli nel testo usando pattern comuni.
     print("Indice non trovato, cerco i capitoli...")
     chapters = {}
-    for match in re.finditer(r'\b(?:Capitolo|Chapter)\s+(\d+)\b', text, re.IGNORECASE):
+    for match in CHAPTER_PATTERN.finditer(text):
         chapter_num = int(match.group(1))
         start_byte = match.start()
         chapters[chapter_num] = start_byte
@@ -79,62 +163,1085 @@ def divide_by_fixed_length(text):
         chapters[chapter_num] = i
     return chapters
 
+def chapter_ranges(chapters, text_length):
+    # Intervalli [inizio, fine) di ogni capitolo, nello stesso ordine usato per l'analisi.
+    chapter_list = sorted(chapters.items())
+    ranges = {}
+    for i in range(len(chapter_list)):
+        chapter_number, start_byte = chapter_list[i]
+        end_byte = chapter_list[i + 1][1] if i + 1 < len(chapter_list) else text_length
+        ranges[chapter_number] = (start_byte, end_byte)
+    return ranges
+
+# Motore di segmentazione in un solo passaggio lineare: una sola espressione regolare ancorata
+# a inizio riga (nessun backtracking tra righe diverse) riconosce sia le voci dell'indice sia
+# le intestazioni di capitoli e parti, con numeri arabi o romani. Il "\n" iniziale è un prefisso
+# letterale: il motore salta direttamente da una riga all'altra invece di provare ogni carattere.
+HEADING_PATTERN = re.compile(
+    r'\n[ \t]*(?i:(capitolo|chapter)|(parte|part))[ \t]+([0-9]{1,4}|[IVXLCDM]{1,8})(?!\w)([^\n]*)')
+INDEX_TAIL_PATTERN = re.compile(r'(?:[ \t.·…_-]{2,}|\t)([0-9]{1,4})[ \t]*$')  # "........ 12" a fine riga
+ROMAN_VALUES = {"I": 1, "V": 5, "X": 10, "L": 50, "C": 100, "D": 500, "M": 1000}
+
+def roman_to_int(numeral):
+    total = 0
+    for i, letter in enumerate(numeral):
+        value = ROMAN_VALUES[letter]
+        total += -value if i + 1 < len(numeral) and ROMAN_VALUES[numeral[i + 1]] > value else value
+    return total
+
+class ChapterSegmenter:
+    # Riceve il testo a pezzi e raccoglie voci dell'indice e intestazioni come (tipo, numero, posizione, titolo).
+    # Le posizioni sono offset nel testo, direttamente utilizzabili da calculate_page_ranges.
+
+    MAX_TITLE_LENGTH = 80  # Una riga più lunga è testo normale, non un'intestazione
+    TOC_GAP = 200  # Intestazioni più vicine di così formano un sommario
+    TOC_MIN_ENTRIES = 3
+
+    def __init__(self):
+        self.length = 0
+        self.carry = ""  # Ultima riga non ancora completa
+        self.skip_line = False  # La riga in corso è troppo lunga per essere un'intestazione
+        self.index_entries = []  # (tipo, numero, pagina, posizione)
+        self.headings = []  # Intestazioni confermate
+        self.run = []  # Intestazioni ravvicinate nelle prime pagine, forse un sommario
+
+    def feed(self, piece):
+        # text[0] è il "\n" che precede la riga di carry: base è la sua posizione nel testo
+        base = self.length - len(self.carry) - 1
+        text = "\n" + self.carry + piece
+        self.length += len(piece)
+        scan_start = 0
+        if self.skip_line:
+            scan_start = text.find("\n", 1)
+            if scan_start < 0:
+                self.carry = ""
+                return
+            self.skip_line = False
+
+        # Si esaminano solo righe complete: la riga spezzata resta per il prossimo pezzo
+        cut = text.rfind("\n")
+        self._scan(text, base, scan_start, cut)
+        self.carry = text[cut + 1:]
+        if len(self.carry) > self.MAX_TITLE_LENGTH * 2:
+            self.carry = ""
+            self.skip_line = True
+        self._close_run(self.length - len(self.carry))
+
+    def finish(self):
+        if self.carry:
+            text = "\n" + self.carry
+            self._scan(text, self.length - len(text), 0, len(text))
+            self.carry = ""
+        self._close_run(None)
+
+    def _scan(self, text, base, scan_start, scan_end):
+        for match in HEADING_PATTERN.finditer(text, scan_start, scan_end):
+            rest = match.group(4)
+            if len(rest.strip()) > self.MAX_TITLE_LENGTH:
+                continue
+            kind = "chapter" if match.group(1) else "part"
+            numeral = match.group(3)
+            number = int(numeral) if numeral.isdigit() else roman_to_int(numeral)
+            position = base + match.start(1 if match.group(1) else 2)
+
+            index_tail = INDEX_TAIL_PATTERN.search(rest) if position < PAGE_SIZE * 5 else None
+            if index_tail:
+                self.index_entries.append((kind, number, int(index_tail.group(1)), position))
+                continue
+            title = " ".join(match.group(0).split())
+            self._add_heading((kind, number, position, title), base + match.end())
+
+    def _add_heading(self, heading, line_end):
+        position = heading[2]
+        if self.run and position - self.run[-1][1] > self.TOC_GAP:
+            self._close_run(None)
+        if position < PAGE_SIZE * 5 or self.run:
+            self.run.append((heading, line_end))
+        else:
+            self.headings.append(heading)
+
+    def _close_run(self, position):
+        # Un gruppo di almeno tre intestazioni ravvicinate è un sommario. Il testo vero comincia
+        # dalla prima voce ripetuta (o dall'ultima voce), insieme alle parti che la precedono.
+        if not self.run or (position is not None and position - self.run[-1][1] <= self.TOC_GAP):
+            return
+        run = [heading for heading, _ in self.run]
+        self.run = []
+        if len(run) < self.TOC_MIN_ENTRIES:
+            self.headings += run
+            return
+        seen = set()
+        first = len(run) - 1
+        for i, (kind, number, _, _) in enumerate(run):
+            if (kind, number) in seen:
+                first = i
+                break
+            seen.add((kind, number))
+        while first > 0 and run[first - 1][0] == "part" and run[first][0] == "chapter":
+            first -= 1
+        self.headings += run[first:]
+
+    def chapters(self):
+        # Capitoli trovati finora come {numero: posizione} e titoli come {numero: titolo}.
+        return chapters_from_headings(self.headings)
+
+def chapters_from_headings(headings):
+    # I capitoli sono le intestazioni "Capitolo"; senza capitoli si usano le parti.
+    # Una parte che precede un capitolo ne anticipa l'inizio. Se la numerazione ricomincia
+    # in ogni parte i capitoli vengono numerati in sequenza; altrimenti, come in find_chapters,
+    # un numero ripetuto indica l'intestazione vera dopo un sommario e prevale l'ultima.
+    chapter_headings = [heading for heading in headings if heading[0] == "chapter"]
+    parts = [heading for heading in headings if heading[0] == "part"]
+    sections = chapter_headings or parts
+    numbers = [heading[1] for heading in sections]
+    sequential = bool(chapter_headings and parts) and len(set(numbers)) != len(numbers)
+
+    chapters, titles = {}, {}
+    part_start, part_title = None, None
+    section_index = 0
+    for kind, number, position, title in headings:
+        if sections is chapter_headings and kind == "part":
+            part_start, part_title = (part_start, part_title) if part_start is not None else (position, title)
+            continue
+        section_index += 1
+        key = section_index if sequential else number
+        chapters[key] = part_start if part_start is not None else position
+        titles[key] = f"{part_title} - {title}" if part_title else title
+        part_start, part_title = None, None
+    return chapters, titles
+
+def chapters_from_index(index_entries, text_length):
+    # Senza intestazioni nel testo si usano le pagine dell'indice come stima della posizione.
+    chapters, titles = {}, {}
+    for kind, number, page, _ in index_entries:
+        if kind == "chapter" or not any(entry[0] == "chapter" for entry in index_entries):
+            chapters[number] = min((page - 1) * PAGE_SIZE, text_length)
+            titles[number] = f"{'Capitolo' if kind == 'chapter' else 'Parte'} {number}"
+    return chapters, titles
+
+def segment_text(text):
+    # Segmentazione del testo intero: restituisce ({numero: posizione}, {numero: titolo}) o (None, {}).
+    segmenter = ChapterSegmenter()
+    segmenter.feed(text)
+    segmenter.finish()
+    chapters, titles = segmenter.chapters()
+    if not chapters and segmenter.index_entries:
+        chapters, titles = chapters_from_index(segmenter.index_entries, len(text))
+    return (chapters or None), titles
+
+class LineDetector:
+    # Adatta ChapterSegmenter allo StreamingSegmenter.
+
+    def __init__(self):
+        self.segmenter = ChapterSegmenter()
+        self.titles = {}
+
+    def feed(self, piece):
+        self.segmenter.feed(piece)
+
+    def provisional(self):
+        chapters, self.titles = self.segmenter.chapters()
+        return chapters
+
+    def finish(self):
+        self.segmenter.finish()
+        chapters, self.titles = self.segmenter.chapters()
+        if not chapters and self.segmenter.index_entries:
+            chapters, self.titles = chapters_from_index(self.segmenter.index_entries, self.segmenter.length)
+        return chapters or None
+
+class LegacyDetector:
+    # Regole originali (find_index_section, poi find_chapters) applicate al testo che arriva a pezzi.
+
+    SCAN_OVERLAP = 64  # Caratteri riesaminati a cavallo tra due pezzi
+
+    def __init__(self):
+        self.length = 0
+        self.head = ""  # Prime cinque pagine, per la ricerca dell'indice
+        self.tail = ""  # Coda del testo già esaminato, per le intestazioni spezzate tra due pezzi
+        self.next_scan = 0  # Prima posizione in cui cercare una nuova intestazione
+        self.index_checked = False
+        self.index_offsets = None
+        self.chapters = {}  # Stessa semantica del dizionario di find_chapters
+        self.titles = {}
+
+    def feed(self, piece):
+        window_start = self.length - len(self.tail)
+        self._scan(self.tail + piece, window_start, final=False)
+        self.length += len(piece)
+        if len(self.head) < PAGE_SIZE * 5:
+            self.head += piece[:PAGE_SIZE * 5 - len(self.head)]
+        # L'indice si cerca nelle prime cinque pagine, come in find_index_section
+        if not self.index_checked and self.length >= PAGE_SIZE * 5:
+            self._check_index()
+
+    def provisional(self):
+        if not self.index_checked:
+            return None
+        return self.index_offsets or self.chapters
+
+    def finish(self):
+        self._scan(self.tail, self.length - len(self.tail), final=True)
+        if not self.index_checked:
+            self._check_index()
+        return self.index_offsets or self.chapters or None
+
+    def _scan(self, window, window_start, final):
+        self.tail = window[-self.SCAN_OVERLAP:]
+        for match in CHAPTER_PATTERN.finditer(window):
+            position = window_start + match.start()
+            # All'inizio della finestra manca il carattere precedente: \b non è affidabile
+            if position < self.next_scan or (match.start() == 0 and window_start > 0):
+                continue
+            if match.end() == len(window) and not final:
+                # Le cifre potrebbero continuare nel prossimo pezzo: si riesamina da qui
+                self.tail = window[max(match.start() - 1, 0):]
+                break
+            self.chapters[int(match.group(1))] = position
+            self.next_scan = window_start + match.end()
+
+    def _check_index(self):
+        self.index_checked = True
+        self.index_offsets = find_index_section(self.head)
+        if not self.index_offsets:
+            print("Indice non trovato, cerco i capitoli...")
+
+class StreamingSegmenter:
+    # Riceve il testo a pezzi e restituisce ogni capitolo appena i suoi confini sono noti.
+    # I confini finali (chapters) sono gli stessi della segmentazione sul testo intero; in memoria
+    # resta solo il testo dei capitoli non ancora restituiti.
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.length = 0  # Caratteri ricevuti finora
+        self.pieces = []  # Testo non ancora restituito, a partire da pieces_start
+        self.pieces_start = 0
+        self.emitted = {}  # Capitolo -> intervallo dell'ultimo segmento restituito
+        self.chapters = {}
+        self.titles = {}
+
+    def feed(self, piece):
+        # Aggiunge un pezzo di testo e restituisce i capitoli completati come (numero, inizio, fine, testo).
+        self.pieces.append(piece)
+        self.length += len(piece)
+        self.detector.feed(piece)
+        return self._emit(self.detector.provisional(), final=False)
+
+    def finish(self):
+        # Chiude il testo e restituisce i capitoli rimasti aperti.
+        chapters = self.detector.finish()
+        if not chapters:
+            # Nessun capitolo: tutto il testo è ancora in memoria, come divide_by_fixed_length
+            chapters = divide_by_fixed_length("".join(self.pieces))
+        completed = self._emit(chapters, final=True)
+        self.titles = self.detector.titles
+        self.pieces = []
+        return completed
+
+    def _emit(self, chapters, final):
+        if not chapters:
+            return []
+        self.chapters = chapters
+        completed = []
+        open_starts = []
+        for chapter_num, (start, end) in chapter_ranges(chapters, self.length).items():
+            if self.emitted.get(chapter_num) == (start, end):
+                continue
+            if end < self.length or final:
+                # Se il testo è già stato scartato il capitolo verrà riletto alla fine (vedi streaming_analysis)
+                if start >= self.pieces_start:
+                    completed.append((chapter_num, start, end, self._slice(start, end)))
+                    self.emitted[chapter_num] = (start, end)
+            else:
+                open_starts.append(start)
+        self._drop_before(min(open_starts, default=self.length))
+        return completed
+
+    def _slice(self, start, end):
+        if end <= start:
+            return ""  # Capitoli numerati fuori ordine: come text[start:end] sul testo intero
+        return "".join(self.pieces)[start - self.pieces_start:end - self.pieces_start]
+
+    def _drop_before(self, position):
+        # Il testo che precede position non serve più.
+        if position > self.pieces_start:
+            text = "".join(self.pieces)
+            self.pieces = [text[position - self.pieces_start:]]
+            self.pieces_start = position
+
+# -------------------- CACHE DEGLI EMBEDDING --------------------
+
+def embedding_cache_key(text, mode):
+    # La chiave dipende dal testo e da tutto ciò che cambia il vettore risultante.
+    # Il backend fp32 non compare nella chiave, così le voci create prima dei backend restano valide.
+    model_id = MODEL_NAME if backend == "fp32" else f"{MODEL_NAME}@{backend}"
+    key = hashlib.sha256(f"{model_id}|{MAX_LENGTH}|{WINDOW_STRIDE}|{mode}\n".encode("utf-8"))
+    key.update(text.encode("utf-8"))
+    return key.hexdigest()
+
+def embedding_cache_path(cache_dir, key):
+    return os.path.join(cache_dir, key[:2], f"{key}.npy")
+
+def load_cached_embedding(cache_dir, key):
+    path = embedding_cache_path(cache_dir, key)
+    try:
+        embeddings = np.load(path)
+        os.utime(path)  # Segna l'ultimo utilizzo per l'eliminazione LRU
+    except (OSError, ValueError):
+        return None
+    return embeddings
+
+def store_cached_embedding(cache_dir, key, embeddings):
+    # Scrittura atomica: un altro processo non può mai leggere un file a metà.
+    path = embedding_cache_path(cache_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        np.save(f, np.asarray(embeddings, dtype=np.float32))
+    os.replace(temp_path, path)
+
+def evict_embedding_cache(cache_dir, max_size_mb):
+    # Elimina le voci usate meno di recente finché la cache non rientra nel limite.
+    entries = []
+    for folder, _, files in os.walk(cache_dir):
+        for name in files:
+            if name.endswith(".npy"):
+                path = os.path.join(folder, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue  # Eliminata nel frattempo da un'altra esecuzione che condivide la cache
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+    total_size = sum(size for _, size, _ in entries)
+    max_size = max_size_mb * 1024 * 1024
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass  # Già eliminata da un'altra esecuzione
+        total_size -= size
+    return removed
+
 # -------------------- ANALISI PARALLELA --------------------
 
-def analyze_text_with_bert(text):
-    # Tokenizzazione del testo
-    inputs = tokenizer(text, return_tensors="pt", truncation=True, max_length=512)
-    
-    # Esegui il modello per ottenere embedding
-    with torch.no_grad():
-        outputs = model(**inputs)
+def split_into_windows(token_ids, max_length=MAX_LENGTH, stride=WINDOW_STRIDE):
+    # Divide i token del capitolo in finestre sovrapposte, ognuna racchiusa tra [CLS] e [SEP].
+    body_length = max_length - 2
+    step = body_length - stride
+    windows = []
+    for start in range(0, max(len(token_ids), 1), step):
+        chunk = token_ids[start:start + body_length]
+        windows.append([tokenizer.cls_token_id] + chunk + [tokenizer.sep_token_id])
+        if start + body_length >= len(token_ids):
+            break
+    return windows
 
-    # L'output è una rappresentazione vettoriale del testo (usata per NLP avanzato)
-    embeddings = outputs.last_hidden_state.mean(dim=1).squeeze().numpy()
-    
-    return embeddings  # Questi vettori possono essere usati per analisi più complesse
+def embed_windows(windows, batch_size):
+    # Esegue BERT sulle finestre raggruppate per lunghezza, con padding solo fino alla più lunga del batch.
+    order = sorted(range(len(windows)), key=lambda i: len(windows[i]))
+    pooled = [None] * len(windows)
+    for first in range(0, len(order), batch_size):
+        batch = order[first:first + batch_size]
+        width = max(len(windows[i]) for i in batch)
+        input_ids = torch.full((len(batch), width), tokenizer.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(batch), width), dtype=torch.long)
+        for row, i in enumerate(batch):
+            input_ids[row, :len(windows[i])] = torch.tensor(windows[i], dtype=torch.long)
+            attention_mask[row, :len(windows[i])] = 1
 
-def analyze_chapter(book_name, chapter_num, chapter_text, output_dir):
-    file_name = os.path.join(output_dir, f"{book_name}-capitolo{chapter_num}-analysis.csv")
-    
-    # Scrive "Analisi non completa"
-    with open(file_name, "w", newline='', encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["Stato", "Analisi non completa"])
-        time.sleep(5)
+        with torch.no_grad(), inference_context():
+            outputs = model(input_ids=input_ids, attention_mask=attention_mask)
 
-    # Esegui l'analisi con BERT
-    embeddings = analyze_text_with_bert(chapter_text)
-    
-    # Scrive "Analisi completata" e gli embedding
-    completion_time = datetime.datetime.now().strftime("%d/%m/%Y alle %H:%M:%S")
-    with open(file_name, "a", newline='', encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["Stato", f"Analisi completata il {completion_time}"])
-        writer.writerow(["Embeddings", embeddings.tolist()])
+        # Media dei token reali di ogni finestra (il padding non contribuisce), sempre in float32
+        hidden = outputs.last_hidden_state.to(torch.float32)
+        mask = attention_mask.unsqueeze(-1).to(torch.float32)
+        means = (hidden * mask).sum(dim=1) / mask.sum(dim=1)
+        for row, i in enumerate(batch):
+            pooled[i] = means[row]
+    return pooled
+
+def analyze_text_with_bert(text, mode="chunked", batch_size=DEFAULT_BATCH_SIZE, timings=None):
+    # Restituisce l'embedding del testo e il numero di token elaborati.
+    # Se timings è un dizionario, vi registra i secondi di tokenizzazione e di inferenza.
+    timings = {} if timings is None else timings
+    start_time = time.perf_counter()
+    if mode == "truncate":
+        # Vecchio comportamento: un solo forward pass sui primi 512 token
+        inputs = tokenizer(text, return_tensors="pt", truncation=True, max_length=MAX_LENGTH)
+        timings["tokenize_s"] = time.perf_counter() - start_time
+        with torch.no_grad(), inference_context():
+            outputs = model(**inputs)
+        embeddings = outputs.last_hidden_state.to(torch.float32).mean(dim=1).squeeze().numpy()
+        timings["inference_s"] = time.perf_counter() - start_time - timings["tokenize_s"]
+        return embeddings, inputs["input_ids"].shape[1]
+
+    # Tutto il capitolo, senza troncamento: tokenizzazione e inferenza procedono in parallelo
+    return pipelined_embedding(text, batch_size, timings)
+
+def embed_token_ids(token_ids, batch_size=DEFAULT_BATCH_SIZE):
+    # Embedding del capitolo a partire dai token già calcolati (modalità chunked).
+    windows = split_into_windows(token_ids)
+    return combine_windows([len(window) for window in windows], embed_windows(windows, batch_size))
+
+def combine_windows(window_lengths, pooled):
+    # Il vettore del capitolo è la media delle finestre pesata sul numero di token
+    weights = torch.tensor(window_lengths, dtype=torch.float32)
+    stacked = torch.stack(pooled).to(torch.float32)
+    embeddings = (stacked * weights.unsqueeze(-1)).sum(dim=0) / weights.sum()
+    num_tokens = sum(window_lengths)
+
+    return embeddings.numpy(), num_tokens  # Questi vettori possono essere usati per analisi più complesse
+
+WORD_BOUNDARY = re.compile(r"[ \t\n\r]")  # Spazi per BERT: il testo si può dividere qui senza cambiare i token
+
+def text_blocks(text, block_chars=TOKENIZE_BLOCK_CHARS):
+    # Divide il testo in blocchi che terminano su uno spazio: BERT tokenizza parola per parola,
+    # quindi concatenando i token dei blocchi si ottengono quelli del testo intero.
+    start = 0
+    while start < len(text):
+        match = WORD_BOUNDARY.search(text, start + block_chars)
+        end = match.end() if match else len(text)
+        yield text[start:end]
+        start = end
+
+def put_block(blocks, item, stop):
+    # Attende un posto libero nella coda, ma rinuncia se l'inferenza si è interrotta.
+    while not stop.is_set():
+        try:
+            blocks.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+def tokenize_blocks(text, blocks, stop, stats):
+    # Stadio di tokenizzazione (thread secondario): mette in coda i token di ogni blocco di testo.
+    # La coda è limitata: se l'inferenza è indietro, il thread aspetta invece di accumulare token.
+    try:
+        for block in text_blocks(text):
+            start_time = time.perf_counter()
+            token_ids = tokenizer(block, add_special_tokens=False, verbose=False)["input_ids"]
+            stats["tokenize_s"] += time.perf_counter() - start_time
+            put_block(blocks, token_ids, stop)
+        put_block(blocks, None, stop)
+    except Exception as e:
+        put_block(blocks, e, stop)
+
+def queued_blocks(blocks, stats):
+    # Blocchi di token dalla coda; il tempo di attesa è quello in cui l'inferenza resta senza lavoro.
+    while True:
+        start_time = time.perf_counter()
+        token_ids = blocks.get()
+        stats["wait_tokens_s"] += time.perf_counter() - start_time
+        if token_ids is None:
+            return
+        if isinstance(token_ids, Exception):
+            raise token_ids
+        yield token_ids
+
+def stream_windows(token_blocks, max_length=MAX_LENGTH, stride=WINDOW_STRIDE):
+    # Come split_into_windows, con i token che arrivano a blocchi: ogni finestra esce appena
+    # si sa che non è l'ultima, e dei token si tiene solo la parte non ancora usata.
+    body_length = max_length - 2
+    step = body_length - stride
+    buffer = []  # Token a partire dall'inizio della prossima finestra
+    for token_ids in token_blocks:
+        buffer += token_ids
+        while len(buffer) > body_length:
+            yield [tokenizer.cls_token_id] + buffer[:body_length] + [tokenizer.sep_token_id]
+            buffer = buffer[step:]
+    yield from split_into_windows(buffer, max_length, stride)
+
+def pipelined_embedding(text, batch_size=DEFAULT_BATCH_SIZE, timings=None):
+    # Embedding del capitolo con tokenizzazione e inferenza sovrapposte: un thread tokenizza il
+    # testo a blocchi mentre questo thread esegue BERT sulle finestre già pronte.
+    # Il risultato è quello di embed_token_ids sui token dell'intero capitolo.
+    stats = {"tokenize_s": 0.0, "wait_tokens_s": 0.0}
+    blocks = queue.Queue(maxsize=TOKEN_QUEUE_BLOCKS)
+    stop = threading.Event()
+    producer = threading.Thread(target=tokenize_blocks, args=(text, blocks, stop, stats), daemon=True)
+    producer.start()
+    window_lengths, pooled, batch = [], [], []
+    inference = 0.0
+    try:
+        for window in stream_windows(queued_blocks(blocks, stats)):
+            batch.append(window)
+            if len(batch) == batch_size:
+                start_time = time.perf_counter()
+                pooled += embed_windows(batch, batch_size)
+                inference += time.perf_counter() - start_time
+                window_lengths += [len(window) for window in batch]
+                batch = []
+        if batch:
+            start_time = time.perf_counter()
+            pooled += embed_windows(batch, batch_size)
+            inference += time.perf_counter() - start_time
+            window_lengths += [len(window) for window in batch]
+    finally:
+        stop.set()
+        producer.join()
+    if timings is not None:
+        timings.update(stats, inference_s=inference)
+    return combine_windows(window_lengths, pooled)
+
+def analyze_chapter(chapter_num, chapter_text, mode="chunked", batch_size=DEFAULT_BATCH_SIZE, cache_dir=None):
+    # Calcola l'embedding del capitolo; la scrittura su disco spetta al processo principale.
+    # Se il capitolo è già stato analizzato con gli stessi parametri, riusa l'embedding
+    cache_key = embedding_cache_key(chapter_text, mode)
+    embeddings = load_cached_embedding(cache_dir, cache_key) if cache_dir else None
+    cache_hit = embeddings is not None
+    num_tokens, elapsed, timings = 0, 0.0, {}
+    started, start_cpu = time.time(), time.process_time()
+
+    if not cache_hit:
+        # Esegui l'analisi con BERT
+        load_model()
+        start_time = time.perf_counter()
+        embeddings, num_tokens = analyze_text_with_bert(chapter_text, mode, batch_size, timings)
+        elapsed = time.perf_counter() - start_time
+        print(f"Capitolo {chapter_num}: {num_tokens} token in {elapsed:.2f} s ({num_tokens / elapsed:.0f} token/s)", flush=True)
+        if cache_dir:
+            store_cached_embedding(cache_dir, cache_key, embeddings)
+    else:
+        print(f"Capitolo {chapter_num}: embedding trovato in cache", flush=True)
+
+    # Dati per le metriche: started è un orario assoluto, confrontabile tra processi
+    return {"chapter": chapter_num, "embeddings": embeddings, "tokens": num_tokens, "seconds": elapsed,
+            "cache_hit": cache_hit, "chars": len(chapter_text), "key": cache_key, "started": started,
+            "cpu_s": time.process_time() - start_cpu, "pid": os.getpid(), "peak_rss_mb": peak_rss_mb(), **timings}
+
+class SharedTextBuffer:
+    # Testo dei capitoli da analizzare, codificato una sola volta in UTF-8 in un blocco di memoria
+    # condivisa: i processi del Pool ricevono solo (nome, offset, lunghezza) e decodificano il
+    # proprio capitolo sul posto, senza copie del libro serializzate nelle pipe.
+
+    def __init__(self, size):
+        self.block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.used = 0
+        shared_texts[self.block.name] = self.block  # In modalità "single" il processo legge dal proprio blocco
+
+    def append(self, text):
+        data = text.encode("utf-8")
+        self.block.buf[self.used:self.used + len(data)] = data
+        descriptor = (self.block.name, self.used, len(data))
+        self.used += len(data)
+        return descriptor
+
+    def close(self):
+        shared_texts.pop(self.block.name, None)
+        self.block.close()
+        self.block.unlink()
+
+shared_texts = {}  # Nome del blocco -> memoria condivisa aperta da questo processo
+
+def utf8_length(text):
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
+def read_shared_text(name, offset, length):
+    # Decodifica un capitolo da un SharedTextBuffer; il blocco resta aperto per i capitoli successivi.
+    block = shared_texts.get(name)
+    if block is None:
+        block = shared_texts[name] = shared_memory.SharedMemory(name=name)
+    with block.buf[offset:offset + length] as view:
+        return str(view, "utf-8")
+
+def analyze_chapter_job(job):
+    # Un errore su un capitolo non interrompe gli altri: viene registrato come stato "failed".
+    # Il testo può arrivare come stringa o come descrittore di un SharedTextBuffer.
+    chapter_num, chapter_text = job[0], ""
+    try:
+        chapter_text = job[1] if isinstance(job[1], str) else read_shared_text(*job[1])
+        return analyze_chapter(chapter_num, chapter_text, *job[2:])
+    except Exception as e:
+        return {"chapter": chapter_num, "error": f"{type(e).__name__}: {e}", "tokens": 0, "seconds": 0.0,
+                "cache_hit": False, "chars": len(chapter_text)}
+
+def record_result(store, result):
+    # Registra nel diario l'esito di un capitolo.
+    if "error" in result:
+        print(f"Errore nell'analisi del capitolo {result['chapter']}: {result['error']}", flush=True)
+        store.mark_failed(result["chapter"], result["error"])
+    else:
+        store.write(result["chapter"], result["embeddings"], result["key"])
+
+class ResultWriter:
+    # Stadio di scrittura: un thread esegue in ordine le operazioni sull'archivio (embedding,
+    # stati, fsync), le metriche e l'avanzamento, mentre il processo principale continua a
+    # raccogliere capitoli dal Pool o, in modalità "single", a eseguire BERT.
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=WRITE_QUEUE_RESULTS)
+        self.busy = 0.0  # Secondi passati a scrivere
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, function, *args):
+        if self.error:
+            raise self.error
+        self.queue.put((function, args))
 
-def parallel_analysis(book_name, chapters, text, output_dir):
-    num_workers = min(multiprocessing.cpu_count(), len(chapters))
-    with multiprocessing.Pool(processes=num_workers) as pool:
-        tasks = []
-        chapter_list = sorted(chapters.items())  # Ordina i capitoli per numero
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error:
+                continue  # Dopo un errore le operazioni rimaste vengono scartate
+            function, args = item
+            start_time = time.perf_counter()
+            try:
+                function(*args)
+            except Exception as e:
+                self.error = e
+            self.busy += time.perf_counter() - start_time
 
-        for i in range(len(chapter_list)):
-            chapter_number, start_byte = chapter_list[i]
-            end_byte = chapter_list[i + 1][1] if i + 1 < len(chapter_list) else len(text)
+    def close(self):
+        # Attende la fine delle scritture in coda; un errore del thread viene sollevato qui.
+        self.queue.put(None)
+        self.thread.join()
+        if self.error:
+            raise self.error
 
-            chapter_text = text[start_byte:end_byte]
-            tasks.append(pool.apply_async(analyze_chapter, (book_name, chapter_number, chapter_text, output_dir)))
+def finish_chapter(store, book_name, result, dispatched, progress, results):
+    # Eseguita dallo stadio di scrittura per ogni capitolo analizzato.
+    result["book"] = book_name
+    # Lo stadio di scrittura lavora mentre l'inferenza prosegue negli altri thread
+    with metrics.stage("store_write", book_name, own_thread=True):
+        record_result(store, result)
+    metrics.chapter_done(book_name, result, dispatched)
+    progress.chapter_done(result)
+    results.append(result)
 
-        [task.wait() for task in tasks] # Aspetta per tutti i processi
+def report_occupancy(results, elapsed, writer):
+    # Quota del tempo dell'analisi in cui ogni stadio ha lavorato: lo stadio più occupato è il collo di bottiglia.
+    # Tokenizzazione e inferenza si sommano su tutti i processi che hanno analizzato capitoli.
+    analyzed = [result for result in results if not result["cache_hit"] and "error" not in result]
+    processes = len({result["pid"] for result in analyzed}) or 1
+    tokenize = sum(result.get("tokenize_s", 0.0) for result in analyzed)
+    inference = sum(result.get("inference_s", 0.0) for result in analyzed)
+    waiting = sum(result.get("wait_tokens_s", 0.0) for result in analyzed)
+    elapsed = elapsed or 1e-9
+    occupancy = {"processes": processes, "tokenize": round(tokenize / (elapsed * processes), 3),
+                 "inference": round(inference / (elapsed * processes), 3), "write": round(writer.busy / elapsed, 3),
+                 "inference_waiting_tokens": round(waiting / (inference + waiting), 3) if inference + waiting else 0.0}
+    metrics.pipeline = occupancy
+    print(f"Occupazione degli stadi: tokenizzazione {occupancy['tokenize']:.0%}, inferenza {occupancy['inference']:.0%}, "
+          f"scrittura {occupancy['write']:.0%} (inferenza in attesa dei token: {occupancy['inference_waiting_tokens']:.0%})")
 
-def calculate_page_ranges(chapters, text):
+class ProgressReporter:
+    # Emette su stdout una riga JSON per ogni evento dell'analisi (capitoli totali/completati, token, ETA).
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.start_time = time.perf_counter()
+        self.chapters_total = 0
+        self.chapters_done = 0
+        self.chars_total = 0
+        self.chars_done = 0
+        self.tokens = 0
+        self.final = False  # False finché la ricerca dei capitoli (in streaming) non è terminata
+
+    def emit(self, event, **fields):
+        if self.enabled:
+            # Una sola write per riga: su una pipe resta atomica anche se i worker stampano insieme
+            sys.stdout.write(PROGRESS_PREFIX + json.dumps({"event": event, **fields}) + "\n")
+            sys.stdout.flush()
+
+    def add_chapters(self, chapter_chars, final=False):
+        # Registra capitoli da analizzare; chapter_chars contiene la lunghezza di ciascuno.
+        self.chapters_total += len(chapter_chars)
+        self.chars_total += sum(chapter_chars)
+        self.final = self.final or final
+        self.emit("chapters", chapters_total=self.chapters_total, final=self.final)
+
+    def chapter_done(self, result):
+        self.chapters_done += 1
+        self.chars_done += result["chars"]
+        self.tokens += result["tokens"]
+        self.emit("chapter", book=result.get("book"), chapter=result["chapter"], chapters_done=self.chapters_done,
+                  chapters_total=self.chapters_total, final=self.final, tokens=self.tokens, eta_s=self.eta())
+
+    def eta(self):
+        # Stima basata sui caratteri: il tempo per carattere finora, applicato al testo rimanente.
+        if not self.final or not self.chars_done:
+            return None
+        elapsed = time.perf_counter() - self.start_time
+        return round(elapsed / self.chars_done * (self.chars_total - self.chars_done), 1)
+
+def peak_rss_mb():
+    # Memoria residente massima del processo corrente, o None se resource non esiste (Windows).
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 2**20 if sys.platform == "darwin" else peak / 1024, 1)  # Byte su macOS, KB su Linux
+
+class RunMetrics:
+    # Tempi delle fasi (reale e CPU del processo principale) e dati dei capitoli analizzati,
+    # salvati in JSON accanto al riepilogo (vedi write_metrics). Per le fasi eseguite da un thread
+    # mentre gli altri continuano (own_thread) la CPU è solo quella del thread che le esegue.
+
+    def __init__(self):
+        self.stages = {}  # (libro o None per le fasi comuni, fase) -> tempi accumulati
+        self.chapters = []
+        self.started = time.time()
+        self.pipeline = None  # Occupazione degli stadi (vedi report_occupancy)
+
+    @contextlib.contextmanager
+    def stage(self, name, book=None, own_thread=False):
+        cpu_time = time.thread_time if own_thread else time.process_time
+        start_time, start_cpu = time.perf_counter(), cpu_time()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault((book, name), {"wall_s": 0.0, "cpu_s": 0.0, "calls": 0})
+            entry["wall_s"] += time.perf_counter() - start_time
+            entry["cpu_s"] += cpu_time() - start_cpu
+            entry["calls"] += 1
+
+    def chapter_done(self, book, result, dispatched):
+        # dispatched: orario (time.time) in cui il capitolo è stato messo in coda
+        started = result.get("started")
+        seconds = lambda value: round(value, 4) if value is not None else None
+        self.chapters.append({
+            "book": book, "chapter": result["chapter"], "chars": result["chars"], "tokens": result["tokens"],
+            "cache_hit": result["cache_hit"], "wall_s": seconds(result["seconds"]), "cpu_s": seconds(result.get("cpu_s")),
+            "tokenize_s": seconds(result.get("tokenize_s")), "inference_s": seconds(result.get("inference_s")),
+            "wait_tokens_s": seconds(result.get("wait_tokens_s")),
+            "queue_wait_s": seconds(max(0.0, started - dispatched)) if started else None,
+            "pid": result.get("pid"), "peak_rss_mb": result.get("peak_rss_mb"), "error": result.get("error"),
+        })
+
+    def report(self, book, **info):
+        # Metriche di un libro: fasi comuni e sue, capitoli e memoria massima di ogni processo.
+        stages = {name: {key: round(value, 4) for key, value in entry.items()}
+                  for (stage_book, name), entry in self.stages.items() if stage_book in (None, book)}
+        chapters = [{key: value for key, value in chapter.items() if key != "book"}
+                    for chapter in self.chapters if chapter["book"] == book]
+        workers = {}
+        for chapter in self.chapters:
+            if chapter["pid"] is not None:
+                worker = workers.setdefault(str(chapter["pid"]), {"chapters": 0, "peak_rss_mb": None})
+                worker["chapters"] += 1
+                if chapter["peak_rss_mb"] is not None:
+                    worker["peak_rss_mb"] = max(worker["peak_rss_mb"] or 0, chapter["peak_rss_mb"])
+        analyzed = [chapter for chapter in chapters if not chapter["cache_hit"] and not chapter["error"]]
+        tokens = sum(chapter["tokens"] for chapter in analyzed)
+        inference = sum(chapter["inference_s"] or 0 for chapter in analyzed)
+        return {
+            "book": book, "started": datetime.datetime.fromtimestamp(self.started).isoformat(timespec="seconds"), **info, "stages": stages,
+            "totals": {"chapters": len(chapters), "cache_hits": sum(chapter["cache_hit"] for chapter in chapters),
+                       "failed": sum(bool(chapter["error"]) for chapter in chapters), "tokens": tokens,
+                       "inference_tokens_per_s": round(tokens / inference) if inference else None},
+            "pipeline": self.pipeline, "main_peak_rss_mb": peak_rss_mb(), "workers": workers, "chapters": chapters,
+        }
+
+metrics = RunMetrics()  # Metriche dell'esecuzione corrente, raccolte dal processo principale
+
+def write_metrics(metrics_file, book, **info):
+    with open(metrics_file, "w", encoding="utf-8") as f:
+        json.dump(metrics.report(book, **info), f, indent=2)
+
+@contextlib.contextmanager
+def profiling(profiler, output_prefix):
+    # Profilo opzionale dell'esecuzione: i file vengono salvati anche se l'analisi termina con errore.
+    if profiler == "cprofile":
+        import cProfile
+        import pstats
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(f"{output_prefix}-profile.prof")
+            pstats.Stats(profile).sort_stats("cumulative").print_stats(PROFILE_ROWS)
+            print(f"Profilo cProfile salvato in {output_prefix}-profile.prof")
+    elif profiler == "torch":
+        load_libraries()
+        from torch.profiler import ProfilerActivity, profile
+        trace = profile(activities=[ProfilerActivity.CPU], record_shapes=True)
+        trace.start()
+        try:
+            yield
+        finally:
+            trace.stop()
+            trace.export_chrome_trace(f"{output_prefix}-trace.json")
+            print(trace.key_averages().table(sort_by="self_cpu_time_total", row_limit=PROFILE_ROWS))
+            print(f"Traccia di torch.profiler salvata in {output_prefix}-trace.json (chrome://tracing)")
+    else:
+        yield
+
+# -------------------- PIANIFICAZIONE DEI PROCESSI --------------------
+
+def available_cores():
+    # Core fisici utilizzabili da questo processo (rispetta taskset e i limiti del container), ognuno
+    # come lista delle sue CPU logiche: i thread SMT di un core ne condividono le unità di calcolo,
+    # quindi due thread di BERT sullo stesso core fisico si rallentano a vicenda.
+    if hasattr(os, "sched_getaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(multiprocessing.cpu_count()))
+    cores = {}
+    try:
+        for cpu in cpus:
+            topology = f"/sys/devices/system/cpu/cpu{cpu}/topology"
+            with open(os.path.join(topology, "physical_package_id")) as f, open(os.path.join(topology, "core_id")) as g:
+                cores.setdefault((f.read().strip(), g.read().strip()), []).append(cpu)
+        return list(cores.values())
+    except OSError:
+        pass
+    # Topologia non disponibile (fuori da Linux): con psutil si conosce almeno il numero di core fisici
+    per_core = max(1, len(cpus) // (physical_core_count() or len(cpus)))
+    return [cpus[i:i + per_core] for i in range(0, len(cpus), per_core)]
+
+def physical_core_count():
+    # Numero di core fisici secondo psutil, o None se psutil non è installato.
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.cpu_count(logical=False)
+
+def extraction_workers(file_path, cores):
+    # Processi dell'estrazione del testo che in --stream lavorano insieme ai processi di BERT:
+    # solo i PDF si estraggono in parallelo (vedi readers.iter_pdf_page_texts).
+    if os.path.splitext(file_path)[1].lower() != ".pdf":
+        return 0
+    return max(1, cores // STREAM_EXTRACTION_SHARE)
+
+def estimated_makespan(chapter_chars, workers, threads):
+    # Tempo stimato (in caratteri per thread equivalente) assegnando i capitoli dal più lungo
+    # al processo meno carico, come fa la coda ordinata di batch_analysis.
+    loads = [0] * workers
+    for chars in sorted(chapter_chars, reverse=True):
+        loads[loads.index(min(loads))] += chars
+    return max(loads) / threads ** THREAD_EFFICIENCY
+
+def plan_workers(chapter_chars, cores, workers=None, threads=None):
+    # Divide i core tra processi e thread di torch per processo, senza superare il numero di core.
+    # Con molti capitoli simili conviene un processo per core; con pochi capitoli o uno molto
+    # più lungo degli altri conviene dare più thread a meno processi.
+    if workers and threads:
+        return workers, threads
+    if workers:
+        return workers, max(1, cores // workers)
+    if threads:
+        return max(1, cores // threads), threads
+    if not chapter_chars:
+        # Capitoli non ancora noti (streaming): un processo per core
+        return cores, 1
+    candidates = range(1, min(cores, len(chapter_chars)) + 1)
+    workers = min(candidates, key=lambda w: estimated_makespan(chapter_chars, w, cores // w))
+    return workers, cores // workers
+
+def core_groups_for(workers, threads, cores, pin):
+    # CPU logiche di ogni processo: threads core fisici a testa, con i loro thread SMT, così due
+    # processi non condividono mai un core fisico; il pinning si applica solo se i core bastano.
+    if not pin or not hasattr(os, "sched_setaffinity") or workers * threads > len(cores):
+        return None
+    return [[cpu for core in cores[i * threads:(i + 1) * threads] for cpu in core] for i in range(workers)]
+
+def create_pool(num_workers, execution, threads=1, core_groups=None):
+    placement = (threads, core_groups, multiprocessing.Value("i", 0))
+    load_libraries()
+    if execution == "shared":
+        # I tensori del modello vengono spostati in memoria condivisa: i processi
+        # ricevono solo i riferimenti, non una copia dei pesi
+        model.share_memory()
+        return torch.multiprocessing.Pool(processes=num_workers, initializer=init_shared_worker, initargs=(tokenizer, model, backend, placement))
+    return multiprocessing.Pool(processes=num_workers, initializer=init_private_worker, initargs=(backend, placement))
+
+def start_workers(chapter_chars, execution, workers=None, threads=None, pin=True, reserved=0):
+    # Sceglie la suddivisione dei core fisici e crea il Pool; in modalità "single" restituisce None.
+    # reserved: core fisici lasciati ai processi che lavorano insieme a BERT (estrazione del testo).
+    cores = available_cores()
+    cores = cores[:max(1, len(cores) - reserved)]
+    if execution == "single":
+        load_libraries()
+        torch.set_num_threads(threads or len(cores))
+        print(f"Pianificazione: 1 processo x {torch.get_num_threads()} thread", flush=True)
+        return None
+    num_workers, num_threads = plan_workers(chapter_chars, len(cores), workers, threads)
+    if not workers and chapter_chars:
+        num_workers = min(num_workers, len(chapter_chars))
+    core_groups = core_groups_for(num_workers, num_threads, cores, pin)
+    reserved_note = f", {reserved} lasciati all'estrazione del testo" if reserved else ""
+    print(f"Pianificazione: {num_workers} processi x {num_threads} thread su {len(cores)} core fisici{reserved_note}"
+          f"{' (processi vincolati ai core)' if core_groups else ''}", flush=True)
+    return create_pool(num_workers, execution, num_threads, core_groups)
+
+def analyze_batch_job(item):
+    book_id, job = item
+    return book_id, analyze_chapter_job(job)
+
+def batch_analysis(books, mode="chunked", batch_size=DEFAULT_BATCH_SIZE, execution="shared", cache_dir=None, progress=None, resume=False, workers=None, threads=None, pin=True, final=True):
+    # Analizza i capitoli di più libri con un'unica coda e un unico Pool.
+    # books è una lista di (book_name, chapters, text, output_dir, file_path): il testo di ogni libro
+    # viene tolto dalla lista (sostituito da None) appena copiato nel blocco condiviso.
+    # final=False se seguiranno altri gruppi di libri (vedi run_batch).
+    progress = progress or ProgressReporter(False)
+
+    # Gli embedding vengono scritti solo da questo processo, man mano che i capitoli terminano
+    stores = []
+    selected = []  # Per ogni libro, (caratteri, capitolo, inizio, fine) dei capitoli da analizzare
+    for book_name, chapters, text, output_dir, file_path in books:
+        store = EmbeddingStore(output_dir, book_name, MODEL_NAME, file_path)
+        store.retain(chapters)
+        stores.append(store)
+
+        book_chapters = []
+        for chapter_number, (start_byte, end_byte) in chapter_ranges(chapters, len(text)).items():
+            # Con --resume si saltano i capitoli già completati con lo stesso testo
+            if resume and store.is_completed(chapter_number, embedding_cache_key(text[start_byte:end_byte], mode)):
+                continue
+            book_chapters.append((end_byte - start_byte, chapter_number, start_byte, end_byte))
+        if resume:
+            print(f"Ripresa dell'analisi di {book_name}: {len(chapters) - len(book_chapters)} capitoli già completati, {len(book_chapters)} da analizzare")
+        store.mark_pending(chapter[1] for chapter in book_chapters)
+        selected.append(book_chapters)
+    text = None
+
+    # Un capitolo alla volta: la dimensione del blocco, poi la copia codificata. Il blocco nasce prima
+    # del Pool, così i processi condividono il resource tracker di questo processo, che lo elimina a fine analisi
+    size = sum(utf8_length(books[book_id][2][start:end]) for book_id, book_chapters in enumerate(selected) for _, _, start, end in book_chapters)
+    shared_text = SharedTextBuffer(size) if any(selected) else None
+    jobs = []
+    for book_id, book_chapters in enumerate(selected):
+        for chars, chapter_number, start, end in book_chapters:
+            descriptor = shared_text.append(books[book_id][2][start:end])
+            jobs.append((chars, book_id, (chapter_number, descriptor, mode, batch_size, cache_dir)))
+        books[book_id] = books[book_id][:2] + (None,) + books[book_id][3:]  # Il testo è nel blocco condiviso
+
+    # I capitoli più lunghi partono per primi (la lunghezza in caratteri approssima quella in token):
+    # i processi ricevono lavoro fino alla fine e terminano quasi insieme
+    jobs.sort(key=lambda job: job[0], reverse=True)
+    chapter_chars = [job[0] for job in jobs]
+    progress.add_chapters(chapter_chars, final=final)
+    jobs = [(book_id, job) for _, book_id, job in jobs]
+
+    start_time = time.perf_counter()
+    results = []
+    pool = None
+    try:
+        with metrics.stage("pool_start"):
+            pool = start_workers(chapter_chars, execution, workers, threads, pin) if jobs else None
+        # Senza Pool (modalità "single") il modello resta in memoria una volta e usa tutti i thread di torch
+        completed = map(analyze_batch_job, jobs) if pool is None else pool.imap_unordered(analyze_batch_job, jobs)
+        dispatched = time.time()  # Tutti i capitoli sono in coda da qui: l'attesa di ognuno parte da questo istante
+        writer = ResultWriter()
+        with metrics.stage("analysis"):
+            for book_id, result in completed:
+                writer.submit(finish_chapter, stores[book_id], books[book_id][0], result, dispatched, progress, results)
+            writer.close()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if shared_text is not None:
+            shared_text.close()
+
+    # Throughput complessivo: token elaborati rispetto al tempo reale dell'analisi
+    elapsed = time.perf_counter() - start_time
+    total_tokens = sum(result["tokens"] for result in results)
+    print(f"Token elaborati: {total_tokens} in {elapsed:.2f} s ({total_tokens / elapsed:.0f} token/s)")
+    report_occupancy(results, elapsed, writer)
+    return results
+
+def streaming_analysis(file_path, book_name, output_dir, mode="chunked", batch_size=DEFAULT_BATCH_SIZE, execution="shared", cache_dir=None, progress=None, resume=False, segmentation="lines", workers=None, threads=None, pin=True):
+    # Analizza il libro mentre viene letto: ogni capitolo parte appena il segmentatore lo completa.
+    progress = progress or ProgressReporter(False)
+    store = EmbeddingStore(output_dir, book_name, MODEL_NAME, file_path)
+    segmenter = StreamingSegmenter(LineDetector() if segmentation == "lines" else LegacyDetector())
+    dispatched = {}  # Capitolo -> intervallo dell'ultimo segmento inviato
+    dispatch_times = {}  # (capitolo, intervallo) -> orario di invio, per l'attesa in coda
+    tasks = []
+    results = []
+
+    def collect(result, chapter_range):
+        # Un capitolo ridefinito più avanti nel testo (es. un indice senza numeri di pagina)
+        # viene rianalizzato: conta solo il risultato dell'ultimo segmento inviato
+        if dispatched.get(result["chapter"]) == chapter_range:
+            writer.submit(finish_chapter, store, book_name, result, dispatch_times[(result["chapter"], chapter_range)], progress, results)
+        else:
+            writer.submit(progress.chapter_done, result)
+
+    def collect_ready(wait=False):
+        for chapter_range, task in list(tasks):
+            if wait or task.ready():
+                collect(task.get(), chapter_range)
+                tasks.remove((chapter_range, task))
+
+    def dispatch(segments, final=False):
+        segments = list(segments)
+        if resume:
+            # Con --resume si saltano i capitoli già completati con lo stesso testo
+            for chapter_num, start, end, chapter_text in segments:
+                if store.is_completed(chapter_num, embedding_cache_key(chapter_text, mode)):
+                    print(f"Capitolo {chapter_num} già completato", flush=True)
+                    dispatched[chapter_num] = (start, end)
+            segments = [segment for segment in segments if dispatched.get(segment[0]) != (segment[1], segment[2])]
+        if segments or final:
+            progress.add_chapters([len(chapter_text) for _, _, _, chapter_text in segments], final)
+        for chapter_num, start, end, chapter_text in segments:
+            print(f"Capitolo {chapter_num} individuato", flush=True)
+            dispatched[chapter_num] = (start, end)
+            writer.submit(store.add_pending, chapter_num)
+            job = (chapter_num, chapter_text, mode, batch_size, cache_dir)
+            dispatch_times[(chapter_num, (start, end))] = time.time()
+            if pool is None:
+                collect(analyze_chapter_job(job), (start, end))
+            else:
+                tasks.append(((start, end), pool.apply_async(analyze_chapter_job, (job,))))
+        collect_ready()
+
+    start_time = time.perf_counter()
+    # I capitoli non sono ancora noti: la pianificazione usa solo il numero di core
+    writer = ResultWriter()  # Le operazioni sull'archivio passano tutte da qui, nell'ordine di invio
+    # Un PDF grande si estrae con più processi mentre BERT lavora: i loro core non vanno al Pool
+    extraction = extraction_workers(file_path, len(available_cores()))
+    with metrics.stage("pool_start"):
+        pool = start_workers([], execution, workers, threads, pin, extraction)
+    try:
+        # Lettura, ricerca dei capitoli e analisi si sovrappongono: una sola fase "analysis"
+        with metrics.stage("analysis"):
+            for piece in iter_book(file_path, extraction or None):
+                dispatch(segmenter.feed(piece))
+            dispatch(segmenter.finish(), final=True)
+            collect_ready(wait=True)
+
+        # I capitoli i cui confini definitivi differiscono da quelli inviati vengono riletti e rianalizzati
+        final_ranges = chapter_ranges(segmenter.chapters, segmenter.length)
+        changed = {chapter_num: chapter_range for chapter_num, chapter_range in final_ranges.items()
+                   if dispatched.get(chapter_num) != chapter_range}
+        if changed:
+            print(f"Confini cambiati per {len(changed)} capitoli, rileggo il testo")
+            with metrics.stage("analysis"):
+                texts = read_ranges(file_path, changed)
+                dispatch(((chapter_num, start, end, texts[chapter_num]) for chapter_num, (start, end) in changed.items()), final=True)
+                collect_ready(wait=True)
+        writer.submit(store.retain, segmenter.chapters)
+        writer.close()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    elapsed = time.perf_counter() - start_time
+    total_tokens = sum(result["tokens"] for result in results)
+    print(f"Token elaborati: {total_tokens} in {elapsed:.2f} s ({total_tokens / elapsed:.0f} token/s)")
+    report_occupancy(results, elapsed, writer)
+    return results, segmenter.chapters, segmenter.length, segmenter.titles
+
+def calculate_page_ranges(chapters, text_length):
     page_ranges = {}
-    chapter_list = sorted(chapters.items())
-    for i in range(len(chapter_list)):
-        chapter_number, start_byte = chapter_list[i]
-        end_byte = chapter_list[i + 1][1] if i + 1 < len(chapter_list) else len(text)
-        
+    for chapter_number, (start_byte, end_byte) in chapter_ranges(chapters, text_length).items():
         start_page = start_byte // PAGE_SIZE + 1
         end_page = end_byte // PAGE_SIZE + 1
         
@@ -143,22 +1250,19 @@ def calculate_page_ranges(chapters, text):
 
 # -------------------- MAIN --------------------
 
-def main():
-    input_file = sys.argv
-    
-    if len(input_file) < 2:
-        print("Errore: specificare il file da analizzare.")
-        sys.exit(1)
-    
-    file_path = input_file[1]
-    if not os.path.exists(file_path):
-        print("Errore: file non trovato.")
-        sys.exit(2)
+def write_summary(summary_file, page_ranges, titles=None):
+    # La colonna "Titolo" c'è solo se la segmentazione ha trovato i titoli dei capitoli.
+    with open(summary_file, "w", newline='', encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Capitolo", "Range Pagine"] + (["Titolo"] if titles else []))
+        for chapter, (start_page, end_page) in page_ranges.items():
+            writer.writerow([chapter, f"{start_page}-{end_page}"] + ([titles.get(chapter, "")] if titles else []))
 
-    book_name = os.path.splitext(os.path.basename(file_path))[0]
-    output_dir = os.path.join(os.getcwd(), "analyses", book_name)
-    os.makedirs(output_dir, exist_ok=True)
-    text = read_book(file_path)
+def find_book_chapters(text, segmentation="lines"):
+    # Restituisce ({capitolo: posizione}, {capitolo: titolo}).
+    if segmentation == "lines":
+        chapters, titles = segment_text(text)
+        return chapters or divide_by_fixed_length(text), titles
 
     # Cerca prima l'indice
     index_sections = find_index_section(text)
@@ -167,27 +1271,257 @@ def main():
     chapters = find_chapters(text) if not index_sections else None
 
     # Se nessuno dei due metodi ha funzionato, divide manualmente
-    final_chapters = index_sections or chapters or divide_by_fixed_length(text)
+    return index_sections or chapters or divide_by_fixed_length(text), {}
+
+def book_output_dir(file_path):
+    book_name = os.path.splitext(os.path.basename(file_path))[0]
+    output_dir = os.path.join(os.getcwd(), "analyses", book_name)
+    os.makedirs(output_dir, exist_ok=True)
+    return book_name, output_dir
+
+def prepare_book(file_path, progress, segmentation="lines"):
+    # Legge il libro, individua i capitoli e scrive il riepilogo delle pagine.
+    book_name, output_dir = book_output_dir(file_path)
+    with metrics.stage("read", book_name):
+        text = read_book(file_path)
+    with metrics.stage("segment", book_name):
+        final_chapters, titles = find_book_chapters(text, segmentation)
 
     print("Capitoli individuati:")
     for chapter, _ in final_chapters.items():
         print(f"Capitolo {chapter}")
 
-    # Calcola i range delle pagine per ogni capitolo
-    page_ranges = calculate_page_ranges(final_chapters, text)
+    # Il riepilogo con i range delle pagine è pronto prima dell'analisi: la GUI può già mostrare i capitoli
+    summary_file = os.path.join(output_dir, f"{book_name}-analysis.csv")
+    with metrics.stage("summary_write", book_name):
+        write_summary(summary_file, calculate_page_ranges(final_chapters, len(text)), titles)
+    progress.emit("summary", file=summary_file)
+    return book_name, final_chapters, text, output_dir, file_path
+
+def collect_book_files(paths):
+    # Espande le cartelle nei libri che contengono (TXT, PDF, DOCX), in ordine alfabetico.
+    # Restituisce anche i percorsi indicati che non esistono.
+    files = []
+    missing = []
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, names in sorted(os.walk(path)):
+                files += [os.path.join(folder, name) for name in sorted(names)
+                          if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS]
+        elif os.path.exists(path):
+            files.append(path)
+        else:
+            missing.append(path)
+    # Lo stesso libro indicato due volte (es. una cartella e un suo file) si analizza una volta sola
+    unique = {}
+    for file_path in files:
+        unique.setdefault(os.path.normcase(os.path.realpath(file_path)), file_path)
+    return list(unique.values()), missing
+
+def book_name_conflicts(files):
+    # Nomi di libro (quindi cartelle di analyses/) condivisi da file diversi, come {nome: [percorsi]}.
+    by_name = {}
+    for file_path in files:
+        book_name = os.path.splitext(os.path.basename(file_path))[0]
+        by_name.setdefault(os.path.normcase(book_name), []).append(file_path)
+    return {os.path.splitext(os.path.basename(paths[0]))[0]: paths for paths in by_name.values() if len(paths) > 1}
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Analisi dei capitoli di un libro con BERT")
+    parser.add_argument("file", nargs="?", help="file TXT, PDF o DOCX da analizzare")
+    parser.add_argument("--batch", nargs="+", metavar="PERCORSO",
+                        help="analizza insieme più libri (file o cartelle) con un'unica coda di capitoli")
+    parser.add_argument("--embedding", choices=EMBEDDING_MODES, default="chunked",
+                        help="chunked: finestre sovrapposte su tutto il capitolo; truncate: solo i primi 512 token")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="numero di finestre per forward pass (default: %(default)s)")
+    parser.add_argument("--execution", choices=EXECUTION_MODES, default="shared",
+                        help="come distribuire il modello tra i processi (default: %(default)s)")
+    parser.add_argument("--backend", choices=BACKENDS, default="fp32",
+                        help="precisione dell'inferenza su CPU: int8 quantizza i Linear, bf16 usa l'autocast "
+                             "se la CPU lo supporta (default: %(default)s)")
+    parser.add_argument("--workers", type=int,
+                        help="numero di processi del Pool (default: scelto in base a core e capitoli)")
+    parser.add_argument("--threads", type=int,
+                        help="thread di torch per processo (default: core disponibili divisi per i processi)")
+    parser.add_argument("--no-pin", action="store_true", help="non vincolare i processi a gruppi di core")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="cartella della cache degli embedding (default: %(default)s)")
+    parser.add_argument("--cache-size-mb", type=int, default=DEFAULT_CACHE_SIZE_MB,
+                        help="dimensione massima della cache in MB (default: %(default)s)")
+    parser.add_argument("--no-cache", action="store_true", help="non leggere né scrivere la cache degli embedding")
+    parser.add_argument("--text-cache-dir", default=DEFAULT_TEXT_CACHE_DIR,
+                        help="cartella della cache del testo estratto, condivisa con la GUI (default: %(default)s)")
+    parser.add_argument("--text-cache-size-mb", type=int, default=DEFAULT_TEXT_CACHE_SIZE_MB,
+                        help="dimensione massima della cache del testo in MB (default: %(default)s)")
+    parser.add_argument("--no-text-cache", action="store_true", help="estrae sempre il testo dal file originale")
+    parser.add_argument("--stream", action="store_true",
+                        help="legge il libro a pagine e avvia l'analisi di ogni capitolo appena è completo")
+    parser.add_argument("--segmentation", choices=SEGMENTATION_MODES, default="lines",
+                        help="lines: intestazioni di capitoli e parti a inizio riga (anche numeri romani); "
+                             "legacy: regole originali (default: %(default)s)")
+    parser.add_argument("--resume", action="store_true",
+                        help="analizza solo i capitoli mancanti, non riusciti o modificati dall'ultima esecuzione")
+    parser.add_argument("--progress", action="store_true",
+                        help=f"emette l'avanzamento come righe JSON precedute da '{PROGRESS_PREFIX.strip()}'")
+    parser.add_argument("--profile", choices=PROFILERS,
+                        help="salva un profilo dell'esecuzione accanto al riepilogo: cprofile (file .prof) "
+                             "o torch (traccia JSON di torch.profiler); copre solo il processo principale")
+    parser.add_argument("--no-service", action="store_true",
+                        help="esegue l'analisi in questo processo anche se il servizio di analisi è avviato")
+    parser.add_argument("--service-port", type=int, default=DEFAULT_SERVICE_PORT,
+                        help="porta locale del servizio di analisi (default: %(default)s)")
+    args = parser.parse_args(argv)
+    if args.batch_size < 1:
+        parser.error("--batch-size deve essere almeno 1")
+    if (args.workers is not None and args.workers < 1) or (args.threads is not None and args.threads < 1):
+        parser.error("--workers e --threads devono essere almeno 1")
+    if args.batch and (args.file or args.stream):
+        parser.error("--batch non si può usare insieme a un singolo file o a --stream")
+    return args
+
+def prepare_model(execution):
+    # Il modello viene caricato una sola volta, prima di creare il Pool
+    with metrics.stage("model_load"):
+        if execution != "per-worker":
+            load_model()
+        else:
+            load_libraries()  # Ogni processo caricherà il proprio modello, ma senza ripetere le importazioni
+
+def finish_run(args, results, cache_dir):
+    # Statistiche della cache e codice di uscita comuni ad analisi singola e batch.
+    if cache_dir:
+        hits = sum(1 for result in results if result["cache_hit"])
+        removed = evict_embedding_cache(cache_dir, args.cache_size_mb)
+        print(f"Cache embedding: {hits} hit, {len(results) - hits} miss, {removed} voci eliminate")
+
+    failed = [result for result in results if "error" in result]
+    if failed:
+        chapters = ", ".join(f"{result['book']} capitolo {result['chapter']}" for result in failed)
+        print(f"Errore: analisi non riuscita per {chapters}. Rilanciare con --resume.")
+        sys.exit(3)
+
+def save_metrics(args, books):
+    # Un file di metriche per libro, accanto al riepilogo; books contiene (book_name, output_dir, file_path).
+    for book_name, output_dir, file_path in books:
+        metrics_file = os.path.join(output_dir, f"{book_name}-metrics.json")
+        write_metrics(metrics_file, book_name, file=os.path.abspath(file_path), execution=args.execution, backend=backend,
+                      embedding=args.embedding, batch_size=args.batch_size, profile=args.profile)
+    print(f"Metriche salvate in {metrics_file}" if len(books) == 1 else f"Metriche salvate per {len(books)} libri")
 
-    # Analisi parallela
-    parallel_analysis(book_name, final_chapters, text, output_dir)
+def run_batch(args, cache_dir, progress):
+    files, missing = collect_book_files(args.batch)
+    if missing:
+        print(f"Errore: file non trovato: {', '.join(missing)}")
+        sys.exit(2)
+    if not files:
+        print("Errore: nessun libro trovato.")
+        sys.exit(2)
+    conflicts = book_name_conflicts(files)
+    if conflicts:
+        # Libri con lo stesso nome finirebbero nella stessa cartella di analyses/, sovrascrivendosi
+        print("Errore: più libri con lo stesso nome; rinominarli o analizzarli separatamente:")
+        for book_name, paths in conflicts.items():
+            print(f"  {book_name}: {', '.join(paths)}")
+        sys.exit(2)
+    select_backend(args.backend)
+    analyses_dir = os.path.join(os.getcwd(), "analyses")
+    os.makedirs(analyses_dir, exist_ok=True)
+
+    with profiling(args.profile, os.path.join(analyses_dir, "batch")):
+        # I libri si leggono e si analizzano a gruppi di circa BATCH_GROUP_CHARS caratteri:
+        # in memoria c'è al più il testo di un gruppo, non quello dell'intera raccolta
+        books = []  # (book_name, output_dir, file_path) dei libri già analizzati
+        results = []
+        group, group_chars = [], 0
+        for index, file_path in enumerate(files):
+            print(f"Lettura di {file_path}")
+            group.append(prepare_book(file_path, progress, args.segmentation))
+            group_chars += len(group[-1][2])
+            last = index == len(files) - 1
+            if group_chars < BATCH_GROUP_CHARS and not last:
+                continue
+            if not books:
+                prepare_model(args.execution)
+            if not last or books:
+                print(f"Analisi del gruppo di libri letto: {len(group)} libri, {group_chars} caratteri")
+            results += batch_analysis(group, args.embedding, args.batch_size, args.execution, cache_dir, progress, args.resume,
+                                      args.workers, args.threads, not args.no_pin, final=last)
+            books += [(book[0], book[3], book[4]) for book in group]
+            group, group_chars = [], 0
+
+        save_metrics(args, books)
+        finish_run(args, results, cache_dir)
+
+    print(f"Analisi completata per {len(books)} libri. Riepiloghi salvati in {os.path.join(os.getcwd(), 'analyses')}")
+    progress.emit("done", books=len(books))
+    sys.exit(0)
+
+def main():
+    argv = sys.argv[1:]
+    args = parse_arguments(argv)
+    if not args.no_service:
+        # Con il servizio di analisi avviato il modello è già caricato: il lavoro passa a lui
+        code = run_in_service(argv, os.getcwd(), print, port=args.service_port)
+        if code is not None:
+            sys.exit(code)
+    run(argv)
+
+def run(argv):
+    # Esecuzione completa nel processo corrente; termina sempre con sys.exit.
+    global metrics
+    metrics = RunMetrics()
+    args = parse_arguments(argv)
+    cache_dir = None if args.no_cache else os.path.abspath(args.cache_dir)
+    configure_text_cache(None if args.no_text_cache else args.text_cache_dir, args.text_cache_size_mb)
+    progress = ProgressReporter(args.progress)
+    if args.profile and args.execution != "single":
+        print("Avviso: il profilo copre solo il processo principale; con --execution single include anche l'inferenza")
+
+    if args.batch:
+        run_batch(args, cache_dir, progress)
+    
+    if not args.file:
+        print("Errore: specificare il file da analizzare.")
+        sys.exit(1)
+    
+    file_path = args.file
+    if not os.path.exists(file_path):
+        print("Errore: file non trovato.")
+        sys.exit(2)
+    select_backend(args.backend)
 
-    # Creazione del file di riepilogo
+    book_name, output_dir = book_output_dir(file_path)
     summary_file = os.path.join(output_dir, f"{book_name}-analysis.csv")
-    with open(summary_file, "w", newline='', encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["Capitolo", "Range Pagine"])
-        for chapter, (start_page, end_page) in page_ranges.items():
-            writer.writerow([chapter, f"{start_page}-{end_page}"])
+
+    with profiling(args.profile, os.path.join(output_dir, book_name)):
+        if args.stream:
+            # Lettura, ricerca dei capitoli e analisi procedono insieme
+            prepare_model(args.execution)
+            results, final_chapters, text_length, titles = streaming_analysis(file_path, book_name, output_dir, args.embedding, args.batch_size, args.execution, cache_dir, progress, args.resume, args.segmentation,
+                                                                              args.workers, args.threads, not args.no_pin)
+            print("Capitoli individuati:")
+            for chapter in sorted(final_chapters):
+                print(f"Capitolo {chapter}")
+            with metrics.stage("summary_write", book_name):
+                write_summary(summary_file, calculate_page_ranges(final_chapters, text_length), titles)
+            progress.emit("summary", file=summary_file)
+            for result in results:
+                result["book"] = book_name
+        else:
+            # Il riepilogo dei capitoli è pronto prima di caricare il modello
+            books = [prepare_book(file_path, progress, args.segmentation)]
+            prepare_model(args.execution)
+
+            # Analisi parallela
+            results = batch_analysis(books, args.embedding, args.batch_size, args.execution, cache_dir, progress, args.resume,
+                                     args.workers, args.threads, not args.no_pin)
+
+        save_metrics(args, [(book_name, output_dir, file_path)])
+        finish_run(args, results, cache_dir)
 
     print(f"Analisi completata. Riepilogo salvato in {summary_file}")
+    progress.emit("done", file=summary_file)
     sys.exit(0)
 
 if __name__ == "__main__":
@@ -0,0 +1,372 @@
+import sys
+import os
+import argparse
+import hashlib
+import hmac
+import io
+import json
+import queue
+import secrets
+import socket
+import socketserver
+import threading
+import time
+import traceback
+import contextlib
+
+# Servizio di analisi persistente: un processo che tiene il modello caricato ed esegue le analisi
+# richieste da gui.py e dalla riga di comando, evitando a ogni lavoro l'avvio dell'interprete,
+# l'importazione di torch/transformers e il caricamento di BERT.
+#
+# Avvio:   python analysis_service.py [--port 50515] [--backend fp32]
+# Arresto: python analysis_service.py --stop       Stato: python analysis_service.py --status
+#
+# Protocollo: connessione TCP su 127.0.0.1, un messaggio JSON per riga in entrambe le direzioni.
+# Ogni connessione inizia con un'autenticazione reciproca basata su una chiave casuale che il
+# servizio crea all'avvio in un file leggibile solo dal suo utente (vedi service_key_path):
+#   client:   {"hello": nonce_client, "version": 2}
+#   servizio: {"event": "challenge", "nonce": nonce_servizio, "proof": HMAC(chiave, "service:" + nonce_client)}
+#   client:   la richiesta, con "auth": HMAC(chiave, "client:" + nonce_servizio)
+# Così solo l'utente che ha avviato il servizio può usarlo, e il client non manda lavori a un
+# altro processo in ascolto sulla stessa porta. Le richieste:
+#   {"command": "ping"}                                   -> {"event": "pong", ...}
+#   {"command": "shutdown"}                               -> {"event": "stopping"}
+#   {"command": "analyze", "argv": [...], "cwd": "..."}
+#       -> {"event": "queued", "position": n}  lavori in coda prima di questo
+#       -> {"event": "output", "line": "..."}  ogni riga stampata dall'analisi (anche "PROGRESS ...")
+#       -> {"event": "exit", "code": n}        codice di uscita, come quello di analysis.py
+#   In caso di richiesta non valida o non autenticata: {"event": "error", "message": "..."}
+#
+# Gli argomenti sono quelli di analysis.py e vengono eseguiti da analysis.run nella cartella
+# di lavoro del client, un lavoro alla volta: le richieste concorrenti restano in coda.
+# Le righe stampate dai processi del Pool non passano dal servizio e restano nel suo terminale.
+
+SERVICE_HOST = "127.0.0.1"  # Solo connessioni locali
+DEFAULT_SERVICE_PORT = 50515
+SERVICE_PROTOCOL_VERSION = 2
+CONNECT_TIMEOUT_S = 0.5  # Un servizio non avviato rifiuta subito la connessione
+HANDSHAKE_TIMEOUT_S = 5.0  # Attesa massima della risposta all'autenticazione
+SERVICE_KEY_DIR = os.path.join(os.path.expanduser("~"), ".analysis_service")  # Cartella 0700 delle chiavi
+MAX_REQUEST_BYTES = 1 << 20
+
+def connect(port=DEFAULT_SERVICE_PORT):
+    try:
+        return socket.create_connection((SERVICE_HOST, port), timeout=CONNECT_TIMEOUT_S)
+    except OSError:
+        return None
+
+def send_message(connection, message):
+    connection.sendall((json.dumps(message) + "\n").encode("utf-8"))
+
+def service_key_path(port):
+    return os.path.join(SERVICE_KEY_DIR, f"service-{port}.key")
+
+def read_service_key(port):
+    try:
+        with open(service_key_path(port), "r", encoding="ascii") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def write_service_key(port):
+    # Nuova chiave a ogni avvio, in un file accessibile solo all'utente che avvia il servizio.
+    os.makedirs(SERVICE_KEY_DIR, mode=0o700, exist_ok=True)
+    os.chmod(SERVICE_KEY_DIR, 0o700)
+    path = service_key_path(port)
+    key = secrets.token_hex(32)
+    descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.chmod(path, 0o600)
+    with os.fdopen(descriptor, "w", encoding="ascii") as f:
+        f.write(key)
+    return key
+
+def proof(key, role, nonce):
+    return hmac.new(key.encode("ascii"), f"{role}:{nonce}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+def open_session(port):
+    # Connessione autenticata al servizio: (connessione, risposte, prova del client), oppure None
+    # se il servizio non è avviato, la chiave manca o chi risponde non conosce la chiave.
+    key = read_service_key(port)
+    connection = connect(port) if key else None
+    if connection is None:
+        return None
+    replies = connection.makefile("r", encoding="utf-8")
+    try:
+        connection.settimeout(HANDSHAKE_TIMEOUT_S)
+        client_nonce = secrets.token_hex(16)
+        send_message(connection, {"hello": client_nonce, "version": SERVICE_PROTOCOL_VERSION})
+        challenge = json.loads(replies.readline())
+        if not hmac.compare_digest(str(challenge["proof"]), proof(key, "service", client_nonce)):
+            raise ValueError("prova del servizio non valida")
+        return connection, replies, proof(key, "client", str(challenge["nonce"]))
+    except (OSError, ValueError, KeyError, TypeError):
+        replies.close()
+        connection.close()
+        return None
+
+def service_request(message, port=DEFAULT_SERVICE_PORT):
+    # Richiesta breve (ping, shutdown): prima risposta del servizio, o None se non è avviato.
+    session = open_session(port)
+    if session is None:
+        return None
+    connection, replies, client_proof = session
+    with connection, replies:
+        try:
+            send_message(connection, {**message, "auth": client_proof})
+            reply = json.loads(replies.readline())
+        except (OSError, ValueError):
+            return None  # Nessuna risposta, o un processo che non è il servizio
+    return reply if isinstance(reply, dict) and "event" in reply else None
+
+def run_in_service(argv, cwd, on_line, on_event=None, port=DEFAULT_SERVICE_PORT):
+    # Esegue analysis.py con gli argomenti argv nel servizio; on_line riceve ogni riga di output,
+    # on_event gli altri eventi ("queued"). Restituisce il codice di uscita, oppure None se il
+    # servizio non è avviato o non accetta il lavoro: in quel caso l'analisi va eseguita altrove.
+    session = open_session(port)
+    if session is None:
+        return None
+    connection, replies, client_proof = session
+    connection.settimeout(None)  # Un'analisi può durare a lungo
+    with connection, replies:
+        accepted = False
+        try:
+            send_message(connection, {"command": "analyze", "argv": list(argv), "cwd": os.path.abspath(cwd),
+                                      "auth": client_proof})
+            for line in replies:
+                event = json.loads(line)
+                if event["event"] == "output":
+                    on_line(event["line"])
+                elif event["event"] == "exit":
+                    return event["code"]
+                elif event["event"] == "error":
+                    return None
+                else:
+                    accepted = True
+                    if on_event:
+                        on_event(event)
+        except (OSError, ValueError, KeyError, TypeError):
+            pass  # Connessione interrotta o risposta che non viene dal servizio
+    if not accepted:
+        return None
+    on_line("Errore: connessione con il servizio di analisi interrotta.")
+    return 1
+
+class LineForwarder(io.TextIOBase):
+    # Sostituisce stdout e stderr durante un lavoro: ogni riga completa diventa un evento "output".
+    # Scrivono sia il thread principale dell'analisi sia il thread di scrittura dei risultati.
+
+    def __init__(self, events):
+        self.events = events
+        self.pending = ""
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if os.getpid() != self.pid:
+            # Processo del Pool creato con fork durante il lavoro: scrive sul terminale del servizio
+            return sys.__stdout__.write(text)
+        with self.lock:
+            *lines, self.pending = (self.pending + text).split("\n")
+            for line in lines:
+                self.events.put({"event": "output", "line": line})
+        return len(text)
+
+    def close_lines(self):
+        with self.lock:
+            if self.pending:
+                self.events.put({"event": "output", "line": self.pending})
+                self.pending = ""
+
+class AnalysisJob:
+    def __init__(self, argv, cwd):
+        self.argv = argv
+        self.cwd = cwd
+        self.events = queue.Queue()  # Eventi per il client, letti dal thread della connessione
+
+class AnalysisService:
+    # Coda dei lavori e thread che li esegue uno alla volta con il modello già caricato.
+
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.waiting = 0  # Lavori in coda o in esecuzione
+        self.completed = 0
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.default_threads = None
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def submit(self, job):
+        # Restituisce il numero di lavori da completare prima di questo.
+        with self.lock:
+            position = self.waiting
+            self.waiting += 1
+        self.jobs.put(job)
+        return position
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                code = self.execute(job)
+            finally:
+                with self.lock:
+                    self.waiting -= 1
+                    self.completed += 1
+            job.events.put({"event": "exit", "code": code})
+
+    def execute(self, job):
+        import analysis
+        log(f"Lavoro: {' '.join(job.argv)} (in {job.cwd})")
+        start_time = time.perf_counter()
+        forwarder = LineForwarder(job.events)
+        service_dir = os.getcwd()
+        code = 1
+        # La cartella di lavoro e stdout sono dell'intero processo: per questo i lavori sono sequenziali
+        with contextlib.redirect_stdout(forwarder), contextlib.redirect_stderr(forwarder):
+            try:
+                os.chdir(job.cwd)
+                analysis.run(job.argv)
+                code = 0
+            except SystemExit as exit_request:
+                code = exit_request.code if isinstance(exit_request.code, int) else (0 if exit_request.code is None else 1)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                os.chdir(service_dir)
+                if analysis.torch is not None and self.default_threads:
+                    analysis.torch.set_num_threads(self.default_threads)  # --threads vale solo per il proprio lavoro
+        forwarder.close_lines()
+        log(f"Lavoro terminato con codice {code} in {time.perf_counter() - start_time:.2f} s")
+        return code
+
+    def status(self):
+        import analysis
+        return {"event": "pong", "version": SERVICE_PROTOCOL_VERSION, "pid": os.getpid(),
+                "model": analysis.MODEL_NAME if analysis.model is not None else None,
+                "backend": analysis.model_backend, "waiting": self.waiting, "completed": self.completed,
+                "uptime_s": round(time.time() - self.started, 1)}
+
+class ServiceRequestHandler(socketserver.StreamRequestHandler):
+    # Una connessione per richiesta; le connessioni sono servite in thread separati.
+
+    def handle(self):
+        request = self.authenticate()
+        if request is None:
+            return
+        service = self.server.service
+        command = request.get("command")
+        if command == "ping":
+            self.reply(service.status())
+        elif command == "shutdown":
+            self.reply({"event": "stopping"})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        elif command == "analyze":
+            if not isinstance(request.get("argv"), list) or not all(isinstance(arg, str) for arg in request["argv"]):
+                return self.reply({"event": "error", "message": "argomenti non validi"})
+            job = AnalysisJob(request["argv"], request.get("cwd") or os.getcwd())
+            position = service.submit(job)
+            try:
+                self.reply({"event": "queued", "position": position})
+                while True:
+                    event = job.events.get()
+                    self.reply(event)
+                    if event["event"] == "exit":
+                        break
+            except OSError:
+                pass  # Client disconnesso: il lavoro prosegue comunque fino alla fine
+        else:
+            self.reply({"event": "error", "message": f"comando sconosciuto: {command}"})
+
+    def read_message(self):
+        message = json.loads(self.rfile.readline(MAX_REQUEST_BYTES))
+        if not isinstance(message, dict):
+            raise ValueError("messaggio non valido")
+        return message
+
+    def authenticate(self):
+        # Scambio di prove con il client (vedi l'intestazione); restituisce la richiesta autenticata o None.
+        key = self.server.key
+        try:
+            hello = self.read_message()
+            if hello.get("version") != SERVICE_PROTOCOL_VERSION or not isinstance(hello.get("hello"), str):
+                self.reply({"event": "error", "message": f"protocollo non supportato (versione {SERVICE_PROTOCOL_VERSION})"})
+                return None
+            service_nonce = secrets.token_hex(16)
+            self.reply({"event": "challenge", "nonce": service_nonce, "proof": proof(key, "service", hello["hello"])})
+            request = self.read_message()
+        except (OSError, ValueError):
+            return None
+        if not hmac.compare_digest(str(request.get("auth", "")), proof(key, "client", service_nonce)):
+            log("Connessione rifiutata: autenticazione non riuscita")
+            with contextlib.suppress(OSError):
+                self.reply({"event": "error", "message": "autenticazione non riuscita"})
+            return None
+        return request
+
+    def reply(self, message):
+        self.wfile.write((json.dumps(message) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+class ServiceServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def log(message):
+    # Messaggi del servizio sul terminale originale, anche mentre stdout è rediretto verso un client.
+    print(f"[{time.strftime('%H:%M:%S')}] {message}", file=sys.__stderr__, flush=True)
+
+def serve(port, backend):
+    import analysis
+    service = AnalysisService()
+    analysis.select_backend(backend)
+    analysis.load_model()
+    service.default_threads = analysis.torch.get_num_threads()
+    try:
+        server = ServiceServer((SERVICE_HOST, port), ServiceRequestHandler)
+    except OSError as error:
+        log(f"Errore: impossibile usare la porta {port}: {error}")
+        sys.exit(2)
+    server.service = service
+    server.key = write_service_key(port)
+    log(f"Servizio di analisi in ascolto su {SERVICE_HOST}:{port} (processo {os.getpid()}, chiave in {service_key_path(port)})")
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # Senza chiave i client non provano nemmeno a connettersi
+            if read_service_key(port) == server.key:
+                with contextlib.suppress(OSError):
+                    os.remove(service_key_path(port))
+    log("Servizio di analisi arrestato")
+
+def parse_arguments(argv):
+    import analysis
+    parser = argparse.ArgumentParser(description="Servizio di analisi con il modello sempre caricato")
+    parser.add_argument("--port", type=int, default=DEFAULT_SERVICE_PORT, help="porta locale (default: %(default)s)")
+    parser.add_argument("--backend", choices=analysis.BACKENDS, default="fp32",
+                        help="backend del modello caricato all'avvio; i lavori possono chiederne un altro (default: %(default)s)")
+    parser.add_argument("--status", action="store_true", help="mostra lo stato del servizio avviato")
+    parser.add_argument("--stop", action="store_true", help="arresta il servizio avviato")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_arguments(sys.argv[1:])
+    if args.status or args.stop:
+        reply = service_request({"command": "shutdown" if args.stop else "ping"}, args.port)
+        if reply is None:
+            print(f"Nessun servizio di analisi sulla porta {args.port}.")
+            sys.exit(1)
+        print("Servizio in arresto." if args.stop else json.dumps(reply, indent=2))
+        sys.exit(0)
+    if service_request({"command": "ping"}, args.port) is not None:
+        print(f"Errore: un servizio di analisi è già avviato sulla porta {args.port}.")
+        sys.exit(2)
+    serve(args.port, args.backend)
+
+if __name__ == "__main__":
+    main()
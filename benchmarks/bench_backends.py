@@ -0,0 +1,99 @@
+# Confronta i backend di inferenza di analysis.py: velocità, memoria e accuratezza rispetto a fp32.
+#
+# Uso: python benchmarks/bench_backends.py [--book libro.txt] [--backends fp32 int8 bf16] [--execution single]
+#
+# Ogni backend analizza lo stesso libro (senza cache) in una cartella separata. Gli embedding
+# dei capitoli vengono poi letti dagli archivi e confrontati con quelli fp32 tramite la
+# similarità del coseno: valori vicini a 1 indicano che il backend non altera i risultati.
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import psutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_model_memory import tree_memory  # noqa: E402
+from common import ANALYSIS_SCRIPT, TOKENS_LINE, write_synthetic_book  # noqa: E402
+from embedding_store import read_chapter_embedding, read_store_index  # noqa: E402
+
+
+def run_backend(book_path, work_dir, backend, execution):
+    process = subprocess.Popen([sys.executable, ANALYSIS_SCRIPT, book_path, "--backend", backend,
+                                "--execution", execution, "--no-cache"],
+                               cwd=work_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    root = psutil.Process(process.pid)
+    peak = {"memory": 0}
+
+    def sample():
+        while process.poll() is None:
+            peak["memory"] = max(peak["memory"], tree_memory(root)[0])
+            time.sleep(0.05)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    tokens, seconds, fallback = 0, float("nan"), False
+    for line in process.stdout:
+        match = TOKENS_LINE.search(line)
+        if match:
+            tokens, seconds = int(match.group(1)), float(match.group(2))
+        fallback = fallback or "non supporta bfloat16" in line
+    process.wait()
+    sampler.join()
+    return {"exit_code": process.returncode, "tokens": tokens, "seconds": seconds,
+            "peak_memory_mb": peak["memory"] / 2**20, "fallback": fallback}
+
+def chapter_embeddings(work_dir, book_name):
+    output_dir = os.path.join(work_dir, "analyses", book_name)
+    index = read_store_index(output_dir, book_name)
+    if not index:
+        return {}
+    return {chapter: read_chapter_embedding(output_dir, book_name, chapter, index) for chapter in index["chapters"]}
+
+def cosine(a, b):
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dei backend di inferenza")
+    parser.add_argument("--book", help="libro di riferimento (TXT, PDF o DOCX); senza, uno sintetico")
+    parser.add_argument("--chapters", type=int, default=8, help="capitoli del libro sintetico")
+    parser.add_argument("--words", type=int, default=1500, help="parole per capitolo del libro sintetico")
+    parser.add_argument("--backends", nargs="+", default=["fp32", "int8", "bf16"])
+    parser.add_argument("--execution", default="single", help="modalità di esecuzione di analysis.py")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        book_path = os.path.abspath(args.book) if args.book else os.path.join(temp_dir, "libro_benchmark.txt")
+        if not args.book:
+            write_synthetic_book(book_path, args.chapters, args.words)
+        book_name = os.path.splitext(os.path.basename(book_path))[0]
+        backends = ["fp32"] + [backend for backend in args.backends if backend != "fp32"]
+
+        print(f"Libro: {book_path}, esecuzione: {args.execution}, CPU: {os.cpu_count()}")
+        print(f"{'backend':<8}{'token/s':>10}{'speedup':>9}{'memoria max (MB)':>18}{'coseno min':>12}{'coseno medio':>14}")
+        reference, baseline = None, None
+        for backend in backends:
+            work_dir = os.path.join(temp_dir, backend)
+            os.makedirs(work_dir)
+            result = run_backend(book_path, work_dir, backend, args.execution)
+            if result["exit_code"] != 0:
+                print(f"{backend:<8} terminato con codice {result['exit_code']}")
+                continue
+            embeddings = chapter_embeddings(work_dir, book_name)
+            if backend == "fp32":
+                reference = embeddings
+            similarities = [cosine(embeddings[chapter], reference[chapter])
+                            for chapter in embeddings if reference and chapter in reference]
+            throughput = result["tokens"] / result["seconds"] if result["seconds"] else float("nan")
+            baseline = baseline or throughput
+            note = "  (ripiego su fp32)" if result["fallback"] else ""
+            print(f"{backend:<8}{throughput:>10.0f}{throughput / baseline:>9.2f}{result['peak_memory_mb']:>18.0f}"
+                  f"{min(similarities, default=float('nan')):>12.5f}{np.mean(similarities) if similarities else float('nan'):>14.5f}{note}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# Confronta l'invio dei capitoli ai processi del Pool: stringhe serializzate contro memoria condivisa.
+#
+# Uso: python benchmarks/bench_dispatch.py [--mb 200] [--chapters 200] [--workers 2]
+#
+# "stringhe" riproduce il vecchio batch_analysis: una fetta del testo per capitolo, serializzata
+# nelle pipe verso i processi. "condivisa" usa SharedTextBuffer: il testo viene codificato una
+# volta in memoria condivisa e ai processi arrivano solo (nome, offset, lunghezza). In entrambi i
+# casi ogni processo ottiene il testo del capitolo e ne restituisce la lunghezza, senza eseguire
+# il modello: si misura solo il trasferimento. Ogni modalità gira in un processo separato; la
+# memoria (solo Linux) è il picco di RssAnon e RssShmem del processo principale durante l'invio,
+# campionato da un thread, e la RssAnon più alta dei processi del Pool mentre hanno il capitolo.
+import argparse
+import json
+import multiprocessing
+from multiprocessing import resource_tracker
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import analysis  # noqa: E402
+from common import WORDS  # noqa: E402
+
+def synthetic_text(megabytes):
+    # Un blocco di parole casuali ripetuto: il picco di memoria della generazione resta vicino al testo finale.
+    rng = random.Random(0)
+    block = " ".join(rng.choice(WORDS) for _ in range(200000)) + " "
+    return block * (megabytes * 2**20 // len(block) + 1)
+
+def memory_mb(field):
+    # Campo di /proc/self/status (RssAnon, RssShmem), solo Linux.
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+def chapter_length(job):
+    chapter_text = job[1] if isinstance(job[1], str) else analysis.read_shared_text(*job[1])
+    return job[0], len(chapter_text), os.getpid(), memory_mb("RssAnon")
+
+class MemorySampler:
+    # Picco della memoria anonima e condivisa del processo principale durante l'invio.
+
+    def __init__(self):
+        self.peaks = {"RssAnon": 0.0, "RssShmem": 0.0}
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            for field in self.peaks:
+                self.peaks[field] = max(self.peaks[field], memory_mb(field))
+            if self.stop.wait(0.002):
+                return
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+        return self.peaks
+
+def measure(mode, megabytes, chapters, workers):
+    # Eseguita nel processo figlio: tempi e memoria di una modalità.
+    # Processi avviati prima di creare il testo, che altrimenti erediterebbero con fork; il resource
+    # tracker parte prima di loro, come in batch_analysis dove il blocco condiviso precede il Pool
+    resource_tracker.ensure_running()
+    pool = multiprocessing.Pool(workers)
+    worker_baseline = max(anon for _, _, _, anon in pool.map(chapter_length, [(0, "")] * workers))
+    text = synthetic_text(megabytes)
+    ranges = analysis.chapter_ranges({chapter: chapter * len(text) // (chapters + 1) for chapter in range(1, chapters + 1)}, len(text))
+    baseline = memory_mb("RssAnon")
+    shared_text = None
+
+    sampler = MemorySampler()
+    start_time = time.perf_counter()
+    if mode == "stringhe":
+        jobs = [(chapter, text[start:end]) for chapter, (start, end) in ranges.items()]
+    else:
+        shared_text = analysis.SharedTextBuffer(sum(analysis.utf8_length(text[start:end]) for start, end in ranges.values()))
+        jobs = [(chapter, shared_text.append(text[start:end])) for chapter, (start, end) in ranges.items()]
+    prepared = time.perf_counter() - start_time
+    received = list(pool.imap_unordered(chapter_length, jobs))
+    elapsed = time.perf_counter() - start_time
+    peaks = sampler.close()
+    pool.close()
+    pool.join()
+    if shared_text is not None:
+        shared_text.close()
+
+    if {chapter: length for chapter, length, _, _ in received} != {chapter: end - start for chapter, (start, end) in ranges.items()}:
+        sys.exit("ERRORE: i processi hanno ricevuto testi diversi")
+    return {"text_mb": len(text) / 2**20, "prepare_s": prepared, "dispatch_s": elapsed,
+            "main_anon_mb": peaks["RssAnon"] - baseline, "main_shared_mb": peaks["RssShmem"],
+            "worker_anon_mb": max(anon for _, _, _, anon in received) - worker_baseline}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dell'invio dei capitoli ai processi del Pool")
+    parser.add_argument("--mb", type=int, default=200, help="dimensione del testo sintetico in MB")
+    parser.add_argument("--chapters", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--child", metavar="MODALITA", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(measure(args.child, args.mb, args.chapters, args.workers)))
+        return
+
+    print(f"Testo: {args.mb} MB, {args.chapters} capitoli, {args.workers} processi")
+    print("Memoria in MB oltre al testo già letto: anonima del processo principale, blocco condiviso, anonima massima di un processo del Pool")
+    print(f"{'modalità':<12}{'preparazione (s)':>18}{'invio totale (s)':>18}{'principale':>12}{'condivisa':>11}{'Pool':>8}")
+    for mode in ("stringhe", "condivisa"):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode, "--mb", str(args.mb),
+                                 "--chapters", str(args.chapters), "--workers", str(args.workers)],
+                                stdout=subprocess.PIPE, text=True, check=True)
+        result = json.loads(output.stdout)
+        print(f"{mode:<12}{result['prepare_s']:>18.3f}{result['dispatch_s']:>18.3f}{result['main_anon_mb']:>12.0f}"
+              f"{result['main_shared_mb']:>11.0f}{result['worker_anon_mb']:>8.0f}")
+
+if __name__ == "__main__":
+    main()
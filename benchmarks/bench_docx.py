@@ -0,0 +1,129 @@
+# Confronta la lettura di un DOCX con python-docx e con il lettore in streaming di readers.py.
+#
+# Uso: python benchmarks/bench_docx.py [--paragraphs 200000] [--docx libro.docx]
+#
+# Il documento sintetico viene scritto direttamente in XML (python-docx sarebbe troppo lento a
+# crearne uno grande) partendo da un documento vuoto salvato da python-docx, e contiene i casi che
+# Paragraph.text tratta in modo particolare: più run, tabulazioni, a capo e interruzioni di
+# pagina, collegamenti ipertestuali, revisioni, campi, tabelle e paragrafi vuoti. Ogni lettore
+# gira in un processo separato, così la memoria massima (ru_maxrss) misura solo quel lettore;
+# il testo prodotto dai due lettori deve essere identico.
+import argparse
+import hashlib
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import WORDS  # noqa: E402
+
+NAMESPACES = ('xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+              'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"')
+
+def run(text, preserve=False):
+    space = ' xml:space="preserve"' if preserve else ""
+    return f"<w:r><w:rPr><w:b/></w:rPr><w:t{space}>{escape(text)}</w:t></w:r>"
+
+def synthetic_paragraphs(count):
+    # Paragraphs come XML; il tipo di paragrafo ruota per coprire tutti i casi.
+    rng = random.Random(0)
+    for number in range(count):
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 60)))
+        kind = number % 12
+        if kind == 0:
+            yield f"<w:p><w:pPr><w:pStyle w:val=\"Heading1\"/></w:pPr>{run(f'Capitolo {number // 12 + 1}')}</w:p>"
+        elif kind == 1:
+            yield f"<w:p>{run(sentence[:20])}{run(' ' + sentence[20:] + ' ', preserve=True)}{run('città & più <è>')}</w:p>"
+        elif kind == 2:
+            yield (f"<w:p><w:r><w:t>{escape(sentence)}</w:t><w:tab/><w:t>dopo la tabulazione</w:t><w:ptab w:relativeTo=\"margin\" "
+                   f"w:alignment=\"right\" w:leader=\"none\"/><w:t>fine</w:t></w:r></w:p>")
+        elif kind == 3:
+            yield (f"<w:p><w:r><w:t>{escape(sentence)}</w:t><w:br/><w:t>riga</w:t><w:br w:type=\"page\"/><w:t>pagina</w:t>"
+                   f"<w:br w:type=\"column\"/><w:cr/><w:t>anti</w:t><w:noBreakHyphen/><w:t>spazio</w:t></w:r></w:p>")
+        elif kind == 4:
+            yield f"<w:p>{run('Vedi ')}<w:hyperlink r:id=\"rId99\">{run('il collegamento')}{run(' esterno')}</w:hyperlink>{run('.')}</w:p>"
+        elif kind == 5:
+            yield (f"<w:p>{run(sentence)}<w:ins w:id=\"{number}\" w:author=\"a\">{run(' inserito')}</w:ins>"
+                   f"<w:del w:id=\"{number}\" w:author=\"a\"><w:r><w:delText>eliminato</w:delText></w:r></w:del></w:p>")
+        elif kind == 6:
+            yield f"<w:p>{run('Pagina ')}<w:fldSimple w:instr=\"PAGE\">{run('7')}</w:fldSimple></w:p>"
+        elif kind == 7:
+            yield "<w:p/>"
+        elif kind == 8:
+            yield "<w:p><w:pPr><w:jc w:val=\"center\"/></w:pPr></w:p>"
+        elif kind == 9:
+            yield (f"<w:tbl><w:tr><w:tc><w:p>{run('cella esclusa')}</w:p></w:tc><w:tc><w:p>{run(sentence)}</w:p></w:tc></w:tr></w:tbl>")
+        elif kind == 10:
+            yield f"<w:p><w:r><w:t/></w:r>{run('emoji 😀 e ß')}<w:r><w:t xml:space=\"preserve\">  </w:t></w:r></w:p>"
+        else:
+            yield f"<w:p>{run(sentence)}</w:p>"
+
+def write_docx(path, paragraphs):
+    # Copia le parti di un documento vuoto di python-docx e scrive il corpo in streaming.
+    import docx
+    template = path + ".vuoto.docx"
+    docx.Document().save(template)
+    with zipfile.ZipFile(template) as source, zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as target:
+        for item in source.infolist():
+            if item.filename != "word/document.xml":
+                target.writestr(item, source.read(item.filename))
+        with target.open("word/document.xml", "w") as document:
+            document.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<w:document {NAMESPACES}><w:body>'.encode("utf-8"))
+            for paragraph in synthetic_paragraphs(paragraphs):
+                document.write(paragraph.encode("utf-8"))
+            document.write(b'<w:sectPr><w:pgSz w:w="11906" w:h="16838"/></w:sectPr></w:body></w:document>')
+    os.remove(template)
+
+def measure(reader, path):
+    # Eseguita nel processo figlio: tempo, memoria massima e impronta del testo di un lettore.
+    start_time = time.perf_counter()
+    if reader == "python-docx":
+        import docx
+        text = "\n".join(paragraph.text for paragraph in docx.Document(path).paragraphs)
+    else:
+        import readers
+        text = readers.read_docx(path)
+    elapsed = time.perf_counter() - start_time
+    return {"seconds": elapsed, "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "chars": len(text), "sha256": hashlib.sha256(text.encode("utf-8")).hexdigest()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark della lettura dei file DOCX")
+    parser.add_argument("--paragraphs", type=int, default=200000, help="paragrafi del documento sintetico")
+    parser.add_argument("--docx", help="documento da usare al posto di quello sintetico")
+    parser.add_argument("--child", nargs=2, metavar=("LETTORE", "DOCX"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(measure(*args.child)))
+        return
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.abspath(args.docx) if args.docx else os.path.join(work_dir, "libro_benchmark.docx")
+        if not args.docx:
+            write_docx(path, args.paragraphs)
+        with zipfile.ZipFile(path) as archive:
+            xml_size = sum(item.file_size for item in archive.infolist() if item.filename.endswith("document.xml"))
+        print(f"Documento: {path} ({os.path.getsize(path) / 2**20:.1f} MB, document.xml {xml_size / 2**20:.0f} MB)")
+        print(f"{'lettore':<14}{'tempo (s)':>12}{'memoria max (MB)':>18}{'caratteri':>12}")
+        results = {}
+        for reader in ("python-docx", "streaming"):
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", reader, path],
+                                    stdout=subprocess.PIPE, text=True, check=True)
+            results[reader] = json.loads(output.stdout)
+            result = results[reader]
+            print(f"{reader:<14}{result['seconds']:>12.2f}{result['peak_rss_mb']:>18.0f}{result['chars']:>12}")
+    if results["python-docx"]["sha256"] != results["streaming"]["sha256"]:
+        print("ERRORE: il testo del lettore in streaming differisce da quello di python-docx")
+        sys.exit(1)
+    print("Testo identico a python-docx")
+
+if __name__ == "__main__":
+    main()
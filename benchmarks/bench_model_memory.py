@@ -0,0 +1,88 @@
+# Confronta memoria e tempi di avvio di analysis.py nelle diverse modalità di esecuzione.
+#
+# Uso: python benchmarks/bench_model_memory.py [--chapters 8] [--modes shared single per-worker]
+#
+# Per ogni modalità avvia analysis.py su un libro sintetico e campiona l'albero dei
+# processi: la memoria è misurata come PSS (le pagine condivise sono divise tra i
+# processi che le usano), con ripiego su RSS dove la PSS non è disponibile.
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import psutil
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import ANALYSIS_SCRIPT, write_synthetic_book  # noqa: E402
+
+def process_memory(process):
+    try:
+        info = process.memory_full_info()
+        return getattr(info, "pss", info.rss)
+    except (psutil.AccessDenied, psutil.NoSuchProcess):
+        return 0
+
+def tree_memory(root):
+    try:
+        processes = [root] + root.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return 0, 0
+    return sum(process_memory(p) for p in processes), len(processes)
+
+def run_mode(book_path, work_dir, execution):
+    start_time = time.perf_counter()
+    process = subprocess.Popen([sys.executable, ANALYSIS_SCRIPT, book_path, "--execution", execution],
+                               cwd=work_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    root = psutil.Process(process.pid)
+    peak = {"memory": 0, "processes": 0}
+    first_chapter = []
+
+    def sample():
+        while process.poll() is None:
+            memory, count = tree_memory(root)
+            peak["memory"] = max(peak["memory"], memory)
+            peak["processes"] = max(peak["processes"], count)
+            time.sleep(0.05)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    for line in process.stdout:
+        # La prima riga "Capitolo N: ... token" indica che un capitolo è stato elaborato
+        if not first_chapter and line.startswith("Capitolo ") and " token " in line:
+            first_chapter.append(time.perf_counter() - start_time)
+    process.wait()
+    sampler.join()
+    return {
+        "execution": execution,
+        "exit_code": process.returncode,
+        "peak_memory_mb": peak["memory"] / 2**20,
+        "processes": peak["processes"],
+        "first_chapter_s": first_chapter[0] if first_chapter else float("nan"),
+        "total_s": time.perf_counter() - start_time,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chapters", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--words", type=int, default=1500, help="parole per capitolo")
+    parser.add_argument("--modes", nargs="+", default=["per-worker", "shared", "single"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        book_path = os.path.join(work_dir, "libro_benchmark.txt")
+        write_synthetic_book(book_path, args.chapters, args.words)
+        print(f"CPU: {os.cpu_count()}, capitoli: {args.chapters}")
+        print(f"{'modalità':<12}{'processi':>10}{'memoria max (MB)':>18}{'primo capitolo (s)':>20}{'totale (s)':>12}")
+        for execution in args.modes:
+            result = run_mode(book_path, work_dir, execution)
+            if result["exit_code"] != 0:
+                print(f"{execution:<12} terminato con codice {result['exit_code']}")
+                continue
+            print(f"{execution:<12}{result['processes']:>10}{result['peak_memory_mb']:>18.0f}"
+                  f"{result['first_chapter_s']:>20.2f}{result['total_s']:>12.2f}")
+
+if __name__ == "__main__":
+    main()
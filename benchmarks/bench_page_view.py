@@ -0,0 +1,102 @@
+# Confronta l'apertura di un libro nella GUI: testo intero diviso in pagine contro pagine lette a richiesta.
+#
+# Uso: python benchmarks/bench_page_view.py [--mb 200] [--book libro.txt|libro.pdf]
+#
+# Ogni modalità gira in un processo separato, così la memoria massima (ru_maxrss) misura solo
+# quella modalità. "lista" riproduce il vecchio open_file (read_book + lista di pagine da 3300
+# caratteri); "pagine" usa PagedText sulla cache del testo, già popolata da un'apertura
+# precedente: per un PDF o un DOCX il testo in cache è mappato in memoria, per un .txt ogni
+# pagina si rilegge dal file originale con l'indice delle pagine salvato nella cache.
+# Si misurano il tempo per mostrare la prima pagina, il tempo medio di un salto a una pagina
+# casuale, la memoria massima del processo e quella anonima (RssAnon, solo Linux) a fine prova:
+# le pagine mappate del file in cache contano nella RSS ma restano cache del sistema, che il
+# kernel può liberare, mentre la memoria anonima è quella occupata davvero dal testo.
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import WORDS  # noqa: E402
+
+JUMPS = 2000
+
+def anonymous_memory_mb():
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float("nan")
+
+def write_book(path, megabytes):
+    rng = random.Random(0)
+    with open(path, "w", encoding="utf-8") as f:
+        chapter = 0
+        while f.tell() < megabytes * 2**20:
+            chapter += 1
+            f.write(f"Capitolo {chapter}\n\n" + " ".join(rng.choice(WORDS) for _ in range(20000)) + ".\n\n")
+
+def measure(mode, book_path, cache_dir):
+    # Eseguita nel processo figlio: restituisce i tempi e la memoria di una modalità.
+    import readers
+    readers.configure_text_cache(cache_dir)
+    start_time = time.perf_counter()
+    if mode == "lista":
+        text = readers.read_book(book_path)
+        pages = [text[i:i + readers.PAGE_SIZE] for i in range(0, len(text), readers.PAGE_SIZE)]
+        del text
+    else:
+        pages = readers.PagedText(*readers.lookup_text_cache(book_path))
+    first_page = pages[0]
+    open_time = time.perf_counter() - start_time
+
+    rng = random.Random(1)
+    start_time = time.perf_counter()
+    for _ in range(JUMPS):
+        page = pages[rng.randrange(len(pages))]
+    jump_time = (time.perf_counter() - start_time) / JUMPS
+    return {"pages": len(pages), "open_s": open_time, "jump_us": jump_time * 1e6,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, "anon_mb": anonymous_memory_mb(),
+            "chars": len(first_page + page)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark della visualizzazione a pagine della GUI")
+    parser.add_argument("--mb", type=int, default=200, help="dimensione del libro sintetico in MB")
+    parser.add_argument("--book", help="libro da usare al posto di quello sintetico")
+    parser.add_argument("--child", nargs=3, metavar=("MODALITA", "LIBRO", "CACHE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(measure(*args.child)))
+        return
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        book_path = os.path.abspath(args.book) if args.book else os.path.join(work_dir, "libro_benchmark.txt")
+        if not args.book:
+            write_book(book_path, args.mb)
+        cache_dir = os.path.join(work_dir, "cache")
+        import readers
+        readers.configure_text_cache(cache_dir)
+        start_time = time.perf_counter()
+        for _ in readers.iter_book(book_path):  # Prima apertura: estrazione nella cache
+            pass
+        extraction = time.perf_counter() - start_time
+
+        print(f"Libro: {book_path} ({os.path.getsize(book_path) / 2**20:.0f} MB), estrazione nella cache {extraction:.2f} s")
+        print(f"{'modalità':<10}{'pagine':>10}{'prima pagina (s)':>18}{'salto (us)':>12}{'memoria max (MB)':>18}{'anonima (MB)':>14}")
+        for mode in ("lista", "pagine"):
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode, book_path, cache_dir],
+                                    stdout=subprocess.PIPE, text=True, check=True)
+            result = json.loads(output.stdout)
+            print(f"{mode:<10}{result['pages']:>10}{result['open_s']:>18.3f}{result['jump_us']:>12.1f}{result['peak_rss_mb']:>18.0f}{result['anon_mb']:>14.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# Misura la velocità di estrazione del testo dai PDF (pagine al secondo) al variare dei processi.
+#
+# Uso: python benchmarks/bench_pdf_extraction.py [--pages 800] [--workers 1 2 4 8] [--pdf libro.pdf]
+#
+# Senza --pdf genera un PDF sintetico con testo su ogni pagina. Il risultato con 1 processo
+# corrisponde all'estrazione seriale; tutti i risultati vengono confrontati con quello seriale.
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import fitz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from readers import read_pdf  # noqa: E402
+from common import WORDS  # noqa: E402
+
+def write_synthetic_pdf(path, pages):
+    rng = random.Random(0)
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        lines = [f"Capitolo {page_num // 20 + 1}"] if page_num % 20 == 0 else []
+        lines += [" ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(45)]
+        page.insert_text((50, 60), "\n".join(lines), fontsize=10)
+    doc.save(path)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=800)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--pdf", help="PDF da usare al posto di quello sintetico")
+    parser.add_argument("--repeat", type=int, default=3, help="ripetizioni per ogni configurazione (si tiene la migliore)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        pdf_path = args.pdf
+        if not pdf_path:
+            pdf_path = os.path.join(work_dir, "libro_benchmark.pdf")
+            write_synthetic_pdf(pdf_path, args.pages)
+        with fitz.open(pdf_path) as doc:
+            pages = doc.page_count
+
+        reference = read_pdf(pdf_path, workers=1)
+        print(f"PDF: {pdf_path} ({pages} pagine), CPU: {os.cpu_count()}")
+        print(f"{'processi':>9}{'tempo (s)':>12}{'pagine/s':>12}{'speedup':>10}")
+        baseline = None
+        for workers in args.workers:
+            timings = []
+            for _ in range(args.repeat):
+                start_time = time.perf_counter()
+                text = read_pdf(pdf_path, workers=workers)
+                timings.append(time.perf_counter() - start_time)
+            if text != reference:
+                print(f"{workers:>9}  ERRORE: il testo estratto differisce da quello seriale")
+                continue
+            best = min(timings)
+            baseline = baseline or best
+            print(f"{workers:>9}{best:>12.3f}{pages / best:>12.0f}{baseline / best:>10.2f}")
+
+if __name__ == "__main__":
+    main()
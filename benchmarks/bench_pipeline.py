@@ -0,0 +1,240 @@
+# Benchmark offline della pipeline di analysis.py: lettura, capitoli, tokenizzazione, inferenza, scrittura.
+#
+# Uso: python benchmarks/bench_pipeline.py [--formats txt pdf docx] [--chapters 20] [--words 2000]
+#                                          [--model tiny] [--output risultati.json] [--compare riferimento.json]
+#
+# Genera libri sintetici in italiano (stesso testo in TXT, PDF e DOCX) e misura separatamente
+# ogni fase, più l'intera analisi (prepare_book + batch_analysis in modalità "single"). La fase
+# "pipelined" ripete tokenizzazione e inferenza sovrapposte, come avviene durante l'analisi.
+# Con --model tiny (default) usa un BERT minuscolo con pesi casuali creato sul momento, con un
+# vocabolario ricavato dal testo sintetico: non serve la rete e i tempi misurano il codice della
+# pipeline più che il modello. Con --model NOME_O_CARTELLA si usa un modello vero.
+#
+# --output salva i risultati in JSON; --compare li confronta con un file salvato in precedenza e
+# termina con codice 1 se una fase è più lenta del riferimento oltre --tolerance.
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import analysis  # noqa: E402
+import readers  # noqa: E402
+from common import WORDS, best_of  # noqa: E402
+from embedding_store import EmbeddingStore  # noqa: E402
+
+STAGES = ("read", "segment", "tokenize", "inference", "pipelined", "write", "end_to_end")
+FORMATS = ("txt", "pdf", "docx")
+LINES_PER_PDF_PAGE = 45
+MIN_REGRESSION_S = 0.005  # Differenze più piccole sono rumore di misura
+
+def synthetic_chapters(chapters, words_per_chapter):
+    # Capitoli come liste di paragrafi: frasi con maiuscola iniziale e punteggiatura.
+    rng = random.Random(0)
+    book = []
+    for chapter in range(1, chapters + 1):
+        paragraphs, remaining = [], words_per_chapter
+        while remaining > 0:
+            sentences = []
+            for _ in range(rng.randint(2, 5)):
+                length = min(rng.randint(6, 18), max(remaining, 1))
+                words = [rng.choice(WORDS) for _ in range(length)]
+                sentences.append(" ".join(words).capitalize() + rng.choice("....?!"))
+                remaining -= length
+                if remaining <= 0:
+                    break
+            paragraphs.append(" ".join(sentences))
+        book.append((f"Capitolo {chapter}", paragraphs))
+    return book
+
+def write_txt(path, book):
+    with open(path, "w", encoding="utf-8") as f:
+        for heading, paragraphs in book:
+            f.write(f"{heading}\n\n" + "\n\n".join(paragraphs) + "\n\n")
+
+def wrap(paragraph, width=90):
+    lines, line = [], ""
+    for word in paragraph.split():
+        if line and len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    return lines + [line] if line else lines
+
+def write_pdf(path, book):
+    import fitz
+    lines = []
+    for heading, paragraphs in book:
+        lines += [heading, ""]
+        for paragraph in paragraphs:
+            lines += wrap(paragraph) + [""]
+    doc = fitz.open()
+    for first in range(0, len(lines), LINES_PER_PDF_PAGE):
+        page = doc.new_page()
+        page.insert_text((50, 60), "\n".join(lines[first:first + LINES_PER_PDF_PAGE]), fontsize=10)
+    doc.save(path)
+
+def write_docx(path, book):
+    import docx
+    document = docx.Document()
+    for heading, paragraphs in book:
+        document.add_paragraph(heading)
+        for paragraph in paragraphs:
+            document.add_paragraph(paragraph)
+    document.save(path)
+
+WRITERS = {"txt": write_txt, "pdf": write_pdf, "docx": write_docx}
+
+def build_tiny_model(model_dir, book):
+    # BERT con 2 strati da 64 dimensioni e pesi casuali (seme fisso), salvato come un modello normale.
+    torch = analysis.load_libraries()
+    from transformers import BertConfig
+    words = {word for _, paragraphs in book for paragraph in paragraphs for word in re.findall(r"\w+", paragraph)}
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + list(".,;?!0123456789") + ["Capitolo"] + sorted(words)
+    os.makedirs(model_dir, exist_ok=True)
+    vocab_file = os.path.join(model_dir, "vocab.txt")
+    with open(vocab_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(vocab) + "\n")
+    analysis.BertTokenizer(vocab_file, do_lower_case=False).save_pretrained(model_dir)
+    torch.manual_seed(0)
+    config = BertConfig(vocab_size=len(vocab), hidden_size=64, num_hidden_layers=2, num_attention_heads=2,
+                        intermediate_size=128, max_position_embeddings=analysis.MAX_LENGTH)
+    analysis.BertModel(config).save_pretrained(model_dir)
+
+def measure_book(path, work_dir, args):
+    # Tempi delle singole fasi per un libro; il modello deve essere già caricato.
+    readers.configure_text_cache(None)  # Si misura l'estrazione, non la cache del testo
+    times = {}
+    times["read"], text = best_of(lambda: readers.read_book(path), args.repeat)
+    times["segment"], (chapters, titles) = best_of(lambda: analysis.find_book_chapters(text, args.segmentation), args.repeat)
+    chapter_texts = [(chapter, text[start:end]) for chapter, (start, end) in analysis.chapter_ranges(chapters, len(text)).items()]
+
+    def tokenize():
+        return [analysis.tokenizer(chapter_text, add_special_tokens=False, verbose=False)["input_ids"]
+                for _, chapter_text in chapter_texts]
+    times["tokenize"], token_ids = best_of(tokenize, args.repeat)
+    times["inference"], embedded = best_of(lambda: [analysis.embed_token_ids(ids, args.batch_size) for ids in token_ids], args.repeat)
+    # Tokenizzazione e inferenza sovrapposte, come in analyze_chapter: va confrontato con tokenize + inference
+    times["pipelined"], _ = best_of(lambda: [analysis.pipelined_embedding(chapter_text, args.batch_size)
+                                               for _, chapter_text in chapter_texts], args.repeat)
+
+    book_name = os.path.splitext(os.path.basename(path))[0]
+    output_dir = os.path.join(work_dir, "scrittura", book_name)
+    os.makedirs(output_dir, exist_ok=True)
+
+    def write():
+        store = EmbeddingStore(output_dir, book_name, analysis.MODEL_NAME, path)
+        store.retain(chapters)
+        store.mark_pending(chapters)
+        for (chapter, _), (embeddings, _) in zip(chapter_texts, embedded):
+            store.write(chapter, embeddings)
+        analysis.write_summary(os.path.join(output_dir, f"{book_name}-analysis.csv"),
+                               analysis.calculate_page_ranges(chapters, len(text)), titles)
+    times["write"], _ = best_of(write, args.repeat)
+
+    def end_to_end():
+        # Percorso reale di analysis.py (senza cache degli embedding), con l'output soppresso
+        with contextlib.redirect_stdout(io.StringIO()):
+            book = analysis.prepare_book(path, analysis.ProgressReporter(False), args.segmentation)
+            return analysis.batch_analysis([book], "chunked", args.batch_size, "single")
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        times["end_to_end"], results = best_of(end_to_end, args.repeat)
+    finally:
+        os.chdir(cwd)
+    if any("error" in result for result in results):
+        raise RuntimeError(f"analisi non riuscita per {path}")
+    tokens = sum(num_tokens for _, num_tokens in embedded)
+    return times, {"chars": len(text), "chapters": len(chapters), "tokens": tokens}
+
+def compare(current, baseline, tolerance):
+    # Fasi più lente del riferimento oltre la tolleranza, come lista di (formato, fase, prima, dopo).
+    if current["config"] != baseline.get("config"):
+        print("Avviso: configurazione diversa da quella del riferimento, il confronto è solo indicativo")
+    regressions = []
+    print(f"\n{'formato':<8}{'fase':<12}{'riferimento (s)':>17}{'attuale (s)':>13}{'variazione':>12}")
+    for book_format, times in current["times"].items():
+        for stage, seconds in times.items():
+            before = baseline.get("times", {}).get(book_format, {}).get(stage)
+            if before is None:
+                continue
+            change = seconds / before - 1 if before else 0.0
+            regression = change > tolerance and seconds - before > MIN_REGRESSION_S
+            flag = "  REGRESSIONE" if regression else ""
+            print(f"{book_format:<8}{stage:<12}{before:>17.4f}{seconds:>13.4f}{change:>+11.1%}{flag}")
+            if regression:
+                regressions.append((book_format, stage, before, seconds))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline della pipeline di analisi")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--chapters", type=int, default=20)
+    parser.add_argument("--words", type=int, default=2000, help="parole per capitolo")
+    parser.add_argument("--model", default="tiny", help="'tiny' (offline, pesi casuali) oppure nome o cartella di un modello BERT")
+    parser.add_argument("--backend", choices=analysis.BACKENDS, default="fp32")
+    parser.add_argument("--segmentation", choices=analysis.SEGMENTATION_MODES, default="lines")
+    parser.add_argument("--batch-size", type=int, default=analysis.DEFAULT_BATCH_SIZE)
+    parser.add_argument("--repeat", type=int, default=3, help="ripetizioni per fase (si tiene la migliore)")
+    parser.add_argument("--output", help="file JSON in cui salvare i risultati")
+    parser.add_argument("--compare", help="file JSON di riferimento con cui confrontare i risultati")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="rallentamento tollerato (default: %(default)s = 10%%)")
+    args = parser.parse_args()
+
+    book = synthetic_chapters(args.chapters, args.words)
+    report = {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"), "python": sys.version.split()[0],
+              "cpu_count": os.cpu_count(),
+              "config": {"chapters": args.chapters, "words": args.words, "model": args.model, "backend": args.backend,
+                         "segmentation": args.segmentation, "batch_size": args.batch_size},
+              "times": {}, "books": {}}
+    with tempfile.TemporaryDirectory() as work_dir:
+        if args.model == "tiny":
+            analysis.MODEL_NAME = os.path.join(work_dir, "tiny-bert")
+            build_tiny_model(analysis.MODEL_NAME, book)
+        else:
+            analysis.MODEL_NAME = args.model
+        analysis.select_backend(args.backend)
+        start_time = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            analysis.load_model()
+        report["model_load_s"] = round(time.perf_counter() - start_time, 4)
+        report["torch"] = analysis.torch.__version__
+
+        print(f"Libro sintetico: {args.chapters} capitoli da {args.words} parole, modello {args.model}, "
+              f"backend {analysis.backend}, caricamento {report['model_load_s']:.2f} s")
+        print(f"{'formato':<8}" + "".join(f"{stage:>12}" for stage in STAGES) + f"{'token/s':>10}")
+        for book_format in args.formats:
+            path = os.path.join(work_dir, f"libro_benchmark.{book_format}")
+            WRITERS[book_format](path, book)
+            times, info = measure_book(path, work_dir, args)
+            report["times"][book_format] = {stage: round(seconds, 5) for stage, seconds in times.items()}
+            report["books"][book_format] = info
+            print(f"{book_format:<8}" + "".join(f"{times[stage]:>12.4f}" for stage in STAGES)
+                  + f"{info['tokens'] / times['inference']:>10.0f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nRisultati salvati in {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} fasi più lente del riferimento oltre il {args.tolerance:.0%}")
+            sys.exit(1)
+        print("\nNessuna regressione rispetto al riferimento")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# Confronta la suddivisione automatica dei core tra processi e thread di torch con quella precedente.
+#
+# Uso: python benchmarks/bench_scheduling.py [--execution shared] [--books molti pochi sbilanciato]
+#
+# "precedente" riproduce il vecchio comportamento: un processo per core, ciascuno con tutti i
+# thread di torch (--workers N --threads N --no-pin). "automatica" lascia scegliere ad analysis.py.
+# Ogni libro sintetico rappresenta un caso diverso: molti capitoli simili, pochi capitoli lunghi,
+# un capitolo molto più lungo degli altri.
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import ANALYSIS_SCRIPT, TOKENS_LINE, write_chapters  # noqa: E402
+
+CORES = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+BOOK_SHAPES = {
+    # Parole per capitolo
+    "molti": [1500] * (CORES * 4),
+    "pochi": [12000] * max(2, CORES // 4),
+    "sbilanciato": [30000] + [1000] * CORES,
+}
+PLAN_LINE = re.compile(r"Pianificazione: (.*)")
+
+def run_analysis(book_path, work_dir, execution, extra_args):
+    start_time = time.perf_counter()
+    output = subprocess.run([sys.executable, ANALYSIS_SCRIPT, book_path, "--execution", execution, "--no-cache"] + extra_args,
+                            cwd=work_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    total = time.perf_counter() - start_time
+    plan = PLAN_LINE.search(output.stdout)
+    tokens = TOKENS_LINE.search(output.stdout)
+    return {"exit_code": output.returncode, "plan": plan.group(1) if plan else "?", "total_s": total,
+            "analysis_s": float(tokens.group(2)) if tokens else float("nan"),
+            "tokens": int(tokens.group(1)) if tokens else 0}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark della pianificazione di processi e thread")
+    parser.add_argument("--execution", default="shared", choices=["shared", "per-worker"])
+    parser.add_argument("--books", nargs="+", default=list(BOOK_SHAPES), choices=list(BOOK_SHAPES))
+    args = parser.parse_args()
+
+    configurations = {
+        "precedente": ["--workers", str(CORES), "--threads", str(CORES), "--no-pin"],
+        "automatica": [],
+    }
+    print(f"Core disponibili: {CORES}, esecuzione: {args.execution}")
+    print(f"{'libro':<13}{'configurazione':<16}{'analisi (s)':>12}{'token/s':>10}{'totale (s)':>12}  pianificazione")
+    with tempfile.TemporaryDirectory() as work_dir:
+        for shape in args.books:
+            book_path = os.path.join(work_dir, f"libro_{shape}.txt")
+            write_chapters(book_path, BOOK_SHAPES[shape])
+            for name, extra_args in configurations.items():
+                result = run_analysis(book_path, work_dir, args.execution, extra_args)
+                if result["exit_code"] != 0:
+                    print(f"{shape:<13}{name:<16} terminato con codice {result['exit_code']}")
+                    continue
+                throughput = result["tokens"] / result["analysis_s"] if result["analysis_s"] else float("nan")
+                print(f"{shape:<13}{name:<16}{result['analysis_s']:>12.2f}{throughput:>10.0f}"
+                      f"{result['total_s']:>12.2f}  {result['plan']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# Misura la ricerca semantica di search.py su archivi sintetici di molti libri.
+#
+# Uso: python benchmarks/bench_search.py [--books 200] [--chapters 100] [--dim 768] [-k 10]
+#
+# Gli archivi vengono scritti direttamente nel formato di embedding_store.py (file .f32 più
+# indice JSON), senza eseguire il modello. Si misurano il primo caricamento, un aggiornamento
+# senza modifiche, un aggiornamento dopo la modifica di un solo libro e la latenza di una
+# query, confrontata con il confronto capitolo per capitolo tramite read_chapter_embedding.
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_store import STATUS_COMPLETED, read_chapter_embedding, read_store_index, store_paths  # noqa: E402
+from search import ChapterSearchIndex  # noqa: E402
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import timed  # noqa: E402
+
+def write_synthetic_store(analyses_dir, book_name, chapters, dim, rng):
+    output_dir = os.path.join(analyses_dir, book_name)
+    os.makedirs(output_dir, exist_ok=True)
+    data_path, index_path = store_paths(output_dir, book_name)
+    rng.standard_normal((chapters, dim), dtype=np.float32).tofile(data_path)
+    index = {"model": "bert-base-uncased", "dim": dim, "dtype": "float32", "rows": chapters,
+             "chapters": {str(chapter): {"row": chapter - 1, "status": STATUS_COMPLETED, "key": None,
+                                         "timestamp": "2024-01-01T00:00:00"}
+                          for chapter in range(1, chapters + 1)}}
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+
+def naive_search(analyses_dir, book_names, query, k):
+    # Un embedding alla volta, come farebbe un ciclo sugli archivi senza indice in memoria.
+    scores = []
+    for book_name in book_names:
+        output_dir = os.path.join(analyses_dir, book_name)
+        index = read_store_index(output_dir, book_name)
+        for chapter in index["chapters"]:
+            vector = read_chapter_embedding(output_dir, book_name, chapter, index)
+            scores.append((float(np.dot(vector, query) / (np.linalg.norm(vector) * np.linalg.norm(query))), book_name, chapter))
+    return sorted(scores, reverse=True)[:k]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark della ricerca semantica")
+    parser.add_argument("--books", type=int, default=200)
+    parser.add_argument("--chapters", type=int, default=100, help="capitoli per libro")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100, help="query per la media della latenza")
+    parser.add_argument("--naive-books", type=int, default=20, help="libri usati per il confronto capitolo per capitolo")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as analyses_dir:
+        book_names = [f"libro_{number:04d}" for number in range(args.books)]
+        for book_name in book_names:
+            write_synthetic_store(analyses_dir, book_name, args.chapters, args.dim, rng)
+        total = args.books * args.chapters
+        print(f"{args.books} libri, {total} capitoli, dimensione {args.dim}")
+
+        index = ChapterSearchIndex(analyses_dir)
+        load, _ = timed(index.refresh)
+        noop, _ = timed(index.refresh, repeat=10)
+        write_synthetic_store(analyses_dir, book_names[0], args.chapters, args.dim, rng)
+        one_book, reloaded = timed(index.refresh)
+        queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+        position = iter(range(args.queries))
+        query_time, _ = timed(lambda: index.search(queries[next(position)], args.k), repeat=args.queries)
+        similar_time, _ = timed(lambda: index.similar_to(book_names[1], "1", args.k), repeat=args.queries)
+
+        # Stessi risultati del confronto diretto sul sottoinsieme di libri
+        naive_names = book_names[:args.naive_books]
+        subset = ChapterSearchIndex(analyses_dir)
+        subset.books = {book_name: index.books[book_name] for book_name in naive_names}
+        subset.rebuild()
+        naive_time, expected = timed(lambda: naive_search(analyses_dir, naive_names, queries[0], args.k))
+        found = subset.search(queries[0], args.k)
+        if [label[1:] for label in expected] != [label[1:] for label in found]:
+            print("ERRORE: i risultati differiscono dal confronto capitolo per capitolo")
+            sys.exit(1)
+        subset_time, _ = timed(lambda: subset.search(queries[0], args.k), repeat=args.queries)
+
+        print(f"{'primo caricamento':<40}{load:>10.3f} s")
+        print(f"{'aggiornamento senza modifiche':<40}{noop * 1000:>10.2f} ms")
+        print(f"{'aggiornamento dopo 1 libro modificato':<40}{one_book * 1000:>10.2f} ms  ({reloaded} libro riletto)")
+        print(f"{'query top-' + str(args.k):<40}{query_time * 1000:>10.3f} ms")
+        print(f"{'simili a un capitolo':<40}{similar_time * 1000:>10.3f} ms")
+        print(f"{'capitolo per capitolo (' + str(len(naive_names)) + ' libri)':<40}{naive_time * 1000:>10.1f} ms"
+              f"  (indice: {subset_time * 1000:.3f} ms, {naive_time / subset_time:.0f}x)")
+
+if __name__ == "__main__":
+    main()
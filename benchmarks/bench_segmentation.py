@@ -0,0 +1,72 @@
+# Misura il tempo di ricerca dei capitoli su testi di diversi MB e lo confronta con la lettura del file.
+#
+# Uso: python benchmarks/bench_segmentation.py [--mb 1 8 32] [--txt libro.txt]
+#
+# Senza --txt genera un libro sintetico con sommario, parti e capitoli in numeri romani.
+# Per ogni testo confronta il motore a righe (lines) con le regole originali (legacy).
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analysis import find_book_chapters  # noqa: E402
+from readers import read_txt  # noqa: E402
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import WORDS, best_of  # noqa: E402
+CHAPTER_CHARS = 40000
+
+def to_roman(number):
+    numerals = [(1000, "M"), (900, "CM"), (500, "D"), (400, "CD"), (100, "C"), (90, "XC"),
+                (50, "L"), (40, "XL"), (10, "X"), (9, "IX"), (5, "V"), (4, "IV"), (1, "I")]
+    result = ""
+    for value, letter in numerals:
+        while number >= value:
+            result += letter
+            number -= value
+    return result
+
+def write_synthetic_book(path, size_mb):
+    rng = random.Random(0)
+    chapters = size_mb * 1024 * 1024 // CHAPTER_CHARS
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("Indice\n" + "".join(f"Capitolo {to_roman(n)}\n" for n in range(1, chapters + 1)) + "\n")
+        for n in range(1, chapters + 1):
+            if n % 10 == 1:
+                f.write(f"Parte {n // 10 + 1}\n\n")
+            f.write(f"Capitolo {to_roman(n)}\n\n")
+            written = 0
+            while written < CHAPTER_CHARS:
+                line = " ".join(rng.choice(WORDS) for _ in range(14)) + "\n"
+                f.write(line)
+                written += len(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark della ricerca dei capitoli")
+    parser.add_argument("--mb", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--txt", help="file di testo da usare al posto di quelli sintetici")
+    parser.add_argument("--repeat", type=int, default=3, help="ripetizioni per ogni misura (si tiene la migliore)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        books = [args.txt] if args.txt else []
+        for size_mb in ([] if args.txt else args.mb):
+            path = os.path.join(work_dir, f"libro_{size_mb}mb.txt")
+            write_synthetic_book(path, size_mb)
+            books.append(path)
+
+        print(f"{'MB':>6}{'lettura (s)':>13}{'lines (s)':>11}{'legacy (s)':>12}{'capitoli':>10}{'lines/lettura':>15}")
+        for path in books:
+            read_time, text = best_of(lambda: read_txt(path), args.repeat)
+            with contextlib.redirect_stdout(io.StringIO()):
+                lines_time, (chapters, _) = best_of(lambda: find_book_chapters(text, "lines"), args.repeat)
+                legacy_time, _ = best_of(lambda: find_book_chapters(text, "legacy"), args.repeat)
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            print(f"{size_mb:>6.1f}{read_time:>13.3f}{lines_time:>11.3f}{legacy_time:>12.3f}"
+                  f"{len(chapters):>10}{lines_time / read_time:>15.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# Confronta l'analisi di libri brevi con un nuovo processo di analysis.py e con il servizio di analisi.
+#
+# Uso: python benchmarks/bench_service.py [--chapters 3] [--words 1500] [--runs 3] [--port 50516]
+#
+# Usa il modello configurato in analysis.py (deve essere già scaricato). Per ogni modalità
+# l'analisi dello stesso libro sintetico si ripete --runs volte, senza cache degli embedding:
+# "processo" avvia ogni volta python analysis.py --no-service (interprete, importazioni e
+# caricamento di BERT compresi), "servizio" passa gli stessi argomenti a un servizio avviato una
+# volta sola su --port. Si misura anche l'avvio del servizio e il tempo complessivo di due
+# richieste concorrenti, che il servizio mette in coda ed esegue una dopo l'altra.
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from analysis_service import run_in_service, service_request  # noqa: E402
+from common import ANALYSIS_SCRIPT, PROJECT_DIR, write_synthetic_book  # noqa: E402
+
+SERVICE_START_TIMEOUT_S = 300
+
+def wait_for_service(port, process):
+    start_time = time.perf_counter()
+    while time.perf_counter() - start_time < SERVICE_START_TIMEOUT_S:
+        if process.poll() is not None:
+            sys.exit(f"Il servizio è terminato con codice {process.returncode}")
+        if service_request({"command": "ping"}, port) is not None:
+            return time.perf_counter() - start_time
+        time.sleep(0.1)
+    sys.exit("Il servizio non risponde")
+
+def timed_runs(runs, function):
+    times = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        code = function()
+        times.append(time.perf_counter() - start_time)
+        if code != 0:
+            sys.exit(f"Analisi terminata con codice {code}")
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del servizio di analisi")
+    parser.add_argument("--chapters", type=int, default=3)
+    parser.add_argument("--words", type=int, default=1500, help="parole per capitolo")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=50516, help="porta del servizio avviato per la prova")
+    args = parser.parse_args()
+
+    probe = socket.socket()
+    if probe.connect_ex(("127.0.0.1", args.port)) == 0:
+        sys.exit(f"La porta {args.port} è già in uso")
+    probe.close()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        book_path = os.path.join(work_dir, "libro_servizio.txt")
+        write_synthetic_book(book_path, args.chapters, args.words)
+        arguments = [book_path, "--no-cache", "--execution", "single"]
+        quiet = dict(cwd=work_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        process_times = timed_runs(args.runs, lambda: subprocess.run(
+            [sys.executable, ANALYSIS_SCRIPT, *arguments, "--no-service"], **quiet).returncode)
+
+        service = subprocess.Popen([sys.executable, os.path.join(PROJECT_DIR, "analysis_service.py"), "--port", str(args.port)], **quiet)
+        try:
+            startup = wait_for_service(args.port, service)
+            service_times = timed_runs(args.runs, lambda: run_in_service(arguments, work_dir, lambda line: None, port=args.port))
+
+            codes = []
+            start_time = time.perf_counter()
+            clients = [threading.Thread(target=lambda: codes.append(run_in_service(arguments, work_dir, lambda line: None, port=args.port)))
+                       for _ in range(2)]
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+            concurrent = time.perf_counter() - start_time
+            if codes != [0, 0]:
+                sys.exit(f"Richieste concorrenti terminate con codici {codes}")
+        finally:
+            service_request({"command": "shutdown"}, args.port)
+            service.wait()
+
+    print(f"Libro: {args.chapters} capitoli da {args.words} parole, {args.runs} analisi per modalità")
+    print(f"{'modalità':<12}{'media (s)':>12}{'migliore (s)':>14}")
+    for mode, times in (("processo", process_times), ("servizio", service_times)):
+        print(f"{mode:<12}{sum(times) / len(times):>12.2f}{min(times):>14.2f}")
+    print(f"Avvio del servizio (modello caricato): {startup:.2f} s")
+    print(f"Due richieste concorrenti al servizio: {concurrent:.2f} s in totale")
+    print(f"Accelerazione per analisi: {sum(process_times) / sum(service_times):.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Rapporto sui tempi di avvio: importazione dei moduli (-X importtime) e percorsi di uscita rapida.
+#
+# Uso: python benchmarks/bench_startup.py [--top 10] [--history startup.jsonl]
+#
+# Per ogni modulo del progetto riporta il tempo cumulativo di importazione e i moduli esterni
+# più costosi. Misura poi il tempo reale di analysis.py con un file inesistente (codice 2),
+# con --help e fino alla ricerca dei capitoli su un libro sintetico: nessuno di questi
+# percorsi deve importare torch o transformers. Con --history ogni esecuzione aggiunge una
+# riga JSON al file indicato, per seguire l'andamento nel tempo.
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import ANALYSIS_SCRIPT, PROJECT_DIR, write_synthetic_book  # noqa: E402
+
+PROJECT_MODULES = ["embedding_store", "readers", "analysis", "gui"]
+HEAVY_MODULES = ["torch", "transformers", "fitz", "docx", "pandas"]
+
+def import_times(module, work_dir):
+    # Restituisce {modulo: (self_us, cumulativo_us)} per tutti i moduli importati, nell'ordine di -X importtime.
+    env = dict(os.environ, PYTHONPATH=PROJECT_DIR)
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=work_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    times = {}
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times, output.returncode
+
+def top_level(times):
+    # Moduli importati direttamente (senza rientro nel rapporto di -X importtime), dal più lento.
+    return sorted(((name, cumulative) for name, (_, cumulative) in times.items() if "." not in name),
+                  key=lambda item: item[1], reverse=True)
+
+def timed_run(args, work_dir, stop_line=None):
+    # Tempo reale di analysis.py; con stop_line il processo viene fermato appena stampa quella riga.
+    start_time = time.perf_counter()
+    # Senza buffer: la riga cercata arriva appena viene stampata
+    process = subprocess.Popen([sys.executable, "-u", ANALYSIS_SCRIPT] + args, cwd=work_dir,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    for line in process.stdout:
+        if stop_line and line.startswith(stop_line):
+            elapsed = time.perf_counter() - start_time
+            process.kill()
+            process.wait()
+            return elapsed, None
+    process.wait()
+    return time.perf_counter() - start_time, process.returncode
+
+def main():
+    parser = argparse.ArgumentParser(description="Rapporto sui tempi di avvio")
+    parser.add_argument("--top", type=int, default=8, help="moduli esterni da mostrare per ogni modulo del progetto")
+    parser.add_argument("--history", help="file JSON lines a cui aggiungere i risultati")
+    args = parser.parse_args()
+
+    report = {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"), "python": sys.version.split()[0],
+              "imports_ms": {}, "heavy_imports": {}, "runs_s": {}}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for module in PROJECT_MODULES:
+            times, code = import_times(module, work_dir)
+            if code != 0 or module not in times:
+                print(f"{module}: importazione non riuscita (codice {code})")
+                continue
+            total_ms = times[module][1] / 1000
+            heavy = [name for name in HEAVY_MODULES if name in times]
+            report["imports_ms"][module] = round(total_ms, 1)
+            report["heavy_imports"][module] = heavy
+            print(f"\nimport {module}: {total_ms:.0f} ms" + (f"  (importa anche: {', '.join(heavy)})" if heavy else ""))
+            for name, cumulative in top_level(times)[:args.top]:
+                if name != module:
+                    print(f"  {cumulative / 1000:>8.1f} ms  {name}")
+
+        book_path = os.path.join(work_dir, "libro_benchmark.txt")
+        write_synthetic_book(book_path, 40, 3000)
+        runs = {
+            "file_inesistente": (["non_esiste.txt"], None),
+            "help": (["--help"], None),
+            "ricerca_capitoli": ([book_path, "--no-cache"], "Capitoli individuati"),
+        }
+        print()
+        for name, (run_args, stop_line) in runs.items():
+            elapsed, code = timed_run(run_args, work_dir, stop_line)
+            report["runs_s"][name] = round(elapsed, 3)
+            print(f"analysis.py {name:<18}{elapsed:>8.3f} s" + (f"  (codice {code})" if code is not None else ""))
+
+    if args.history:
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(report) + "\n")
+        print(f"\nRisultati aggiunti a {args.history}")
+
+if __name__ == "__main__":
+    main()
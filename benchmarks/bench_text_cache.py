@@ -0,0 +1,46 @@
+# Misura il guadagno della cache del testo estratto: prima apertura, riapertura e lettura di una pagina.
+#
+# Uso: python benchmarks/bench_text_cache.py [--pages 1000] [--pdf libro.pdf]
+#
+# Senza --pdf genera un PDF sintetico (vedi bench_pdf_extraction.py). La cache viene creata in
+# una cartella temporanea, così la prima apertura estrae sempre il testo dal PDF.
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import readers  # noqa: E402
+from bench_pdf_extraction import write_synthetic_pdf  # noqa: E402
+from common import timed  # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark della cache del testo estratto")
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--pdf", help="PDF da usare al posto di quello sintetico")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        pdf_path = args.pdf
+        if not pdf_path:
+            pdf_path = os.path.join(work_dir, "libro_benchmark.pdf")
+            write_synthetic_pdf(pdf_path, args.pages)
+        readers.configure_text_cache(os.path.join(work_dir, "cache"))
+
+        cold, text = timed(lambda: readers.read_book(pdf_path))
+        warm, cached_text = timed(lambda: readers.read_book(pdf_path))
+        text_path, meta = readers.lookup_text_cache(pdf_path)
+        middle = meta["chars"] // 2
+        page, page_text = timed(lambda: readers.read_cached_slice(text_path, meta, middle, middle + readers.PAGE_SIZE))
+        if cached_text != text or page_text != text[middle:middle + readers.PAGE_SIZE]:
+            print("ERRORE: il testo in cache differisce da quello estratto")
+            sys.exit(1)
+
+        print(f"PDF: {pdf_path}, {len(text)} caratteri, {len(meta['offsets']) - 1} pagine di testo")
+        print(f"{'prima apertura (estrazione)':<32}{cold:>10.3f} s")
+        print(f"{'riapertura (cache)':<32}{warm:>10.3f} s  ({cold / warm:.0f}x)")
+        print(f"{'una pagina (seek nella cache)':<32}{page * 1000:>10.3f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+# Funzioni condivise dai benchmark: libri sintetici e misura dei tempi.
+import os
+import random
+import re
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ANALYSIS_SCRIPT = os.path.join(PROJECT_DIR, "analysis.py")
+WORDS = ("il la di che e a in un per non una sono con si del le ma come mi lo ho più da "
+         "libro casa notte giorno tempo uomo donna mano occhi vita strada città mare").split()
+TOKENS_LINE = re.compile(r"Token elaborati: (\d+) in ([\d.]+) s")  # Riga finale di analysis.py
+
+def write_chapters(path, chapter_words):
+    # Scrive un libro con intestazioni "Capitolo N" e, per ogni capitolo, il numero indicato di parole casuali.
+    rng = random.Random(0)
+    with open(path, "w", encoding="utf-8") as f:
+        for chapter, words in enumerate(chapter_words, start=1):
+            f.write(f"Capitolo {chapter}\n\n")
+            f.write(" ".join(rng.choice(WORDS) for _ in range(words)) + ".\n\n")
+
+def write_synthetic_book(path, chapters, words_per_chapter):
+    # Libro di capitoli tutti della stessa lunghezza.
+    write_chapters(path, [words_per_chapter] * chapters)
+
+def timed(function, repeat=1):
+    # Tempo medio di repeat esecuzioni e risultato dell'ultima.
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start_time) / repeat, result
+
+def best_of(function, repeat):
+    # Tempo migliore su più ripetizioni (il meno disturbato da altri processi) e risultato dell'ultima.
+    best = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start_time)
+    return best, result
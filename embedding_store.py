@@ -0,0 +1,118 @@
+import os
+import json
+import datetime
+import numpy as np
+
+# Archivio binario degli embedding di un libro, condiviso da analysis.py e gui.py.
+#
+# {libro}-embeddings.f32   matrice float32 (una riga per capitolo), scritta in append
+# {libro}-embeddings.json  indice: capitolo -> riga, stato e data di completamento, più il
+#                          percorso del file originale (source) per riaprire il libro
+#
+# La lettura di un singolo capitolo mappa in memoria solo la sua riga (numpy.memmap).
+# L'indice fa anche da diario dell'analisi: ogni cambio di stato di un capitolo viene
+# salvato subito e in modo atomico, così un'analisi interrotta può essere ripresa.
+
+STATUS_PENDING = "pending"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+def store_paths(output_dir, book_name):
+    base = os.path.join(output_dir, f"{book_name}-embeddings")
+    return f"{base}.f32", f"{base}.json"
+
+def read_store_index(output_dir, book_name):
+    # Restituisce l'indice dell'archivio, o None se il libro non è mai stato analizzato.
+    _, index_path = store_paths(output_dir, book_name)
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def read_chapter_embedding(output_dir, book_name, chapter_num, index=None):
+    # Legge la riga di un capitolo senza caricare il resto della matrice.
+    if index is None:
+        index = read_store_index(output_dir, book_name)
+    entry = index["chapters"].get(str(chapter_num)) if index else None
+    if not entry or entry.get("row") is None:
+        return None
+
+    data_path, _ = store_paths(output_dir, book_name)
+    dtype = np.dtype(index["dtype"])
+    row_size = index["dim"] * dtype.itemsize
+    return np.array(np.memmap(data_path, dtype=dtype, mode="r", offset=entry["row"] * row_size, shape=(index["dim"],)))
+
+class EmbeddingStore:
+    # Scrittore dell'archivio: va usato da un solo processo (quello principale).
+
+    def __init__(self, output_dir, book_name, model_name, source=None):
+        self.data_path, self.index_path = store_paths(output_dir, book_name)
+        self.index = read_store_index(output_dir, book_name)
+        if self.index is None or self.index.get("model") != model_name or not os.path.exists(self.data_path):
+            # Archivio assente o prodotto da un altro modello: si riparte da zero
+            self.index = {"model": model_name, "dim": None, "dtype": "float32", "rows": 0, "chapters": {}}
+            open(self.data_path, "wb").close()
+        if source:
+            self.index["source"] = os.path.abspath(source)
+
+    def save_index(self):
+        # Scrittura atomica dell'indice: chi legge vede sempre la versione precedente o quella nuova.
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.index_path)
+
+    def set_status(self, chapter_num, status, **fields):
+        entry = self.index["chapters"].setdefault(str(chapter_num), {"row": None})
+        entry.pop("error", None)
+        entry.update(fields, status=status, timestamp=datetime.datetime.now().isoformat(timespec="seconds"))
+
+    def is_completed(self, chapter_num, key):
+        # Vero se il capitolo è già stato analizzato con lo stesso testo e gli stessi parametri.
+        entry = self.index["chapters"].get(str(chapter_num))
+        return bool(entry) and entry["status"] == STATUS_COMPLETED and entry.get("key") == key
+
+    def retain(self, chapter_numbers):
+        # I capitoli che non fanno più parte del libro escono dall'indice.
+        chapter_numbers = {str(chapter_num) for chapter_num in chapter_numbers}
+        self.index["chapters"] = {chapter: entry for chapter, entry in self.index["chapters"].items() if chapter in chapter_numbers}
+        self.save_index()
+
+    def mark_pending(self, chapter_numbers):
+        for chapter_num in chapter_numbers:
+            self.set_status(chapter_num, STATUS_PENDING)
+        self.save_index()
+
+    def add_pending(self, chapter_num):
+        self.set_status(chapter_num, STATUS_PENDING)
+        self.save_index()
+
+    def mark_failed(self, chapter_num, error):
+        self.set_status(chapter_num, STATUS_FAILED, error=error)
+        self.save_index()
+
+    def write(self, chapter_num, embeddings, key=None):
+        # Un capitolo già presente riusa la propria riga, uno nuovo viene aggiunto in fondo.
+        vector = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(-1)
+        if self.index["dim"] is None:
+            self.index["dim"] = vector.shape[0]
+        elif vector.shape[0] != self.index["dim"]:
+            raise ValueError(f"Dimensione dell'embedding inattesa: {vector.shape[0]} invece di {self.index['dim']}")
+
+        row = self.index["chapters"].get(str(chapter_num), {}).get("row")
+        if row is None:
+            row = self.index["rows"]
+            self.index["rows"] += 1
+
+        with open(self.data_path, "r+b") as f:
+            f.seek(row * vector.nbytes)
+            f.write(vector.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        # L'indice punta alla riga solo dopo che i dati sono stati scritti
+        self.set_status(chapter_num, STATUS_COMPLETED, row=row, key=key)
+        self.save_index()
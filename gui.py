@@ -1,13 +1,22 @@
 import tkinter as tk
 from tkinter import filedialog, scrolledtext, messagebox, Menu, ttk, simpledialog
-import fitz  # PyMuPDF per PDF
-import docx  # python-docx per Word
 import configparser  # Per salvare le impostazioni
 import os
+import sys
 import logging
 import csv
-import pandas as pd  # Per leggere i file CSV
 import subprocess
+import threading
+import queue
+import json
+import datetime
+import bisect
+import numpy as np
+from embedding_store import store_paths, read_store_index, read_chapter_embedding, STATUS_COMPLETED, STATUS_FAILED
+import readers
+from readers import PagedText, iter_book, lookup_text_cache, read_book
+from search import ChapterSearchIndex, read_summary
+from analysis_service import run_in_service
 
 
 # Configurazione logging
@@ -16,12 +25,29 @@ logging.basicConfig(filename=LOG_FILE, level=logging.ERROR, format='%(asctime)s
 
 # Configurazione iniziale
 PAGE_SIZE = 3300
-text_pages = []
+text_pages = []  # Lista di pagine o PagedText (pagine lette dalla cache del testo)
 current_page = 0
 current_file = None
 profile_file = "profile.ini"
-analysis_data = {}
+chapter_start_pages = []  # Pagina iniziale (da 1) di ogni capitolo, in ordine crescente
+chapter_numbers = []  # Capitolo che inizia alla pagina corrispondente di chapter_start_pages
+chapter_titles = {}  # Capitolo -> titolo, se il riepilogo ha la colonna "Titolo"
 book_name = ""
+PROGRESS_PREFIX = "PROGRESS "  # Deve essere lo stesso di analysis.py
+analysis_running = False  # Analisi in corso, nel servizio di analisi o in un processo di analysis.py
+analysis_book = ""  # Libro dell'analisi in corso
+analysis_events = queue.Queue()  # Eventi letti dal thread secondario, consumati dal mainloop
+store_cache = {}  # Percorso dell'indice -> (versione del file, indice, {capitolo: embedding})
+displayed_analysis = None  # (libro, capitolo, versione dell'indice) mostrati nel pannello di analisi
+settings_save_job = None  # Salvataggio delle impostazioni in attesa (vedi schedule_settings_save)
+SETTINGS_SAVE_DELAY_MS = 1000
+search_index = ChapterSearchIndex("analyses")  # Embedding di tutti i libri analizzati (vedi search.py)
+search_results = []  # (punteggio, libro, capitolo) mostrati nella lista dei risultati
+search_events = queue.Queue()  # Risultati delle ricerche testuali, calcolati in un thread secondario
+SEARCH_RESULTS = 20
+loading_events = queue.Queue()  # (generazione, evento, dati) dal thread che estrae il testo del libro
+loading_generation = 0  # Cresce a ogni apertura: gli eventi di un'estrazione precedente vengono ignorati
+loading_page = None  # Pagina da mostrare al termine dell'estrazione in corso, o None
 
 # Lettura delle impostazioni salvate
 config = configparser.ConfigParser()
@@ -44,15 +70,29 @@ def save_settings():
     config["Settings"]["window_width"] = str(root.winfo_width())
     config["Settings"]["window_height"] = str(root.winfo_height())
     config["Settings"]["last_file"] = current_file if current_file else ""
-    config["Settings"]["last_page"] = str(current_page)
+    config["Settings"]["last_page"] = str(current_page if loading_page is None else loading_page)
     
     with open(profile_file, "w") as file:
         config.write(file)
 
+def schedule_settings_save():
+    # Girando le pagine le impostazioni si salvano una volta sola, quando l'utente si ferma.
+    global settings_save_job
+    if settings_save_job is not None:
+        root.after_cancel(settings_save_job)
+    settings_save_job = root.after(SETTINGS_SAVE_DELAY_MS, flush_settings_save)
 
-def open_file(filepath=None):
-    # Apre un file TXT, PDF o DOCX, lo divide in pagine e mostra la prima pagina.
-    global text_pages, current_page, current_file, analysis_data, book_name
+def flush_settings_save():
+    global settings_save_job
+    settings_save_job = None
+    save_settings()
+
+
+def open_file(filepath=None, page=0):
+    # Apre un file TXT, PDF o DOCX e ne mostra la pagina indicata (la prima se non specificata).
+    # Se il testo è già nella cache le pagine si leggono a richiesta (vedi readers.PagedText);
+    # altrimenti viene estratto in un thread secondario e la prima pagina compare appena pronta.
+    global text_pages, current_page, current_file, book_name, loading_generation, loading_page
     try:
         if not filepath:
             filepath = filedialog.askopenfilename(filetypes=[
@@ -69,19 +109,29 @@ def open_file(filepath=None):
         
         root.title(f"Book Analyzer - {book_name}")
 
-        if filepath.endswith(".txt"):
-            with open(filepath, "r", encoding="utf-8") as file:
-                text = file.read()
-        elif filepath.endswith(".pdf"):
-            text = extract_text_from_pdf(filepath)
-        elif filepath.endswith(".docx"):
-            text = extract_text_from_docx(filepath)
-        else:
-            text = "Formato non supportato."
-
-        # Dividi il testo in pagine
-        text_pages = [text[i:i + PAGE_SIZE] for i in range(0, len(text), PAGE_SIZE)]
+        close_pages()
+        loading_generation += 1
+        loading_page = None
         current_page = 0
+        if not filepath.lower().endswith((".txt", ".pdf", ".docx")):
+            text_pages = ["Formato non supportato."]
+        elif not readers.text_cache_dir:
+            # Senza cache del testo il libro resta tutto in memoria, diviso in pagine
+            text = read_book(filepath)
+            text_pages = [text[i:i + PAGE_SIZE] for i in range(0, len(text), PAGE_SIZE)]
+        else:
+            # Il testo estratto è nella cache condivisa con analysis.py (vedi readers.py)
+            cached = lookup_text_cache(filepath)
+            if cached:
+                text_pages = PagedText(*cached)
+            else:
+                text_pages = []
+                loading_page = page
+                page_label.config(text="Estrazione del testo in corso...")
+                threading.Thread(target=extract_book_text, args=(filepath, loading_generation), daemon=True).start()
+                root.after(50, poll_loading)
+        if text_pages:
+            current_page = max(0, min(page, len(text_pages) - 1))
 
         # Modifica il percorso del file di analisi per cercarlo nella cartella "analyses"
         analysis_file = os.path.join("analyses", book_name, f"{book_name}-analysis.csv")
@@ -94,53 +144,185 @@ def open_file(filepath=None):
         logging.error(str(e))
         messagebox.showerror("Errore", f"Errore: {str(e)}")
 
-def extract_text_from_pdf(pdf_path):
-    doc = fitz.open(pdf_path)
-    return "\n".join([page.get_text() for page in doc])
+def close_pages():
+    global text_pages
+    if isinstance(text_pages, PagedText):
+        text_pages.close()
+    text_pages = []
 
-def extract_text_from_docx(docx_path):
-    doc = docx.Document(docx_path)
-    return "\n".join([para.text for para in doc.paragraphs])
+def extract_book_text(filepath, generation):
+    # Thread secondario: estrae il libro nella cache del testo, segnalando subito la prima pagina.
+    try:
+        first_page = ""
+        for piece in iter_book(filepath):
+            if len(first_page) < PAGE_SIZE:
+                first_page += piece
+                if len(first_page) >= PAGE_SIZE:
+                    loading_events.put((generation, "first_page", first_page[:PAGE_SIZE]))
+        loading_events.put((generation, "ready", filepath))
+    except Exception as e:
+        logging.error(str(e))
+        loading_events.put((generation, "error", str(e)))
+
+def poll_loading():
+    global text_pages, loading_page
+    while True:
+        try:
+            generation, event, payload = loading_events.get_nowait()
+        except queue.Empty:
+            break
+        if generation != loading_generation:
+            continue  # Estrazione di un libro non più aperto
+        if event == "first_page":
+            # Anteprima della prima pagina mentre l'estrazione prosegue
+            text_pages = [payload]
+            show_page(0)
+            page_label.config(text="Pagina 1 (estrazione in corso...)")
+        elif event == "ready":
+            cached = lookup_text_cache(payload)
+            if cached:
+                text_pages = PagedText(*cached)
+            else:
+                # Voce non valida (file modificato durante l'estrazione): si torna al testo in memoria
+                text = read_book(payload)
+                text_pages = [text[i:i + PAGE_SIZE] for i in range(0, len(text), PAGE_SIZE)]
+            page = max(0, min(loading_page, len(text_pages) - 1))
+            loading_page = None
+            show_page(page)
+            return
+        else:
+            loading_page = None
+            messagebox.showerror("Errore", f"Errore: {payload}")
+            return
+    root.after(50, poll_loading)
 
 def run_analysis():
-    if current_file:
-        progress_bar.start()
-        
-        process = subprocess.Popen(
-            ["python", "analysis.py", current_file],  # Passa il percorso completo
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
+    # Avvia l'analisi senza bloccare la finestra: l'output viene letto da un thread secondario.
+    global analysis_running, analysis_book
+    if current_file and not analysis_running:
+        analysis_running = True
+        analysis_book = book_name
+        analyze_button.config(state=tk.DISABLED)
+        progress_bar.config(value=0, maximum=1)
+        progress_label.config(text="Avvio analisi...")
+        threading.Thread(target=analysis_job, args=(current_file,), daemon=True).start()
+        root.after(100, poll_analysis)
+
+def analysis_job(filepath):
+    # Thread secondario: usa il servizio di analisi se è avviato (modello già caricato),
+    # altrimenti lancia analysis.py come processo separato. L'evento "exit" arriva sempre,
+    # anche se l'analisi non parte: altrimenti il pulsante resterebbe disattivato.
+    arguments = [filepath, "--progress"]  # Passa il percorso completo
+    try:
+        status_code = run_in_service(arguments, os.getcwd(), read_analysis_line, analysis_events.put)
+        if status_code is None:
+            process = subprocess.Popen(
+                [sys.executable, "analysis.py", *arguments, "--no-service"],  # Lo stesso interprete della GUI
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True
+            )
+            for line in process.stdout:
+                read_analysis_line(line)
+            status_code = process.wait()
+    except Exception as e:
+        logging.exception("Errore durante l'analisi")
+        analysis_events.put({"event": "exit", "code": None, "error": f"{type(e).__name__}: {e}"})
+        return
+    analysis_events.put({"event": "exit", "code": status_code})
+
+def read_analysis_line(line):
+    # Smista le righe di avanzamento e stampa il resto nel terminale.
+    line = line.rstrip("\n")
+    # La riga di avanzamento può seguire un messaggio di un worker rimasto senza "a capo"
+    position = line.find(PROGRESS_PREFIX)
+    if position >= 0:
+        try:
+            event = json.loads(line[position + len(PROGRESS_PREFIX):])
+        except ValueError:
+            print(line)  # Riga di avanzamento incompleta: resta solo nel terminale
+            return
+        if position > 0:
+            print(line[:position])
+        analysis_events.put(event)
+    else:
+        print(line)  # Stampa direttamente nel terminale
+
+def poll_analysis():
+    # Consuma gli eventi nel thread di Tk (i widget non vanno toccati da altri thread).
+    while True:
+        try:
+            event = analysis_events.get_nowait()
+        except queue.Empty:
+            break
+        handle_analysis_event(event)
+    if analysis_running:
+        root.after(100, poll_analysis)
+
+def format_eta(seconds):
+    if seconds is None:
+        return "ETA in calcolo"
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"ETA {minutes}:{seconds:02d}"
+
+def handle_analysis_event(event):
+    showing_analyzed_book = book_name == analysis_book
+    if event["event"] == "queued":
+        if event["position"]:
+            progress_label.config(text=f"In coda nel servizio di analisi: {event['position']} lavori prima di questo")
+    elif event["event"] == "chapters":
+        progress_bar.config(maximum=max(event["chapters_total"], 1))
+    elif event["event"] == "summary":
+        # I capitoli sono noti: i pulsanti compaiono prima della fine dell'analisi
+        if showing_analyzed_book:
+            load_analysis_data(event["file"])
+            show_page()
+    elif event["event"] == "chapter":
+        total = f"{event['chapters_total']}" if event["final"] else f"{event['chapters_total']}+"
+        progress_bar.config(maximum=max(event["chapters_total"], 1), value=event["chapters_done"])
+        progress_label.config(text=f"Capitoli {event['chapters_done']}/{total} - {event['tokens']} token - {format_eta(event['eta_s'])}")
+        # Se il capitolo appena completato è quello visualizzato, ne mostra subito i risultati
+        if showing_analyzed_book and chapter_numbers and str(event["chapter"]) == current_chapter():
+            update_analysis_display()
+    elif event["event"] == "exit":
+        finish_analysis(event["code"], event.get("error"))
+
+def finish_analysis(status_code, error=None):
+    global analysis_running, displayed_analysis
+    analysis_running = False
+    displayed_analysis = None
+    analyze_button.config(state=tk.NORMAL)
+    progress_label.config(text="")
 
-        # Stampa in tempo reale l'output nel terminale
-        for line in process.stdout:
-            print(line, end="")  # Stampa direttamente nel terminale
+    analysis_text.config(state=tk.NORMAL)
+    analysis_text.delete("1.0", tk.END)
 
-        process.wait()
-        status_code = process.returncode
+    match status_code:
+        case _ if error:
+            messagebox.showerror("Errore", f"Impossibile eseguire l'analisi: {error}")
+        case 0:
+            progress_bar.config(value=progress_bar["maximum"])
+            messagebox.showinfo("Successo", f"Analisi completata. Riepilogo salvato nel file {analysis_book}-analysis.csv")
+        case 1:
+            messagebox.showerror("Errore", "Errore: specificare il file da analizzare.")
+        case 2:
+            messagebox.showerror("Errore", "Errore: file non trovato.")
+        case 3:
+            messagebox.showerror("Errore", "Analisi non riuscita per alcuni capitoli. Rilanciare l'analisi per completarla.")
+        case _:
+            messagebox.showerror("Errore", f"Codice di errore sconosciuto: {status_code}")
         
-        progress_bar.stop()
-
-        analysis_text.config(state=tk.NORMAL)
-        analysis_text.delete("1.0", tk.END)
-
-        match status_code:
-            case 0:
-                messagebox.showinfo("Successo", f"Analisi completata. Riepilogo salvato nel file {book_name}-analysis.csv")
-            case 1:
-                messagebox.showerror("Errore", "Errore: specificare il file da analizzare.")
-            case 2:
-                messagebox.showerror("Errore", "Errore: file non trovato.")
-            case _:
-                messagebox.showerror("Errore", f"Codice di errore sconosciuto: {status_code}")
-            
-        analysis_text.config(state=tk.DISABLED)
+    analysis_text.config(state=tk.DISABLED)
+    if book_name == analysis_book:
         load_analysis_data(os.path.join("analyses", book_name, f"{book_name}-analysis.csv"))  # Ricarica i dati di analisi
+        show_page()
 
 def load_analysis_data(filepath):
-    global analysis_data
-    analysis_data = {}
+    # Legge dal riepilogo solo la pagina iniziale di ogni capitolo: la pagina corrente
+    # si associa al capitolo con una ricerca binaria (vedi current_chapter).
+    global chapter_start_pages, chapter_numbers, chapter_titles
+    starts = []
+    chapter_titles = {}
     if os.path.exists(filepath):
         with open(filepath, "r", encoding="utf-8") as file:
             reader = csv.reader(file)
@@ -156,43 +338,82 @@ def load_analysis_data(filepath):
                         
                         # Estrai l'inizio e la fine dell'intervallo di pagine, assicurandoti che siano numeri
                         start_page, end_page = map(int, pages_range.split('-'))
-                        # Aggiungi ogni pagina nell'intervallo al dizionario
-                        for page in range(start_page, end_page + 1):
-                            analysis_data[page] = chapter
+                        if len(row) >= 3 and row[2]:
+                            chapter_titles[chapter] = row[2]
+                        starts.append((start_page, chapter))
                     except ValueError as e:
                         print(f"Errore nella conversione della pagina di inizio o fine: {row[1]} - {e}")
     else:
         print(f"File di analisi non trovato: {filepath} ")  # Debug
+    # Ordinamento stabile: tra capitoli che iniziano alla stessa pagina vale l'ultimo del riepilogo
+    starts.sort(key=lambda start: start[0])
+    chapter_start_pages = [start_page for start_page, _ in starts]
+    chapter_numbers = [chapter for _, chapter in starts]
     update_chapters_display()  # Aggiorna la visualizzazione dei capitoli
 
+def format_chapter_status(entry):
+    # Converte lo stato salvato nell'indice nel testo mostrato all'utente.
+    if entry["status"] == STATUS_COMPLETED:
+        completion_time = datetime.datetime.fromisoformat(entry["timestamp"]).strftime("%d/%m/%Y alle %H:%M:%S")
+        return f"Analisi completata il {completion_time}"
+    if entry["status"] == STATUS_FAILED:
+        return f"Analisi non riuscita: {entry.get('error', '')}"
+    return "Analisi non completa"
+
+def current_chapter():
+    # Capitolo che contiene la pagina corrente, o None: l'ultimo che inizia entro la pagina.
+    position = bisect.bisect_right(chapter_start_pages, current_page + 1) - 1
+    return chapter_numbers[position] if position >= 0 else None
+
+def cached_store(output_dir, book_name):
+    # Indice dell'archivio e cache degli embedding letti, come (versione, indice, embedding).
+    # L'indice viene sostituito a ogni scrittura (os.replace): inode e mtime ne identificano la versione
+    # e finché non cambiano non si rilegge nulla dal disco.
+    _, index_path = store_paths(output_dir, book_name)
+    try:
+        stat = os.stat(index_path)
+    except OSError:
+        return None, None, {}
+    version = (stat.st_ino, stat.st_mtime_ns)
+    cached = store_cache.get(index_path)
+    if cached is None or cached[0] != version:
+        cached = (version, read_store_index(output_dir, book_name), {})
+        store_cache[index_path] = cached
+    return cached
+
 def update_analysis_display():
     # print("Aggiornamento display analisi")  # Debug
+    global displayed_analysis
+    chapter = current_chapter()
+    output_dir = os.path.join("analyses", book_name)
+    version, index, embeddings_cache = cached_store(output_dir, book_name)
+    if displayed_analysis == (book_name, chapter, version):
+        return  # Stesso capitolo e archivio invariato: il pannello è già aggiornato
+    displayed_analysis = (book_name, chapter, version)
+
     analysis_text.config(state=tk.NORMAL)
     analysis_text.delete("1.0", tk.END)
-    for start_page in sorted(analysis_data.keys(), reverse=True):
-        if current_page + 1 >= start_page:
-            chapter = analysis_data[start_page]
-            analysis_text.insert(tk.END, f"Capitolo {chapter}\n")
-            # print(f"Mostrato capitolo {chapter} per pagina {current_page + 1}")  # Debug
-            
-            # Leggi il contenuto del file di analisi del capitolo corrente
-            analysis_file = os.path.join("analyses", book_name, f"{book_name}-capitolo{chapter}-analysis.csv")
-            if os.path.exists(analysis_file):
-                with open(analysis_file, "r", encoding="utf-8") as file:
-                    reader = csv.reader(file)
-                    next(reader)  # Salta la prima riga (legenda)
-                    for row in reader:
-                        if len(row) >= 2:
-                            analysis_text.insert(tk.END, f"{row[1]}\n")
-                            # print(f"Mostrato contenuto analisi: {row[1]}")  # Debug
-            else:
-                analysis_text.insert(tk.END, "Analisi non trovata.")
-                # print("Analisi non trovata.")  # Debug
-            break
+    if chapter is not None:
+        analysis_text.insert(tk.END, f"Capitolo {chapter}\n")
+        # print(f"Mostrato capitolo {chapter} per pagina {current_page + 1}")  # Debug
+        
+        # Stato ed embedding del capitolo corrente dall'archivio binario
+        entry = index["chapters"].get(str(chapter)) if index else None
+        if entry:
+            analysis_text.insert(tk.END, f"{format_chapter_status(entry)}\n")
+            if entry["status"] == STATUS_COMPLETED:
+                if chapter not in embeddings_cache:
+                    embeddings_cache[chapter] = read_chapter_embedding(output_dir, book_name, chapter, index)
+                embeddings = embeddings_cache[chapter]
+                preview = np.array2string(embeddings[:8], precision=4, separator=", ")
+                analysis_text.insert(tk.END, f"Embedding ({embeddings.shape[0]} valori): {preview}\n")
+        else:
+            analysis_text.insert(tk.END, "Analisi non trovata.")
+            # print("Analisi non trovata.")  # Debug
     analysis_text.config(state=tk.DISABLED)
 
 def create_chapter_button(chapter, start_page):
-    button = tk.Button(chapters_inner_frame, text=f"Capitolo {chapter}", command=lambda: show_page(start_page - 1), width=20)
+    button = tk.Button(chapters_inner_frame, text=chapter_titles.get(chapter, f"Capitolo {chapter}"), command=lambda: show_page(start_page - 1), width=20)
     button.pack(fill="x", padx=5, pady=2)
     # print(f"Creato pulsante per Capitolo {chapter} - Pagina {start_page}")  # Debug
 
@@ -200,21 +421,99 @@ def update_chapters_display():
     for widget in chapters_inner_frame.winfo_children():
         widget.destroy()
     
-    if not analysis_data:  # Se il dizionario è vuoto, vuol dire che non ha caricato nulla
+    if not chapter_numbers:  # Se la lista è vuota, vuol dire che non ha caricato nulla
         label = tk.Label(chapters_inner_frame, text="File di analisi non trovato.\nPremere 'Avvia Analisi' per generarlo.", font=("Arial", default_font_size))
         label.pack(fill="x", padx=5, pady=5)
     else:
         # Creare pulsanti solo per l'inizio di ogni capitolo
         created_chapters = set()
-        for start_page in sorted(analysis_data.keys()):
-            chapter = analysis_data[start_page]
+        for start_page, chapter in zip(chapter_start_pages, chapter_numbers):
             if chapter not in created_chapters:
                 create_chapter_button(chapter, start_page)
                 created_chapters.add(chapter)
 
 
+def search_text():
+    # La query va codificata con BERT: il calcolo avviene in un thread secondario
+    # e i risultati tornano al mainloop tramite search_events.
+    query = search_entry.get().strip()
+    if not query:
+        return
+    search_index.refresh()
+    if not search_index.labels:
+        messagebox.showinfo("Ricerca", "Nessun capitolo analizzato in cui cercare.")
+        return
+    search_button.config(state=tk.DISABLED)
+    search_status.config(text="Ricerca in corso...")
+    threading.Thread(target=run_text_search, args=(query,), daemon=True).start()
+    root.after(100, poll_search)
+
+def run_text_search(query):
+    try:
+        search_events.put(("results", search_index.search_text(query, SEARCH_RESULTS)))
+    except Exception as e:
+        logging.error(str(e))
+        search_events.put(("error", str(e)))
+
+def poll_search():
+    try:
+        kind, payload = search_events.get_nowait()
+    except queue.Empty:
+        root.after(100, poll_search)
+        return
+    search_button.config(state=tk.NORMAL)
+    if kind == "error":
+        search_status.config(text="")
+        messagebox.showerror("Errore", f"Ricerca non riuscita: {payload}")
+    else:
+        show_search_results(payload)
+
+def search_similar():
+    # Il capitolo corrente è già nella matrice: basta un prodotto matrice-vettore, senza BERT.
+    chapter = current_chapter() if chapter_numbers else None
+    if chapter is None:
+        messagebox.showinfo("Ricerca", "Nessun capitolo associato alla pagina corrente.")
+        return
+    search_index.refresh()
+    results = search_index.similar_to(book_name, chapter, SEARCH_RESULTS)
+    if results is None:
+        messagebox.showinfo("Ricerca", f"Il capitolo {chapter} non è ancora stato analizzato.")
+        return
+    show_search_results(results)
+
+def show_search_results(results):
+    global search_results
+    search_results = results
+    search_list.delete(0, tk.END)
+    summaries = {}
+    for score, result_book, chapter in results:
+        summary = summaries.setdefault(result_book, read_summary("analyses", result_book))
+        pages, title = summary.get(chapter, ("?", ""))
+        label = title if title else f"Capitolo {chapter}"
+        search_list.insert(tk.END, f"{score:.3f}  {result_book} - {label} (pag. {pages})")
+    search_status.config(text=f"{len(results)} risultati su {len(search_index.labels)} capitoli")
+
+def open_search_result(event=None):
+    # Apre il libro del risultato (se diverso da quello corrente) e va all'inizio del capitolo.
+    selection = search_list.curselection()
+    if not selection:
+        return
+    _, result_book, chapter = search_results[selection[0]]
+    if result_book != book_name:
+        source = search_index.source(result_book)
+        if not source or not os.path.exists(source):
+            messagebox.showerror("Errore", f"File originale di {result_book} non trovato.")
+            return
+        open_file(source)
+    if chapter in chapter_numbers:
+        show_page(chapter_start_pages[chapter_numbers.index(chapter)] - 1)
+
+
 def show_page(page_num=None):
-    global book_name, analysis_data, current_page
+    global book_name, current_page, displayed_analysis, loading_page
+    if loading_page is not None and page_num is not None and page_num >= len(text_pages):
+        loading_page = page_num  # Pagina non ancora estratta: verrà mostrata al termine dell'estrazione
+        return
     if page_num is not None:
         current_page = page_num
     # print(f"Mostra pagina {current_page}")  # Debug
@@ -225,14 +524,21 @@ def show_page(page_num=None):
         text_area.insert(tk.END, text_pages[current_page])
         text_area.config(state=tk.DISABLED)
         page_label.config(text=f"Pagina {current_page + 1} di {len(text_pages)}")
-        if analysis_data:
+        root.after_idle(prefetch_pages)
+        if chapter_numbers:
             update_analysis_display()
         else:
+            displayed_analysis = None
             analysis_text.config(state=tk.NORMAL)
             analysis_text.delete("1.0", tk.END)
             analysis_text.insert(tk.END, f"Analisi non trovata per {book_name}")
             # print(f"Analisi non trovata per {book_name}")  # Debug
-        save_settings()
+        schedule_settings_save()
+
+def prefetch_pages():
+    # A finestra ferma si decodificano le pagine vicine a quella corrente.
+    if isinstance(text_pages, PagedText):
+        text_pages.prefetch(current_page)
 
 def next_page(event=None):
     # Mostra la pagina successiva.
@@ -281,117 +587,142 @@ def show_contacts():
 
 
 
-# Creazione GUI
-root = tk.Tk()
-root.title("Caricamento Libro a Pagine")
-root.geometry(f"{window_width}x{window_height}")
-root.state('zoomed')
+# Creazione GUI (solo se avviato direttamente: i processi di estrazione dei PDF
+# reimportano questo modulo e non devono aprire un'altra finestra)
+if __name__ == "__main__":
+    # Creazione GUI
+    root = tk.Tk()
+    root.title("Caricamento Libro a Pagine")
+    root.geometry(f"{window_width}x{window_height}")
+    root.state('zoomed')
 
-# Menu principale
-menu_bar = Menu(root)
+    # Menu principale
+    menu_bar = Menu(root)
 
-# sezione file
-file_menu = Menu(menu_bar, tearoff=0)
-file_menu.add_command(label="Apri File", command=open_file)
-file_menu.add_separator()
-file_menu.add_command(label="Esci", command=root.quit)
-menu_bar.add_cascade(label="File", menu=file_menu)
+    # sezione file
+    file_menu = Menu(menu_bar, tearoff=0)
+    file_menu.add_command(label="Apri File", command=open_file)
+    file_menu.add_separator()
+    file_menu.add_command(label="Esci", command=root.quit)
+    menu_bar.add_cascade(label="File", menu=file_menu)
 
-# sezione impostazioni
-settings_menu = Menu(menu_bar, tearoff=0)
-settings_menu.add_command(label="Aumenta Zoom: ctrl + ", command=increase_font)
-settings_menu.add_command(label="Diminuisci Zoom: ctrl - ", command=decrease_font)
-settings_menu.add_separator()
-settings_menu.add_command(label="Pagina Successiva: Freccia Destra → ", command=next_page)
-settings_menu.add_command(label="Pagina precedente: Freccia Sinistra ← ", command=prev_page)
-settings_menu.add_separator()
-settings_menu.add_command(label="Vai a pagina", command=go_to_page)
-menu_bar.add_cascade(label="Impostazioni", menu=settings_menu)
+    # sezione impostazioni
+    settings_menu = Menu(menu_bar, tearoff=0)
+    settings_menu.add_command(label="Aumenta Zoom: ctrl + ", command=increase_font)
+    settings_menu.add_command(label="Diminuisci Zoom: ctrl - ", command=decrease_font)
+    settings_menu.add_separator()
+    settings_menu.add_command(label="Pagina Successiva: Freccia Destra → ", command=next_page)
+    settings_menu.add_command(label="Pagina precedente: Freccia Sinistra ← ", command=prev_page)
+    settings_menu.add_separator()
+    settings_menu.add_command(label="Vai a pagina", command=go_to_page)
+    menu_bar.add_cascade(label="Impostazioni", menu=settings_menu)
 
-# sezione contatti
-contacts_menu = Menu(menu_bar, tearoff=0)
-contacts_menu.add_command(label="Contatti", command=show_contacts)
-menu_bar.add_cascade(label="Contatti", menu=contacts_menu)
+    # sezione contatti
+    contacts_menu = Menu(menu_bar, tearoff=0)
+    contacts_menu.add_command(label="Contatti", command=show_contacts)
+    menu_bar.add_cascade(label="Contatti", menu=contacts_menu)
 
-root.config(menu=menu_bar)
+    root.config(menu=menu_bar)
 
-nav_frame = tk.Frame(root)
-nav_frame.pack(fill='x')
+    nav_frame = tk.Frame(root)
+    nav_frame.pack(fill='x')
 
-# Frame per i pulsanti di navigazione (centrali)
-nav_buttons_frame = tk.Frame(nav_frame)
-nav_buttons_frame.pack(side=tk.LEFT, expand=True)
+    # Frame per i pulsanti di navigazione (centrali)
+    nav_buttons_frame = tk.Frame(nav_frame)
+    nav_buttons_frame.pack(side=tk.LEFT, expand=True)
 
-tk.Button(nav_buttons_frame, text="← Pagina Precedente", command=prev_page).pack(side=tk.LEFT, padx=5)
+    tk.Button(nav_buttons_frame, text="← Pagina Precedente", command=prev_page).pack(side=tk.LEFT, padx=5)
 
-page_label = tk.Label(nav_buttons_frame, text="Pagina 1 di 1")
-page_label.pack(side=tk.LEFT, padx=10)
+    page_label = tk.Label(nav_buttons_frame, text="Pagina 1 di 1")
+    page_label.pack(side=tk.LEFT, padx=10)
 
-tk.Button(nav_buttons_frame, text="Pagina Successiva →", command=next_page).pack(side=tk.LEFT, padx=5)
+    tk.Button(nav_buttons_frame, text="Pagina Successiva →", command=next_page).pack(side=tk.LEFT, padx=5)
 
 
-# Frame per la barra di avanzamento e il pulsante di analisi (destra)
-analysis_frame = tk.Frame(nav_frame)
-analysis_frame.pack(side=tk.RIGHT, padx=10)
+    # Frame per la barra di avanzamento e il pulsante di analisi (destra)
+    analysis_frame = tk.Frame(nav_frame)
+    analysis_frame.pack(side=tk.RIGHT, padx=10)
 
-progress_bar = ttk.Progressbar(analysis_frame, mode='indeterminate')
-progress_bar.pack(side=tk.RIGHT, padx=5)
+    progress_label = tk.Label(analysis_frame, text="")
+    progress_label.pack(side=tk.RIGHT, padx=5)
 
-analyze_button = tk.Button(analysis_frame, text="Avvia Analisi", command=run_analysis)
-analyze_button.pack(side=tk.RIGHT, padx=5)
+    progress_bar = ttk.Progressbar(analysis_frame, mode='determinate', length=200)
+    progress_bar.pack(side=tk.RIGHT, padx=5)
 
+    analyze_button = tk.Button(analysis_frame, text="Avvia Analisi", command=run_analysis)
+    analyze_button.pack(side=tk.RIGHT, padx=5)
 
-# Bind per lo zoom con tastiera
-root.bind("<Control-plus>", increase_font)
-root.bind("<Control-minus>", decrease_font)
 
-# Bind per il cambio pagina con le freccette
-root.bind("<Right>", next_page)
-root.bind("<Left>", prev_page)
+    # Bind per lo zoom con tastiera
+    root.bind("<Control-plus>", increase_font)
+    root.bind("<Control-minus>", decrease_font)
 
-main_frame = tk.Frame(root)
-main_frame.pack(fill="both", expand=True)
+    # Bind per il cambio pagina con le freccette
+    root.bind("<Right>", next_page)
+    root.bind("<Left>", prev_page)
 
-text_area = scrolledtext.ScrolledText(main_frame, width=60, height=20, state=tk.DISABLED, font=("Arial", default_font_size))
-text_area.pack(side=tk.LEFT, expand=True, fill='both', padx=10, pady=10)
+    main_frame = tk.Frame(root)
+    main_frame.pack(fill="both", expand=True)
 
-right_frame = tk.Frame(main_frame)
-right_frame.pack(side=tk.RIGHT, fill="both", expand=True, padx=20, pady=10)
+    text_area = scrolledtext.ScrolledText(main_frame, width=60, height=20, state=tk.DISABLED, font=("Arial", default_font_size))
+    text_area.pack(side=tk.LEFT, expand=True, fill='both', padx=10, pady=10)
 
-# Frame per i capitoli (superiore destra)
-chapters_frame = tk.Frame(right_frame, relief=tk.GROOVE, borderwidth=2)
-chapters_frame.pack(fill="x")
+    right_frame = tk.Frame(main_frame)
+    right_frame.pack(side=tk.RIGHT, fill="both", expand=True, padx=20, pady=10)
 
-chapter_label = tk.Label(chapters_frame, text="Capitoli Trovati", font=("Arial", default_font_size, "bold"))
-chapter_label.pack()
+    # Frame per i capitoli (superiore destra)
+    chapters_frame = tk.Frame(right_frame, relief=tk.GROOVE, borderwidth=2)
+    chapters_frame.pack(fill="x")
 
-# Aggiungi una scrollbar per i pulsanti dei capitoli
-chapters_canvas = tk.Canvas(chapters_frame)
-chapters_scrollbar = tk.Scrollbar(chapters_frame, orient="vertical", command=chapters_canvas.yview)
-chapters_inner_frame = tk.Frame(chapters_canvas)
+    chapter_label = tk.Label(chapters_frame, text="Capitoli Trovati", font=("Arial", default_font_size, "bold"))
+    chapter_label.pack()
 
-chapters_inner_frame.bind(
-    "<Configure>",
-    lambda e: chapters_canvas.configure(
-        scrollregion=chapters_canvas.bbox("all")
-    )
-)
-
-chapters_canvas.create_window((0, 0), window=chapters_inner_frame, anchor="nw")
-chapters_canvas.configure(yscrollcommand=chapters_scrollbar.set)
-
-chapters_canvas.pack(side="left", fill="both", expand=True)
-chapters_scrollbar.pack(side="right", fill="y")
+    # Aggiungi una scrollbar per i pulsanti dei capitoli
+    chapters_canvas = tk.Canvas(chapters_frame)
+    chapters_scrollbar = tk.Scrollbar(chapters_frame, orient="vertical", command=chapters_canvas.yview)
+    chapters_inner_frame = tk.Frame(chapters_canvas)
 
-# Frame per l'analisi (centrale/inferiore destra)
-analysis_text = scrolledtext.ScrolledText(right_frame, width=30, height=15, state=tk.DISABLED)
-analysis_text.pack(fill="both", expand=True, padx=10, pady=10)
-
-# Ripristina ultimo file e pagina
-if last_file and os.path.exists(last_file):
-    open_file(last_file)
-    current_page = min(last_page, len(text_pages) - 1)
-    show_page(current_page)
+    chapters_inner_frame.bind(
+        "<Configure>",
+        lambda e: chapters_canvas.configure(
+            scrollregion=chapters_canvas.bbox("all")
+        )
+    )
 
-root.protocol("WM_DELETE_WINDOW", lambda: (save_settings(), root.destroy()))
-root.mainloop()
+    chapters_canvas.create_window((0, 0), window=chapters_inner_frame, anchor="nw")
+    chapters_canvas.configure(yscrollcommand=chapters_scrollbar.set)
+
+    chapters_canvas.pack(side="left", fill="both", expand=True)
+    chapters_scrollbar.pack(side="right", fill="y")
+
+    # Frame per l'analisi (centrale/inferiore destra)
+    analysis_text = scrolledtext.ScrolledText(right_frame, width=30, height=15, state=tk.DISABLED)
+    analysis_text.pack(fill="both", expand=True, padx=10, pady=10)
+
+    # Frame per la ricerca semantica (inferiore destra)
+    search_frame = tk.Frame(right_frame, relief=tk.GROOVE, borderwidth=2)
+    search_frame.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+
+    search_bar = tk.Frame(search_frame)
+    search_bar.pack(fill="x", padx=5, pady=5)
+    search_entry = tk.Entry(search_bar)
+    search_entry.pack(side=tk.LEFT, fill="x", expand=True)
+    search_entry.bind("<Return>", lambda e: search_text())
+    # Le frecce nella casella di ricerca spostano il cursore, non le pagine (binding della finestra)
+    search_entry.bindtags((search_entry, "Entry", "all"))
+    search_button = tk.Button(search_bar, text="Cerca", command=search_text)
+    search_button.pack(side=tk.LEFT, padx=5)
+    tk.Button(search_bar, text="Simili a questo capitolo", command=search_similar).pack(side=tk.LEFT)
+
+    search_status = tk.Label(search_frame, text="")
+    search_status.pack(fill="x", padx=5)
+    search_list = tk.Listbox(search_frame, height=8)
+    search_list.pack(fill="both", expand=True, padx=5, pady=5)
+    search_list.bind("<<ListboxSelect>>", open_search_result)
+
+    # Ripristina ultimo file e pagina
+    if last_file and os.path.exists(last_file):
+        open_file(last_file, last_page)
+
+    root.protocol("WM_DELETE_WINDOW", lambda: (save_settings(), root.destroy()))
+    root.mainloop()
@@ -0,0 +1,569 @@
+import sys
+import os
+import multiprocessing
+import hashlib
+import json
+import mmap
+import threading
+import collections
+import zipfile
+import xml.etree.ElementTree as ElementTree
+
+# Funzioni di lettura dei libri, condivise da analysis.py e gui.py.
+# fitz (PyMuPDF) si importa solo quando si legge un PDF; i file Word si leggono senza python-docx.
+
+TXT_BLOCK_SIZE = 3300  # Caratteri letti per volta dai file di testo (una pagina)
+PARALLEL_PDF_MIN_PAGES = 64  # Sotto questa soglia l'estrazione resta seriale
+PDF_CHUNKS_PER_WORKER = 4  # Più blocchi che processi, per bilanciare pagine lente e veloci
+PAGE_SIZE = 3300  # Caratteri per pagina, come in analysis.py e gui.py
+TEXT_CACHE_VERSION = 2
+PAGE_CACHE_SIZE = 16  # Pagine decodificate tenute in memoria da PagedText
+DEFAULT_TEXT_CACHE_DIR = os.path.join("cache", "text")
+DEFAULT_TEXT_CACHE_SIZE_MB = 1024
+DOCX_MAIN_PART = "word/document.xml"  # Se _rels/.rels non indica un'altra parte principale
+DOCX_OFFICE_DOCUMENT = "/officeDocument"  # Fine del tipo della relazione verso la parte principale
+DOCX_BLOCK_SIZE = 65536  # Byte di XML decompressi e analizzati per volta
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+W_BODY = W + "body"
+W_P = W + "p"
+W_R = W + "r"
+W_HYPERLINK = W + "hyperlink"
+W_T = W + "t"
+W_TAB = W + "tab"
+W_PTAB = W + "ptab"
+W_CR = W + "cr"
+W_BR = W + "br"
+W_TYPE = W + "type"
+W_NO_BREAK_HYPHEN = W + "noBreakHyphen"
+text_cache_dir = DEFAULT_TEXT_CACHE_DIR  # None disattiva la cache del testo (vedi configure_text_cache)
+text_cache_size_mb = DEFAULT_TEXT_CACHE_SIZE_MB
+
+# -------------------- FUNZIONI DI LETTURA --------------------
+
+def iter_txt(file_path, newline=None):
+    # Legge un file di testo una pagina alla volta.
+    with open(file_path, 'r', encoding='utf-8', newline=newline) as f:
+        while True:
+            piece = f.read(TXT_BLOCK_SIZE)
+            if not piece:
+                break
+            yield piece
+
+def extract_pdf_pages(file_path, first_page, last_page):
+    # Estrae il testo delle pagine [first_page, last_page) con un proprio handle fitz.
+    import fitz
+    doc = fitz.open(file_path)
+    try:
+        return [doc[page_num].get_text() for page_num in range(first_page, last_page)]
+    finally:
+        doc.close()
+
+def extract_pdf_chunk(chunk):
+    return extract_pdf_pages(*chunk)
+
+def pdf_page_chunks(file_path, page_count, workers):
+    chunk_size = max(1, -(-page_count // (workers * PDF_CHUNKS_PER_WORKER)))
+    return [(file_path, first, min(first + chunk_size, page_count)) for first in range(0, page_count, chunk_size)]
+
+def iter_pdf_page_texts(file_path, workers=None):
+    # Testo di ogni pagina in ordine; con molte pagine l'estrazione è divisa tra più processi.
+    import fitz
+    workers = workers or multiprocessing.cpu_count()
+    doc = fitz.open(file_path)
+    if workers <= 1 or doc.page_count < PARALLEL_PDF_MIN_PAGES:
+        for page in doc:
+            yield page.get_text()
+        doc.close()
+        return
+
+    page_count = doc.page_count
+    doc.close()
+    chunks = pdf_page_chunks(file_path, page_count, workers)
+    with multiprocessing.Pool(processes=min(workers, len(chunks))) as pool:
+        # imap mantiene l'ordine dei blocchi: le pagine escono nell'ordine del documento
+        for page_texts in pool.imap(extract_pdf_chunk, chunks):
+            yield from page_texts
+
+def iter_pdf(file_path, workers=None):
+    # Estrae il testo di un PDF pagina per pagina, separando le pagine con "\n".
+    for page_num, page_text in enumerate(iter_pdf_page_texts(file_path, workers)):
+        yield page_text if page_num == 0 else "\n" + page_text
+
+def docx_main_part(archive):
+    # Nome della parte con il corpo del documento, dalle relazioni del pacchetto.
+    try:
+        relationships = ElementTree.fromstring(archive.read("_rels/.rels"))
+    except (KeyError, ElementTree.ParseError):
+        return DOCX_MAIN_PART
+    for relationship in relationships:
+        if relationship.get("Type", "").endswith(DOCX_OFFICE_DOCUMENT) and relationship.get("Target"):
+            return relationship.get("Target").lstrip("/")
+    return DOCX_MAIN_PART
+
+class DocxTextTarget:
+    # Destinatario del parser XML di word/document.xml: raccoglie il testo dei paragrafi del corpo
+    # (quelli di Document.paragraphs) senza costruire l'albero degli elementi. Segue le regole di
+    # Paragraph.text di python-docx: contano solo i w:r figli del paragrafo o di un w:hyperlink e,
+    # dentro ogni run, w:t, tabulazioni ("\t"), a capo ("\n") e trattini non divisibili; le
+    # interruzioni di pagina e di colonna non producono testo.
+
+    def __init__(self):
+        self.depth = 0  # w:document = 1, w:body = 2, paragrafi del corpo = 3
+        self.in_body = False
+        self.parts = None  # Pezzi del paragrafo del corpo in corso, None fuori dai paragrafi
+        self.in_hyperlink = False
+        self.run_depth = None  # Profondità del w:r in corso, se il suo testo conta
+        self.in_text = False
+        self.paragraphs = []  # Paragrafi completati e non ancora restituiti
+
+    def start(self, tag, attrib):
+        self.depth += 1
+        depth = self.depth
+        if self.parts is None:
+            if depth == 2:
+                self.in_body = tag == W_BODY
+            elif depth == 3 and self.in_body and tag == W_P:
+                self.parts = []
+        elif self.run_depth is None:
+            if tag == W_R and (depth == 4 or (depth == 5 and self.in_hyperlink)):
+                self.run_depth = depth
+            elif depth == 4 and tag == W_HYPERLINK:
+                self.in_hyperlink = True
+        elif depth == self.run_depth + 1:
+            if tag == W_T:
+                self.in_text = True
+            elif tag == W_TAB or tag == W_PTAB:
+                self.parts.append("\t")
+            elif tag == W_CR:
+                self.parts.append("\n")
+            elif tag == W_BR:
+                if attrib.get(W_TYPE, "textWrapping") == "textWrapping":
+                    self.parts.append("\n")
+            elif tag == W_NO_BREAK_HYPHEN:
+                self.parts.append("-")
+
+    def data(self, text):
+        if self.in_text:
+            self.parts.append(text)
+
+    def end(self, tag):
+        depth = self.depth
+        self.depth -= 1
+        if self.parts is None:
+            return
+        if depth == 3:
+            self.paragraphs.append("".join(self.parts))
+            self.parts = None
+        elif self.run_depth is not None:
+            if depth == self.run_depth:
+                self.run_depth = None
+            elif depth == self.run_depth + 1:
+                self.in_text = False
+        elif depth == 4 and tag == W_HYPERLINK:
+            self.in_hyperlink = False
+
+    def close(self):
+        return None
+
+def iter_docx_paragraphs(file_path):
+    # Testo dei paragrafi del corpo, letto in streaming dall'archivio: in memoria restano solo
+    # il blocco di XML in lettura e i paragrafi che contiene.
+    target = DocxTextTarget()
+    parser = ElementTree.XMLParser(target=target)
+    with zipfile.ZipFile(file_path) as archive, archive.open(docx_main_part(archive)) as document:
+        while True:
+            block = document.read(DOCX_BLOCK_SIZE)
+            if not block:
+                break
+            parser.feed(block)
+            yield from target.paragraphs
+            target.paragraphs.clear()
+    parser.close()
+    yield from target.paragraphs
+
+def iter_docx(file_path):
+    # Restituisce i paragrafi di un file Word (.docx) separati da "\n".
+    for para_num, text in enumerate(iter_docx_paragraphs(file_path)):
+        yield text if para_num == 0 else "\n" + text
+
+def extract_book_pieces(file_path, pdf_workers=None):
+    # Estrae il testo dal file originale a pezzi, senza passare dalla cache.
+    # pdf_workers: processi per l'estrazione di un PDF (default: uno per CPU).
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".txt":
+        return iter_txt(file_path)
+    elif ext == ".pdf":
+        return iter_pdf(file_path, pdf_workers)
+    elif ext == ".docx":
+        return iter_docx(file_path)
+    else:
+        print("Errore: formato file non supportato.")
+        sys.exit(4)
+
+def read_txt(file_path):
+    # Legge un file di testo e lo divide in pagine.
+    with open(file_path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    return text
+
+def read_pdf(file_path, workers=None):
+    # Legge un file PDF ed estrae il testo.
+    return "\n".join(iter_pdf_page_texts(file_path, workers))
+
+def read_docx(file_path):
+    # Legge un file Word (.docx) ed estrae il testo.
+    return "".join(iter_docx(file_path))
+
+def extract_book(file_path):
+    # Estrae tutto il testo dal file originale, senza passare dalla cache.
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".txt":
+        return read_txt(file_path)
+    elif ext == ".pdf":
+        return read_pdf(file_path)
+    elif ext == ".docx":
+        return read_docx(file_path)
+    else:
+        print("Errore: formato file non supportato.")
+        sys.exit(4)
+
+# -------------------- CACHE DEL TESTO ESTRATTO --------------------
+#
+# Il testo estratto da un PDF o da un DOCX viene salvato in {cache}/xx/{chiave}.{versione}.txt
+# (UTF-8) insieme a {chiave}.json: percorso, dimensione, mtime e sha256 del file originale, nome
+# del file di testo, più la posizione in byte dell'inizio di ogni pagina di PAGE_SIZE caratteri.
+# La versione (dimensione e mtime del file originale) dà a ogni nuova estrazione un file diverso:
+# non si sostituisce mai un testo che la GUI può avere aperto. Per un file .txt il testo
+# è già su disco: la voce contiene solo il .json, con le posizioni delle pagine nel file
+# originale. La GUI e analysis.py condividono la cache: un libro già aperto non viene più
+# estratto, e una pagina o un intervallo si leggono con un seek senza decodificare il resto del
+# testo. Oltre text_cache_size_mb si eliminano le voci usate meno di recente.
+
+def configure_text_cache(cache_dir, size_mb=DEFAULT_TEXT_CACHE_SIZE_MB):
+    # Imposta la cartella e la dimensione massima della cache del testo; None la disattiva.
+    global text_cache_dir, text_cache_size_mb
+    text_cache_dir = os.path.abspath(cache_dir) if cache_dir else None
+    text_cache_size_mb = size_mb
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def text_cache_paths(file_path, stat):
+    # File del testo per questa versione del file originale e file dei metadati della voce.
+    key = hashlib.sha256(os.path.abspath(file_path).encode("utf-8")).hexdigest()
+    base = os.path.join(text_cache_dir, key[:2], key)
+    return f"{base}.{stat.st_size}-{stat.st_mtime_ns}.txt", f"{base}.json"
+
+def translate_newlines(text):
+    # "\r\n" e "\r" diventano "\n", come nella lettura di un file di testo con open.
+    return text.replace("\r\n", "\n").replace("\r", "\n") if "\r" in text else text
+
+def cached_text_newline(meta):
+    # Argomento newline di open per rileggere il testo di una voce della cache.
+    return None if meta["newlines"] else ""
+
+class PageIndexBuilder:
+    # Calcola, mentre il testo viene scritto, il byte di inizio di ogni pagina di PAGE_SIZE caratteri.
+
+    def __init__(self):
+        self.offsets = [0]  # offsets[n] è il primo byte della pagina n; l'ultimo valore è la dimensione del testo
+        self.chars = 0
+        self.bytes = 0
+        self.newlines = False  # Il testo indicizzato contiene "\r" da convertire in lettura (vedi add_raw)
+
+    def add(self, piece):
+        position = 0
+        while position < len(piece):
+            part = piece[position:position + PAGE_SIZE - self.chars % PAGE_SIZE]
+            position += len(part)
+            self.chars += len(part)
+            self.bytes += len(part.encode("utf-8"))
+            if self.chars % PAGE_SIZE == 0:
+                self.offsets.append(self.bytes)
+
+    def add_raw(self, raw):
+        # Come add, per un pezzo di un file di testo letto senza convertire gli a capo: le pagine si
+        # contano sul testo convertito, dove "\r\n" è un solo carattere, e non dividono mai "\r\n".
+        self.newlines = self.newlines or "\r" in raw
+        position = 0
+        while position < len(raw):
+            needed = PAGE_SIZE - self.chars % PAGE_SIZE
+            end = min(position + needed, len(raw))
+            while True:
+                if end < len(raw) and raw[end - 1] == "\r" and raw[end] == "\n":
+                    end += 1
+                length = end - position - raw.count("\r\n", position, end)
+                if length >= needed or end >= len(raw):
+                    break
+                end = min(end + needed - length, len(raw))
+            self.chars += length
+            self.bytes += len(raw[position:end].encode("utf-8"))
+            position = end
+            if self.chars % PAGE_SIZE == 0:
+                self.offsets.append(self.bytes)
+
+    def finish(self):
+        if self.chars % PAGE_SIZE or not self.chars:
+            self.offsets.append(self.bytes)  # Fine dell'ultima pagina, incompleta
+        return self.offsets
+
+def write_json_atomic(path, data):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+def lookup_text_cache(file_path):
+    # Voce valida della cache per il file (percorso del testo, metadati), o None.
+    # Per un file .txt il percorso del testo è quello del file originale.
+    if not text_cache_dir:
+        return None
+    try:
+        stat = os.stat(file_path)
+        _, meta_path = text_cache_paths(file_path, stat)
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        text_path = os.path.join(os.path.dirname(meta_path), meta["text"]) if meta.get("text") else file_path
+        text_bytes = os.path.getsize(text_path)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != TEXT_CACHE_VERSION or meta.get("page_size") != PAGE_SIZE or text_bytes != meta["offsets"][-1]:
+        return None
+    if (meta["size"], meta["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+        # File toccato (copiato, salvato di nuovo): se il contenuto è identico la voce resta valida
+        if meta["size"] != stat.st_size or meta["sha256"] != file_sha256(file_path):
+            return None
+        meta["mtime_ns"] = stat.st_mtime_ns
+        write_json_atomic(meta_path, meta)
+    else:
+        try:
+            os.utime(meta_path)  # Segna l'ultimo utilizzo per l'eliminazione LRU
+        except OSError:
+            pass
+    return text_path, meta
+
+def iter_indexed_txt(file_path, index):
+    # Come iter_txt, ma registra in index la posizione in byte delle pagine nel file originale.
+    with open(file_path, 'r', encoding='utf-8', newline="") as f:
+        pending = ""
+        for block in iter(lambda: f.read(TXT_BLOCK_SIZE), ""):
+            raw = pending + block
+            # Un "\r" finale può essere seguito da "\n" nel blocco successivo
+            pending = "\r" if raw.endswith("\r") else ""
+            raw = raw[:len(raw) - len(pending)]
+            if raw:
+                index.add_raw(raw)
+                yield translate_newlines(raw)
+        if pending:
+            index.add_raw(pending)
+            yield "\n"
+
+def iter_cached_book(file_path, stat, pdf_workers=None):
+    # Estrae il testo a pezzi e intanto lo scrive nella cache; la voce diventa valida solo a fine lettura.
+    # stat è preso prima dell'estrazione: se il file cambia nel frattempo, la voce non corrisponderà.
+    text_path, meta_path = text_cache_paths(file_path, stat)
+    os.makedirs(os.path.dirname(text_path), exist_ok=True)
+    index = PageIndexBuilder()
+    if os.path.splitext(file_path)[1].lower() == ".txt":
+        # Il testo è già su disco: si salva solo l'indice delle pagine nel file originale
+        yield from iter_indexed_txt(file_path, index)
+        text_name = None
+    else:
+        # Un file temporaneo per thread: la GUI estrae in background mentre analysis.py può fare lo stesso
+        temp_path = f"{text_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        completed = False
+        try:
+            with open(temp_path, "w", encoding="utf-8", newline="") as f:
+                for piece in extract_book_pieces(file_path, pdf_workers):
+                    f.write(piece)
+                    index.add(piece)
+                    yield piece
+            completed = True
+        finally:
+            if not completed:
+                # Lettura interrotta: nessuna voce parziale
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        try:
+            os.replace(temp_path, text_path)
+        except OSError:
+            # Stessa versione già estratta da un altro processo e aperta (su Windows non si può
+            # sostituire): si tiene quella, che ha lo stesso testo
+            os.remove(temp_path)
+            if not os.path.exists(text_path):
+                return
+        text_name = os.path.basename(text_path)
+    previous_text = previous_text_path(meta_path)
+    write_json_atomic(meta_path, {"version": TEXT_CACHE_VERSION, "path": os.path.abspath(file_path),
+                                  "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_sha256(file_path),
+                                  "page_size": PAGE_SIZE, "chars": index.chars, "offsets": index.finish(),
+                                  "text": text_name, "newlines": index.newlines})
+    if previous_text and previous_text != text_path:
+        try:
+            os.remove(previous_text)
+        except OSError:
+            pass  # Aperto dalla GUI: resta fino alla prossima pulizia della cache
+    evict_text_cache(text_cache_size_mb, keep=os.path.basename(meta_path).split(".")[0])
+
+def previous_text_path(meta_path):
+    # File del testo indicato dalla voce esistente, se c'è.
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            text_name = json.load(f).get("text")
+    except (OSError, ValueError):
+        return None
+    return os.path.join(os.path.dirname(meta_path), text_name) if text_name else None
+
+def evict_text_cache(max_size_mb, keep=None):
+    # Elimina le voci usate meno di recente finché la cache non rientra nel limite; keep è la
+    # chiave della voce appena scritta, che resta anche se da sola supera il limite.
+    entries = {}  # Chiave -> [ultimo utilizzo, dimensione, file]
+    for folder, _, files in os.walk(text_cache_dir):
+        for name in files:
+            if name.endswith(".tmp"):
+                continue  # Estrazione in corso
+            path = os.path.join(folder, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue  # Eliminata nel frattempo da un altro processo che condivide la cache
+            entry = entries.setdefault(name.split(".")[0], [0, 0, []])
+            entry[0] = max(entry[0], stat.st_mtime)
+            entry[1] += stat.st_size
+            entry[2].append(path)
+
+    total_size = sum(size for _, size, _ in entries.values())
+    max_size = max_size_mb * 1024 * 1024
+    removed = 0
+    for key, (_, size, paths) in sorted(entries.items(), key=lambda item: item[1][0]):
+        if total_size <= max_size:
+            break
+        if key == keep:
+            continue
+        # Prima il .json, così la voce non è più valida anche se il testo non si può eliminare
+        for path in sorted(paths, key=lambda path: not path.endswith(".json")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Già eliminato, o aperto da un altro processo: resta fino alla prossima pulizia
+        total_size -= size
+        removed += 1
+    return removed
+
+def check_supported(file_path):
+    if os.path.splitext(file_path)[1].lower() not in (".txt", ".pdf", ".docx"):
+        print("Errore: formato file non supportato.")
+        sys.exit(4)
+
+def iter_book(file_path, pdf_workers=None):
+    # Versione incrementale di read_book: concatenando i pezzi si ottiene lo stesso testo.
+    check_supported(file_path)
+    cached = lookup_text_cache(file_path)
+    if cached:
+        return iter_txt(cached[0], newline=cached_text_newline(cached[1]))
+    if text_cache_dir:
+        return iter_cached_book(file_path, os.stat(file_path), pdf_workers)
+    return extract_book_pieces(file_path, pdf_workers)
+
+def read_book(file_path):
+    # Testo completo del libro, dalla cache se il file non è cambiato.
+    check_supported(file_path)
+    cached = lookup_text_cache(file_path)
+    if cached:
+        with open(cached[0], "r", encoding="utf-8", newline=cached_text_newline(cached[1])) as f:
+            return f.read()
+    if text_cache_dir:
+        return "".join(iter_cached_book(file_path, os.stat(file_path)))
+    return extract_book(file_path)
+
+def read_cached_slice(text_path, meta, start, end):
+    # Caratteri [start, end) del testo in cache: si decodificano solo le pagine coinvolte.
+    end = min(end, meta["chars"])
+    if end <= start:
+        return ""
+    offsets = meta["offsets"]
+    first_page, last_page = start // PAGE_SIZE, (end - 1) // PAGE_SIZE
+    with open(text_path, "rb") as f:
+        f.seek(offsets[first_page])
+        data = f.read(offsets[last_page + 1] - offsets[first_page])
+    skip = first_page * PAGE_SIZE
+    text = data.decode("utf-8")
+    if meta["newlines"]:
+        text = translate_newlines(text)
+    return text[start - skip:end - skip]
+
+class PagedText:
+    # Pagine del testo in cache, lette da un file mappato in memoria: ogni pagina si decodifica
+    # solo quando viene richiesta e la memoria usata non dipende dalla dimensione del libro.
+    # Si usa come una lista di stringhe (len e indice), al posto del testo diviso in pagine.
+    # Per un file .txt le pagine si rileggono dal file originale con un seek, senza tenerlo
+    # aperto: il file resta libero di essere modificato o sostituito mentre la GUI lo mostra.
+
+    def __init__(self, text_path, meta):
+        self.text_path = text_path
+        self.offsets = meta["offsets"]
+        self.pages = len(self.offsets) - 1 if meta["chars"] else 0
+        self.newlines = meta["newlines"]
+        self.file = None
+        self.data = None
+        if meta["text"]:
+            self.file = open(text_path, "rb")
+            # mmap non accetta file vuoti
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets[-1] else b""
+        self.decoded = collections.OrderedDict()  # Pagina -> testo, dalla meno alla più recente
+
+    def __len__(self):
+        return self.pages
+
+    def __getitem__(self, page):
+        if not 0 <= page < self.pages:
+            raise IndexError(page)
+        text = self.decoded.get(page)
+        if text is None:
+            text = self.page_bytes(page).decode("utf-8")
+            if self.newlines:
+                text = translate_newlines(text)
+            self.decoded[page] = text
+            if len(self.decoded) > PAGE_CACHE_SIZE:
+                self.decoded.popitem(last=False)
+        else:
+            self.decoded.move_to_end(page)
+        return text
+
+    def page_bytes(self, page):
+        start, end = self.offsets[page], self.offsets[page + 1]
+        if self.data is not None:
+            return self.data[start:end]
+        with open(self.text_path, "rb") as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    def prefetch(self, page, before=1, after=2):
+        # Decodifica le pagine vicine, così il cambio pagina non attende il disco.
+        for neighbour in range(max(page - before, 0), min(page + after + 1, self.pages)):
+            self[neighbour]
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        if self.file:
+            self.file.close()
+
+def read_ranges(file_path, ranges):
+    # Rilegge dal file solo gli intervalli [inizio, fine) richiesti, senza tenere in memoria tutto il testo.
+    cached = lookup_text_cache(file_path)
+    if cached:
+        return {key: read_cached_slice(*cached, start, end) for key, (start, end) in ranges.items()}
+    texts = {key: [] for key in ranges}
+    position = 0
+    for piece in iter_book(file_path):
+        piece_end = position + len(piece)
+        for key, (start, end) in ranges.items():
+            if start < piece_end and end > position:
+                texts[key].append(piece[max(start - position, 0):end - position])
+        position = piece_end
+    return {key: "".join(parts) for key, parts in texts.items()}
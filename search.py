@@ -0,0 +1,195 @@
+import sys
+import os
+import argparse
+import csv
+import time
+import numpy as np
+from embedding_store import STATUS_COMPLETED, read_store_index, store_paths
+
+# Ricerca semantica sui capitoli analizzati, condivisa dalla riga di comando e da gui.py.
+#
+# Tutti gli embedding completati sotto analyses/ stanno in un'unica matrice float32 con righe
+# di norma 1: la similarità del coseno con una query è un solo prodotto matrice-vettore.
+# La matrice si aggiorna in modo incrementale: di ogni libro si rilegge l'archivio solo
+# quando il suo indice cambia su disco.
+
+DEFAULT_ANALYSES_DIR = "analyses"
+DEFAULT_TOP_K = 10
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def file_version(path):
+    # L'indice viene sostituito a ogni scrittura (os.replace): inode e mtime ne identificano la versione.
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+def read_book_embeddings(output_dir, book_name):
+    # Capitoli completati di un libro e relativi embedding normalizzati, più l'indice dell'archivio.
+    index = read_store_index(output_dir, book_name)
+    if not index or not index.get("dim"):
+        return index, [], np.zeros((0, 0), dtype=np.float32)
+    completed = sorted(((entry["row"], chapter) for chapter, entry in index["chapters"].items()
+                        if entry["status"] == STATUS_COMPLETED and entry.get("row") is not None))
+    if not completed:
+        return index, [], np.zeros((0, index["dim"]), dtype=np.float32)
+    data_path, _ = store_paths(output_dir, book_name)
+    rows = np.memmap(data_path, dtype=np.dtype(index["dtype"]), mode="r", shape=(index["rows"], index["dim"]))
+    matrix = np.asarray(rows[[row for row, _ in completed]], dtype=np.float32)
+    return index, [chapter for _, chapter in completed], normalize_rows(matrix)
+
+class ChapterSearchIndex:
+    # Matrice degli embedding di tutti i libri analizzati, con (libro, capitolo) per ogni riga.
+
+    def __init__(self, analyses_dir=DEFAULT_ANALYSES_DIR):
+        self.analyses_dir = analyses_dir
+        self.books = {}  # Libro -> (versione dell'indice, indice, capitoli, matrice)
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.labels = []  # (libro, capitolo) della riga corrispondente di matrix
+        self.positions = {}  # (libro, capitolo) -> riga di matrix
+        self.model = None
+
+    def refresh(self):
+        # Rilegge solo i libri nuovi o modificati; restituisce il numero di libri ricaricati.
+        try:
+            book_names = sorted(entry.name for entry in os.scandir(self.analyses_dir) if entry.is_dir())
+        except OSError:
+            book_names = []
+        changed = 0
+        for book_name in book_names:
+            output_dir = os.path.join(self.analyses_dir, book_name)
+            version = file_version(store_paths(output_dir, book_name)[1])
+            cached = self.books.get(book_name)
+            if version is None or (cached and cached[0] == version):
+                continue
+            index, chapters, matrix = read_book_embeddings(output_dir, book_name)
+            self.books[book_name] = (version, index, chapters, matrix)
+            changed += 1
+        removed = set(self.books) - set(book_names)
+        for book_name in removed:
+            del self.books[book_name]
+        if changed or removed:
+            self.rebuild()
+        return changed
+
+    def rebuild(self):
+        # Vettori di modelli diversi non sono confrontabili: si tiene il modello più diffuso.
+        models = [book[1]["model"] for book in self.books.values() if book[2]]
+        self.model = max(set(models), key=models.count) if models else None
+        blocks, self.labels = [], []
+        for book_name, (_, index, chapters, matrix) in sorted(self.books.items()):
+            if chapters and index["model"] == self.model:
+                blocks.append(matrix)
+                self.labels += [(book_name, chapter) for chapter in chapters]
+        self.matrix = np.ascontiguousarray(np.vstack(blocks)) if blocks else np.zeros((0, 0), dtype=np.float32)
+        self.positions = {label: row for row, label in enumerate(self.labels)}
+
+    def source(self, book_name):
+        # Percorso del file originale del libro, se registrato nell'archivio.
+        book = self.books.get(book_name)
+        return book[1].get("source") if book else None
+
+    def search(self, vector, k=DEFAULT_TOP_K, exclude=None):
+        # I k capitoli più simili al vettore, come lista di (punteggio, libro, capitolo).
+        if not self.labels:
+            return []
+        query = np.asarray(vector, dtype=np.float32).reshape(-1)
+        if query.shape[0] != self.matrix.shape[1]:
+            raise ValueError(f"Dimensione della query {query.shape[0]} diversa da quella degli embedding ({self.matrix.shape[1]})")
+        scores = self.matrix @ (query / (np.linalg.norm(query) or 1.0))
+        if exclude in self.positions:
+            scores[self.positions[exclude]] = -np.inf
+        k = min(k, len(scores) - (exclude in self.positions))
+        if k <= 0:
+            return []
+        # argpartition seleziona i k migliori in tempo lineare; si ordinano solo quelli
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[row]), *self.labels[row]) for row in top]
+
+    def similar_to(self, book_name, chapter, k=DEFAULT_TOP_K):
+        # Capitoli più simili a un capitolo già analizzato (escluso il capitolo stesso).
+        label = (book_name, str(chapter))
+        if label not in self.positions:
+            return None
+        return self.search(self.matrix[self.positions[label]], k, exclude=label)
+
+    def search_text(self, text, k=DEFAULT_TOP_K, mode="chunked"):
+        # Ricerca con testo libero: la query viene codificata con lo stesso modello dei capitoli.
+        return self.search(embed_query(text, mode), k)
+
+def embed_query(text, mode="chunked"):
+    # Importa analysis (e quindi torch) solo per le ricerche con testo libero.
+    import analysis
+    analysis.load_model()
+    embeddings, _ = analysis.analyze_text_with_bert(text, mode)
+    return embeddings
+
+def read_summary(analyses_dir, book_name):
+    # Pagine e titoli dei capitoli dal riepilogo CSV del libro, come {capitolo: (pagine, titolo)}.
+    summary_file = os.path.join(analyses_dir, book_name, f"{book_name}-analysis.csv")
+    summary = {}
+    try:
+        with open(summary_file, "r", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                if len(row) >= 2:
+                    summary[row[0]] = (row[1], row[2] if len(row) >= 3 else "")
+    except OSError:
+        pass
+    return summary
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Ricerca semantica nei capitoli analizzati")
+    parser.add_argument("query", nargs="?", help="testo libero da cercare")
+    parser.add_argument("--similar", nargs=2, metavar=("LIBRO", "CAPITOLO"), help="capitoli simili a un capitolo già analizzato")
+    parser.add_argument("-k", "--top", type=int, default=DEFAULT_TOP_K, help="numero di risultati (default: %(default)s)")
+    parser.add_argument("--analyses-dir", default=DEFAULT_ANALYSES_DIR, help="cartella delle analisi (default: %(default)s)")
+    parser.add_argument("--embedding", choices=("chunked", "truncate"), default="chunked",
+                        help="modalità di embedding della query testuale (default: %(default)s)")
+    args = parser.parse_args(argv)
+    if bool(args.query) == bool(args.similar):
+        parser.error("specificare un testo da cercare oppure --similar LIBRO CAPITOLO")
+    if args.top < 1:
+        parser.error("-k deve essere almeno 1")
+    return args
+
+def main():
+    args = parse_arguments(sys.argv[1:])
+    index = ChapterSearchIndex(args.analyses_dir)
+    start_time = time.perf_counter()
+    index.refresh()
+    print(f"{len(index.labels)} capitoli di {len(index.books)} libri caricati in {time.perf_counter() - start_time:.2f} s")
+    if not index.labels:
+        print("Errore: nessun capitolo analizzato.")
+        sys.exit(2)
+
+    if args.similar:
+        book_name, chapter = args.similar
+        start_time = time.perf_counter()
+        results = index.similar_to(book_name, chapter, args.top)
+        if results is None:
+            print(f"Errore: capitolo {chapter} di {book_name} non analizzato.")
+            sys.exit(2)
+    else:
+        query_vector = embed_query(args.query, args.embedding)
+        start_time = time.perf_counter()
+        results = index.search(query_vector, args.top)
+    elapsed = time.perf_counter() - start_time
+
+    summaries = {}
+    for rank, (score, book_name, chapter) in enumerate(results, start=1):
+        summary = summaries.setdefault(book_name, read_summary(args.analyses_dir, book_name))
+        pages, title = summary.get(chapter, ("?", ""))
+        title = f"  {title}" if title and title != f"Capitolo {chapter}" else ""
+        print(f"{rank:>3}. {score:.4f}  {book_name}  Capitolo {chapter}  (pagine {pages}){title}")
+    print(f"Ricerca in {elapsed * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()